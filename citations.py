@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+"""
+Citatie-index: welke dichters en filosofen worden in een preek genoemd.
+Alle namen uit CITATION_AUTHORS worden in één Aho-Corasick automaat gezet, zodat
+elke preek in één lineaire scan op alle namen tegelijk doorzocht wordt. De telling
+per preek (corpus en output, zie search_index.py) staat in cache/citations.json en
+wordt alleen voor nieuwe of gewijzigde bestanden opnieuw gemaakt. Uit de
+corpuspreken volgt een citatieprofiel waar de scorer een nieuwe preek zonder
+LLM-call tegen legt.
+
+Gebruik:
+    python citations.py authors [--kind output]
+    python citations.py profile
+    python citations.py compare preek.txt
+    python citations.py index [--rebuild]
+"""
+import argparse
+import hashlib
+import json
+import os
+from collections import Counter, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import CITATION_AUTHORS
+from corpus import load_corpus, write_atomic
+from search_index import document_stamp, read_document, source_documents, tokenize_with_offsets
+
+BASE_DIR = Path(__file__).parent
+CITATION_INDEX_FILE = BASE_DIR / "cache" / "citations.json"
+
+# Verhoog bij een wijziging in de telling: de index wordt dan opnieuw opgebouwd
+CITATION_FORMAT_VERSION = 1
+
+# Feedback als een preek meer dan deze factor boven het hoogste corpus-tempo citeert
+CITATION_EXCESS_FACTOR = 1.5
+
+# Feedback over een ontbrekend citaat alleen als minstens deze fractie van de corpuspreken
+# citeert; bij een kleinere fractie is een preek zonder citaat gewoon corpusgedrag
+CITATION_EXPECTED_SHARE = 0.8
+
+
+class AhoCorasick:
+    """Automaat die alle patronen in één doorgang over een tekst vindt."""
+
+    def __init__(self, patterns: dict[str, str]):
+        """`patterns`: zoekstring -> label (bijv. alias -> auteur)."""
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[list[tuple[int, str]]] = [[]]
+
+        for pattern, label in patterns.items():
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append((len(pattern), label))
+
+        # Breedte-eerst de fail-links zetten; outputs van de fail-state erven mee
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def finditer(self, text: str) -> Iterator[tuple[int, int, str]]:
+        """Alle (ook overlappende) treffers als (start, eind, label)."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, label in self.output[state]:
+                yield i + 1 - length, i + 1, label
+
+
+@dataclass
+class CitationProfile:
+    """Citatiegedrag van het referentiecorpus."""
+    sermons: int
+    share_citing: float               # Fractie preken met minstens één citaat
+    mean_distinct: float              # Gemiddeld aantal verschillende auteurs per preek
+    rate_per_1000: float              # Citaten per 1000 woorden over het hele corpus
+    max_rate_per_1000: float          # Hoogste tempo in één preek
+    authors: dict[str, float]         # Auteur -> fractie preken die hem noemt
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+_automaton: Optional[AhoCorasick] = None
+
+
+def get_automaton() -> AhoCorasick:
+    """De automaat over alle aliassen uit CITATION_AUTHORS (één keer per proces gebouwd)."""
+    global _automaton
+    if _automaton is None:
+        _automaton = AhoCorasick({
+            alias: author for author, aliases in CITATION_AUTHORS.items() for alias in aliases
+        })
+    return _automaton
+
+
+def count_citations(text: str) -> Counter:
+    """
+    Tel per auteur hoe vaak hij genoemd wordt. Namen matchen hoofdlettergevoelig en
+    op woordgrenzen (een genitief-s mag); bij overlap ("Paul Gerhardt" / "Gerhardt")
+    telt de langste treffer één keer.
+    """
+    matches = []
+    for start, end, author in get_automaton().finditer(text):
+        if start > 0 and _is_word_char(text[start - 1]):
+            continue
+        if end < len(text) and _is_word_char(text[end]):
+            if not (text[end] == "s" and (end + 1 == len(text) or not _is_word_char(text[end + 1]))):
+                continue
+        matches.append((start, end, author))
+
+    counts: Counter = Counter()
+    covered_until = -1
+    for start, end, author in sorted(matches, key=lambda m: (m[0], m[0] - m[1])):
+        if start >= covered_until:
+            counts[author] += 1
+            covered_until = end
+    return counts
+
+
+def _authors_fingerprint() -> str:
+    data = json.dumps([CITATION_FORMAT_VERSION, CITATION_AUTHORS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def update_citation_index(rebuild: bool = False) -> dict:
+    """
+    Werk de citatie-index bij en geef hem terug: {pad: {kind, title, stamp, words, counts}}.
+    Een gewijzigde auteurslijst maakt de hele index ongeldig.
+    """
+    index = {"fingerprint": None, "documents": {}}
+    if CITATION_INDEX_FILE.exists() and not rebuild:
+        with open(CITATION_INDEX_FILE, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    if index.get("fingerprint") != _authors_fingerprint():
+        index = {"fingerprint": _authors_fingerprint(), "documents": {}}
+
+    documents = index["documents"]
+    changed = False
+    current = source_documents()
+    for rel_path, (kind, path) in sorted(current.items()):
+        stamp = document_stamp(path)
+        if documents.get(rel_path, {}).get("stamp") == stamp:
+            continue
+        title, text = read_document(kind, path)
+        documents[rel_path] = {
+            "kind": kind,
+            "title": title,
+            "stamp": stamp,
+            "words": len(tokenize_with_offsets(text)),
+            "counts": dict(count_citations(text)),
+        }
+        changed = True
+    for rel_path in set(documents) - set(current):
+        del documents[rel_path]
+        changed = True
+
+    if changed:
+        os.makedirs(CITATION_INDEX_FILE.parent, exist_ok=True)
+        write_atomic(CITATION_INDEX_FILE, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+    return documents
+
+
+def corpus_citation_documents() -> dict:
+    """
+    Citatietellingen van alleen de corpuspreken, in het geheugen (uit de corpus-cache).
+    Voor het scoring-pad: geen scan van de output en geen schrijfacties.
+    """
+    corpus = load_corpus()
+    documents = {}
+    for k, entry in enumerate(corpus.entries):
+        text = corpus.text(k)
+        documents[entry.source] = {
+            "kind": "corpus",
+            "title": entry.schriftgedeelte,
+            "words": len(tokenize_with_offsets(text)),
+            "counts": dict(count_citations(text)),
+        }
+    return documents
+
+
+def build_profile(documents: dict) -> CitationProfile:
+    """Citatieprofiel over de corpuspreken uit de index."""
+    corpus = [doc for doc in documents.values() if doc["kind"] == "corpus" and doc["words"]]
+    if not corpus:
+        return CitationProfile(0, 0.0, 0.0, 0.0, 0.0, {})
+    total_citations = sum(sum(doc["counts"].values()) for doc in corpus)
+    total_words = sum(doc["words"] for doc in corpus)
+    mentioned = Counter(author for doc in corpus for author in doc["counts"])
+    return CitationProfile(
+        sermons=len(corpus),
+        share_citing=sum(1 for doc in corpus if doc["counts"]) / len(corpus),
+        mean_distinct=sum(len(doc["counts"]) for doc in corpus) / len(corpus),
+        rate_per_1000=total_citations / total_words * 1000,
+        max_rate_per_1000=max(sum(doc["counts"].values()) / doc["words"] * 1000 for doc in corpus),
+        authors={author: count / len(corpus) for author, count in mentioned.most_common()},
+    )
+
+
+_profile: Optional[CitationProfile] = None
+
+
+def get_citation_profile() -> CitationProfile:
+    """Het corpusprofiel (één keer per proces berekend)."""
+    global _profile
+    if _profile is None:
+        _profile = build_profile(corpus_citation_documents())
+    return _profile
+
+
+def citation_feedback(text: str, profile: Optional[CitationProfile] = None) -> str:
+    """
+    Vergelijk de citaten in `text` met het corpusprofiel.
+    Returns: feedback-tekst, of "" als de preek binnen het corpusgedrag valt.
+    """
+    profile = profile or get_citation_profile()
+    if not profile.sermons:
+        return ""
+    counts = count_citations(text)
+    words = len(tokenize_with_offsets(text))
+
+    if not counts and profile.share_citing >= CITATION_EXPECTED_SHARE:
+        examples = ", ".join(list(profile.authors)[:3])
+        return (f"De preek noemt geen dichter of filosoof; in {profile.share_citing:.0%} van de "
+                f"Jüngel-preken gebeurt dat wel (bijv. {examples}).")
+
+    rate = sum(counts.values()) / words * 1000 if words else 0.0
+    if rate > profile.max_rate_per_1000 * CITATION_EXCESS_FACTOR:
+        names = ", ".join(f"{author} ({n}x)" for author, n in counts.most_common(3))
+        return (f"De preek strooit met namen: {rate:.1f} citaten per 1000 woorden ({names}), "
+                f"tegen hooguit {profile.max_rate_per_1000:.1f} in het corpus. Eén goed gekozen stem volstaat.")
+    return ""
+
+
+def print_authors(documents: dict, kind: Optional[str]):
+    totals: Counter = Counter()
+    sermons: Counter = Counter()
+    for doc in documents.values():
+        if kind and doc["kind"] != kind:
+            continue
+        totals.update(doc["counts"])
+        sermons.update(doc["counts"].keys())
+    if not totals:
+        print("Geen citaten gevonden")
+        return
+    for author, total in totals.most_common():
+        print(f"  {author:<18} {total:>4}x in {sermons[author]:>3} preken")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Citatie-index over corpus en gegenereerde preken")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    authors_parser = subparsers.add_parser("authors", help="Geciteerde auteurs met aantallen")
+    authors_parser.add_argument("--kind", choices=["corpus", "output"])
+    subparsers.add_parser("profile", help="Citatieprofiel van het corpus")
+    compare_parser = subparsers.add_parser("compare", help="Leg een preek naast het corpusprofiel")
+    compare_parser.add_argument("path", type=Path)
+    index_parser = subparsers.add_parser("index", help="Werk de index bij")
+    index_parser.add_argument("--rebuild", action="store_true")
+    args = parser.parse_args()
+
+    documents = update_citation_index(rebuild=getattr(args, "rebuild", False))
+
+    if args.command == "index":
+        cited = sum(1 for doc in documents.values() if doc["counts"])
+        print(f"{len(documents)} preken geïndexeerd, {cited} met citaten ({CITATION_INDEX_FILE})")
+
+    elif args.command == "authors":
+        print_authors(documents, args.kind)
+
+    elif args.command == "profile":
+        profile = build_profile(documents)
+        print(f"Corpus: {profile.sermons} preken")
+        print(f"  Met minstens één citaat: {profile.share_citing:.0%}")
+        print(f"  Verschillende auteurs per preek: {profile.mean_distinct:.2f}")
+        print(f"  Citaten per 1000 woorden: {profile.rate_per_1000:.2f} (max {profile.max_rate_per_1000:.2f})")
+        for author, share in profile.authors.items():
+            print(f"  {author:<18} in {share:.0%} van de preken")
+
+    elif args.command == "compare":
+        _, text = read_document("output", args.path)
+        counts = count_citations(text)
+        print("Citaten: " + (", ".join(f"{a} ({n}x)" for a, n in counts.most_common()) or "geen"))
+        print(citation_feedback(text, build_profile(documents)) or "Citatiegedrag past bij het corpus.")
+
+
+if __name__ == "__main__":
+    main()
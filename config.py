@@ -1,18 +1,20 @@
 """
 Configuratie voor de Jüngel preek-generator.
 """
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
-
-# API configuratie
-ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+# API configuratie: ANTHROPIC_API_KEY komt uit de omgeving of uit .env
+# (pas geladen bij de eerste API-call, zie get_client in llm.py)
 
 # Model configuratie
 GENERATOR_MODEL = "claude-opus-4-5"  # Voor preek-generatie
 SCORER_MODEL = "claude-sonnet-4-5"      # Voor scoring (goedkoper dan Opus voor iteraties)
 FINAL_EVAL_MODEL = "claude-opus-4-5"   # Voor finale evaluatie
+FINAL_EVAL_TOP_K = 2                   # Aantal beste kandidaten dat FINAL_EVAL_MODEL herbeoordeelt (0 = uit)
+PAIRWISE_MODEL = "claude-sonnet-4-5"    # Voor paarsgewijze vergelijkingen (toernooi-selectie)
+
+# Selectie van de winnaar binnen een run: "cascade" (top-k herbeoordeeld door
+# FINAL_EVAL_MODEL) of "pairwise" (Bradley-Terry toernooi over alle kandidaten)
+SELECTION_MODE = "cascade"
 
 # Generator parameters
 GENERATOR_TEMPERATURE = 0.8
@@ -21,15 +23,139 @@ GENERATOR_MAX_TOKENS = 8000
 # Scorer parameters
 SCORER_TEMPERATURE = 0.3
 SCORER_MAX_TOKENS = 2000
+SCORER_PARSE_RETRIES = 2        # Extra judge-calls bij een ongeldige (schema-schendende) response
+SCORER_ENSEMBLE_SIZE = 1        # Aantal gelijktijdige judge-calls per (deel van de) rubric
+SCORER_ENSEMBLE_MODE = "repeat" # "repeat" (volledige rubric) of "split" (per rubric-deel)
+SCORER_AGGREGATION = "median"   # "median" of "trimmed_mean"
+SCORER_STREAMING = True         # Stream de judge-response en breek af bij een diskwalificerende SDT-score
+SCORER_SDT_ABORT_AT = 5         # SDT-score (0-10) waarbij of waaronder de rest van de beoordeling niet meer telt
+PAIRWISE_MAX_TOKENS = 500       # Korte motivatie + keuze per vergelijking
+
+# Gelijktijdige API-calls (gedeeld door alle taken in dit proces)
+MAX_CONCURRENT_CALLS = 8
 
 # Iteratie parameters
 MAX_ITERATIONS = 5
-MAX_SOLUTIONS_IN_FEEDBACK = 3
+FEEDBACK_DIGEST_MAX_POINTS = 10    # Maximaal aantal verbeterpunten uit eerdere pogingen per generatie
+FEEDBACK_DIGEST_POINT_CHARS = 300  # Maximale lengte van één verbeterpunt (afgekapt op een zinseinde)
 SELECTION_PROBABILITY = 0.8
+CANDIDATES_PER_ITERATION = 1  # Aantal preken dat per iteratie gelijktijdig wordt gegenereerd
+EARLY_STOP_PATIENCE = 2  # Stop na zoveel iteraties zonder verbetering buiten de judge-ruis (alleen met ensemble) of met alleen near-duplicates
+
+# Surrogaat-model (lokale voorselectie vóór de betaalde judge, zie surrogate.py)
+SURROGATE_RIDGE_ALPHA = 10.0  # Regularisatie van de ridge-regressie
+SURROGATE_KEEP = 2            # Aantal kandidaten per iteratie dat naar de judge mag
+
+# Overlap met de voorbeeldpreken (zie overlap.py)
+OVERLAP_NGRAM_SIZE = 8   # Woord-n-grammen in de index
+OVERLAP_MAX_SPAN = 20    # Vanaf zoveel letterlijk overgenomen woorden op rij volgt een penalty
+OVERLAP_PENALTY = 0.7    # Vermenigvuldiger voor de overall score bij overschrijding
+
+# Near-duplicate detectie tussen kandidaten (zie dedup.py)
+DEDUP_SHINGLE_SIZE = 5   # Woorden per shingle
+DEDUP_NUM_HASHES = 128   # Lengte van de MinHash-signatuur
+DEDUP_BANDS = 32         # LSH-banden (4 rijen per band)
+DEDUP_THRESHOLD = 0.8    # Geschatte Jaccard-similariteit vanaf waar kandidaten duplicaten zijn
+
+# Prompt-opslag: versies als delta t.o.v. hun parent, met periodiek een volledige snapshot
+PROMPT_SNAPSHOT_INTERVAL = 8  # Maximale ketenlengte van delta's vóór een nieuwe snapshot
+
+# Keuze van het startprompt per run (zie prompt_store.py): "current_best" (hoogste
+# enkele score) of een bandit over alle scores per versie: "thompson", "ucb" of "best"
+PROMPT_SELECTION = "thompson"
+BANDIT_PRIOR_STRENGTH = 1.0  # Gewicht van de prior (gemiddelde over alle versies), in observaties
+BANDIT_SCORE_STD = 0.1       # Geschatte ruis van een run-score (0-1 schaal)
+BANDIT_UCB_C = 2.0           # Exploratie-gewicht voor "ucb"
+
+# Learnings-registry (zie prompt_store.py)
+LEARNINGS_TOKEN_BUDGET = 600  # Maximale omvang van de learnings-sectie in het prompt (geschatte tokens)
+LEARNING_SIMILARITY = 0.75    # Vanaf deze gelijkenis (0-1) zijn twee learnings dezelfde
+LEARNING_PRIOR_RUNS = 2       # Krimpt het gemeten effect naar 0 zolang een learning weinig runs heeft
+
+# Budget voor het hele systeemprompt (zie enforce_prompt_budget in prompt_store.py)
+PROMPT_TOKEN_BUDGET = 3000               # Maximale omvang (geschatte tokens); daarboven LLM-condensatie
+PROMPT_CONDENSE_MODEL = "claude-sonnet-4-5"  # Model dat te grote prompts inkort
+PROMPT_CONDENSE_PANEL_SIZE = 2           # Bijbelteksten waarop een ingekort prompt gevalideerd wordt
+PROMPT_CONDENSE_TOLERANCE = 0.02         # Toegestaan verlies in panel-fitness (0-1 schaal)
+
+# Populatie-gebaseerde prompt-evolutie (zie evolution.py)
+EVOLUTION_POPULATION = 6          # Promptvarianten per generatie
+EVOLUTION_ELITE = 2               # Beste varianten die ongewijzigd doorgaan
+EVOLUTION_GENERATIONS = 3         # Aantal generaties per run
+EVOLUTION_PANEL_SIZE = 2          # Bijbelteksten waarop elke variant wordt geëvalueerd
+EVOLUTION_MUTATION_RATE = 0.5     # Kans dat een nakomeling ook een LLM-mutatie krijgt
+EVOLUTION_MUTATION_MODEL = "claude-sonnet-4-5"  # Model dat secties herschrijft
+
+# Lokale HTTP-service (zie server.py)
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+SERVER_MAX_CONCURRENT_JOBS = 2  # Generatie-jobs die tegelijk draaien; de rest wacht in de wachtrij
+
+# Duurzame job-wachtrij met worker-processen (zie job_queue.py)
+JOB_QUEUE_WORKERS = 2            # Worker-processen; elk voert één job tegelijk uit
+JOB_LEASE_SECONDS = 300          # Zonder heartbeat binnen deze tijd neemt een andere worker de job over
+JOB_HEARTBEAT_SECONDS = 30       # Interval waarmee een worker zijn lease verlengt
+JOB_MAX_ATTEMPTS = 3             # Daarna gaat een job naar "dead"
+JOB_RETRY_BACKOFF_SECONDS = 60   # Wachttijd na de eerste fout; verdubbelt per poging
+JOB_POLL_SECONDS = 5             # Hoe vaak een idle worker naar nieuwe jobs kijkt
+
+JOB_MAX_ITERATIONS = 4 * MAX_ITERATIONS  # Bovengrens voor max_iterations per job
+JOB_MAX_CANDIDATES = 4           # Bovengrens voor candidates_per_iteration per job
+
+# Opties die een job (HTTP-service of wachtrij) mag meegeven aan generate_with_iteration:
+# naam -> (type, minimum, maximum)
+JOB_OPTIONS = {
+    "max_iterations": (int, 1, JOB_MAX_ITERATIONS),
+    "target_score": (float, 0.0, 1.0),
+    "candidates_per_iteration": (int, 1, JOB_MAX_CANDIDATES),
+}
+
+# Referentiecorpus (zie corpus.py): glob-patronen relatief aan de repository
+CORPUS_SOURCES = ["docs/*_nl.json", "vertaling_Wim/export/p*.json"]
+
+# Geciteerde dichters en filosofen (zie citations.py): auteur -> schrijfwijzen in de tekst.
+# Hoofdlettergevoelig, zodat bijv. "Kant" niet op "aan de kant" matcht
+CITATION_AUTHORS = {
+    # Dichters en schrijvers
+    "Hölderlin": ["Hölderlin"],
+    "Goethe": ["Goethe"],
+    "Schiller": ["Schiller"],
+    "Rilke": ["Rilke"],
+    "Benn": ["Gottfried Benn", "Benn"],
+    "Gerhardt": ["Paul Gerhardt", "Gerhardt"],
+    "Claudius": ["Matthias Claudius"],  # Niet kaal "Claudius": dat is ook de keizer (Handelingen 11:28, 18:2)
+    "Novalis": ["Novalis"],
+    "Heine": ["Heine"],
+    "Celan": ["Celan"],
+    "Brecht": ["Brecht"],
+    "Kafka": ["Kafka"],
+    "Dostojevski": ["Dostojevski", "Dostojewski", "Dostoevski"],
+    # Filosofen
+    "Heidegger": ["Heidegger"],
+    "Kierkegaard": ["Kierkegaard"],
+    "Nietzsche": ["Nietzsche"],
+    "Kant": ["Kant"],
+    "Hegel": ["Hegel"],
+    "Pascal": ["Pascal"],
+    "Feuerbach": ["Feuerbach"],
+    "Wittgenstein": ["Wittgenstein"],
+    "Buber": ["Buber"],
+    "Levinas": ["Levinas", "Lévinas"],
+    "Camus": ["Camus"],
+    "Sartre": ["Sartre"],
+    "Rudolf Otto": ["Rudolf Otto"],
+    # Theologen
+    "Augustinus": ["Augustinus"],
+    "Luther": ["Luther"],
+    "Barth": ["Karl Barth", "Barth"],
+    "Bonhoeffer": ["Bonhoeffer"],
+    "Bultmann": ["Bultmann"],
+    "Schleiermacher": ["Schleiermacher"],
+}
 
 # Few-shot example parameters
 NUM_REFERENCE_EXAMPLES = 5      # Aantal voorbeeldpreken per generatie
-EXAMPLE_FRAGMENT_START = 100    # Start positie in de preek (skip header)
+EXAMPLE_FRAGMENT_START = 0      # Start positie in de preek (de corpus-cache heeft de header al verwijderd)
 EXAMPLE_FRAGMENT_LENGTH = 12000 # Lengte van het fragment (~85% van gemiddelde preek)
 
 
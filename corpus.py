@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+"""
+Voorbewerkte cache van het referentiecorpus.
+De build leest de preken uit CORPUS_SOURCES, normaliseert de tekst (NBV21-header
+weg, zoals in analyze_sermon) en berekent per preek de stilometrie, de
+alinea-offsets en het aantal woorden. Alle teksten komen in één binair bestand
+(per content-hash), de rest in een kleine index. Bij het opstarten wordt alleen
+de index gelezen; teksten komen pas bij gebruik uit het memory-mapped bestand.
+
+Gebruik:
+    python corpus.py build [--force]
+    python corpus.py info
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import tempfile
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+from config import CORPUS_SOURCES
+from stylometrics import StylometricMetrics, analyze_sermon
+
+BASE_DIR = Path(__file__).parent
+CORPUS_CACHE_DIR = BASE_DIR / "cache" / "corpus"
+CORPUS_INDEX_FILE = CORPUS_CACHE_DIR / "index.json"
+
+# Verhoog bij een wijziging in normalisatie of voorberekening: oude caches worden dan herbouwd
+CORPUS_FORMAT_VERSION = 1
+
+NBV21_HEADER_PATTERN = re.compile(r'^NBV21\[.*?\]', re.DOTALL)
+PARAGRAPH_BREAK_PATTERN = re.compile(r"\n\s*\n")
+
+
+@dataclass
+class CorpusEntry:
+    """Index-gegevens van één preek; de tekst zelf staat in het databestand."""
+    id: str
+    schriftgedeelte: str
+    source: str                    # Bronbestand, relatief aan de repository
+    offset: int                    # Byte-offset van de tekst in het databestand
+    length: int                    # Lengte van de tekst in bytes (UTF-8)
+    token_count: int               # Aantal woorden (zoals analyze_sermon telt)
+    paragraph_offsets: list[int]   # Karakter-offsets waar een alinea begint
+    metrics: StylometricMetrics
+
+
+def normalize_text(text: str) -> str:
+    """Verwijder de NBV21-header en witruimte aan de randen."""
+    return NBV21_HEADER_PATTERN.sub("", text).strip()
+
+
+def paragraph_offsets(text: str) -> list[int]:
+    """Karakter-offsets van het begin van elke alinea."""
+    if not text:
+        return []
+    return [0] + [match.end() for match in PARAGRAPH_BREAK_PATTERN.finditer(text)]
+
+
+def source_files(sources: list[str] = CORPUS_SOURCES) -> list[Path]:
+    """Alle bronbestanden, in vaste volgorde."""
+    files = set()
+    for pattern in sources:
+        files.update(glob.glob(str(BASE_DIR / pattern)))
+    return sorted(Path(f) for f in files)
+
+
+def source_stamps(files: list[Path]) -> dict[str, list[int]]:
+    """(grootte, mtime_ns) per bronbestand: goedkope controle of de cache nog klopt."""
+    stamps = {}
+    for path in files:
+        stat = path.stat()
+        stamps[str(path.relative_to(BASE_DIR))] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+class Corpus:
+    """Het gecachte corpus: index in het geheugen, teksten via mmap."""
+
+    def __init__(self, entries: list[CorpusEntry], data_file: Path):
+        self.entries = entries
+        self.data_file = data_file
+        self._data: Optional[bytes | mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _buffer(self) -> bytes | mmap.mmap:
+        if self._data is None:
+            with open(self.data_file, "rb") as f:
+                # Een leeg bestand kan niet gemapt worden
+                if os.path.getsize(self.data_file) == 0:
+                    self._data = b""
+                else:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def text(self, index: int) -> str:
+        """De genormaliseerde tekst van preek `index`."""
+        entry = self.entries[index]
+        return self._buffer()[entry.offset:entry.offset + entry.length].decode("utf-8")
+
+    def paragraphs(self, index: int) -> list[str]:
+        """De alinea's van preek `index`."""
+        text = self.text(index)
+        bounds = self.entries[index].paragraph_offsets + [len(text)]
+        return [text[start:end].strip() for start, end in zip(bounds, bounds[1:]) if text[start:end].strip()]
+
+    def records(self) -> list[dict]:
+        """Preken als dicts zoals in de bronbestanden (id, schriftgedeelte, tekst)."""
+        return [
+            {"id": entry.id, "schriftgedeelte": entry.schriftgedeelte, "tekst": self.text(k)}
+            for k, entry in enumerate(self.entries)
+        ]
+
+
+def write_atomic(path: Path, data: bytes):
+    """
+    Schrijf via een uniek tijdelijk bestand en os.replace: processen die tegelijk
+    (her)bouwen zitten elkaar niet in de weg, en een lezer ziet nooit een half bestand.
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.name}.", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+
+def build_corpus(sources: list[str] = CORPUS_SOURCES, verbose: bool = False) -> Corpus:
+    """
+    Lees en verwerk alle bronbestanden en schrijf de cache.
+    Het databestand heet naar de content-hash; ongewijzigde inhoud wordt niet opnieuw geschreven.
+    """
+    files = source_files(sources)
+    hasher = hashlib.sha256(f"v{CORPUS_FORMAT_VERSION}".encode("utf-8"))
+    sermons = []
+    for path in files:
+        raw = path.read_bytes()
+        hasher.update(raw)
+        sermons.append((path, json.loads(raw)))
+    content_hash = hasher.hexdigest()[:16]
+
+    entries = []
+    chunks = []
+    offset = 0
+    for path, sermon in sermons:
+        text = normalize_text(sermon["tekst"])
+        metrics, words = analyze_sermon(text)
+        encoded = text.encode("utf-8")
+        entries.append(CorpusEntry(
+            id=sermon.get("id", path.stem),
+            schriftgedeelte=sermon.get("schriftgedeelte", ""),
+            source=str(path.relative_to(BASE_DIR)),
+            offset=offset,
+            length=len(encoded),
+            token_count=len(words),
+            paragraph_offsets=paragraph_offsets(text),
+            metrics=metrics,
+        ))
+        chunks.append(encoded)
+        offset += len(encoded)
+
+    os.makedirs(CORPUS_CACHE_DIR, exist_ok=True)
+    data_file = CORPUS_CACHE_DIR / f"corpus_{content_hash}.bin"
+    if not data_file.exists():
+        write_atomic(data_file, b"".join(chunks))
+
+    index = {
+        "format_version": CORPUS_FORMAT_VERSION,
+        "content_hash": content_hash,
+        "sources": sources,
+        "stamps": source_stamps(files),
+        "entries": [asdict(entry) for entry in entries],
+    }
+    write_atomic(CORPUS_INDEX_FILE, json.dumps(index, ensure_ascii=False).encode("utf-8"))
+
+    # Databestanden van eerdere builds opruimen (een parallelle build kan ons voor zijn)
+    for old_file in CORPUS_CACHE_DIR.glob("corpus_*.bin"):
+        if old_file != data_file:
+            try:
+                old_file.unlink()
+            except FileNotFoundError:
+                pass
+
+    if verbose:
+        print(f"Corpus gebouwd: {len(entries)} preken, {offset} bytes ({data_file.name})")
+    return Corpus(entries, data_file)
+
+
+def load_corpus(sources: list[str] = CORPUS_SOURCES) -> Corpus:
+    """
+    Laad het corpus uit de cache; (her)bouw als bronnen of formaat veranderd zijn.
+    Kost bij een geldige cache alleen een stat per bronbestand en het lezen van de index.
+    """
+    if CORPUS_INDEX_FILE.exists():
+        with open(CORPUS_INDEX_FILE, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        data_file = CORPUS_CACHE_DIR / f"corpus_{index['content_hash']}.bin"
+        if (
+            index.get("format_version") == CORPUS_FORMAT_VERSION
+            and index.get("sources") == sources
+            and index.get("stamps") == source_stamps(source_files(sources))
+            and data_file.exists()
+        ):
+            return Corpus([CorpusEntry(**entry) for entry in index["entries"]], data_file)
+
+    return build_corpus(sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voorbewerkte cache van het referentiecorpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Bouw de cache uit CORPUS_SOURCES")
+    build_parser.add_argument("--force", action="store_true", help="Ook bouwen als de cache actueel is")
+    subparsers.add_parser("info", help="Toon de inhoud van de cache")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        if args.force:
+            build_corpus(verbose=True)
+        else:
+            corpus = load_corpus()
+            print(f"Corpus actueel: {len(corpus)} preken ({corpus.data_file.name})")
+
+    elif args.command == "info":
+        corpus = load_corpus()
+        print(f"{len(corpus)} preken in {corpus.data_file.name}")
+        for entry in corpus.entries:
+            print(f"  {entry.id:<14} {entry.schriftgedeelte[:30]:<30} "
+                  f"{entry.token_count:>6} woorden  {len(entry.paragraph_offsets):>3} alinea's")
+
+
+if __name__ == "__main__":
+    main()
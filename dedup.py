@@ -0,0 +1,91 @@
+"""
+Near-duplicate detectie tussen kandidaat-preken binnen een run.
+MinHash-signaturen over woord-shingles, gebucket met LSH, zodat alleen
+kandidaten die een bucket delen met elkaar vergeleken worden.
+"""
+import re
+import zlib
+
+import numpy as np
+
+from config import DEDUP_BANDS, DEDUP_NUM_HASHES, DEDUP_SHINGLE_SIZE, DEDUP_THRESHOLD
+
+# Vaste multiply-shift hashfuncties ((a * x + b) mod 2^64) >> 32, zodat
+# signaturen tussen aanroepen vergelijkbaar zijn; a oneven
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 2 ** 63, size=DEDUP_NUM_HASHES, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, size=DEDUP_NUM_HASHES, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE_SIZE) -> set[int]:
+    """Gehashte woord-shingles van `size` woorden."""
+    words = re.findall(r"\w+", text.lower())
+    return {
+        zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+        for i in range(max(1, len(words) - size + 1))
+    }
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """MinHash-signatuur van DEDUP_NUM_HASHES waarden."""
+    x = np.fromiter(shingles(text), dtype=np.uint64)
+    # uint64-vermenigvuldiging loopt bewust over (mod 2^64)
+    hashed = (_A[:, None] * x[None, :] + _B[:, None]) >> np.uint64(32)
+    return hashed.min(axis=1)
+
+
+def estimated_similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """Geschatte Jaccard-similariteit: fractie gelijke signatuur-posities."""
+    return float(np.mean(sig_a == sig_b))
+
+
+def cluster_near_duplicates(
+    texts: list[str],
+    threshold: float = DEDUP_THRESHOLD,
+    bands: int = DEDUP_BANDS,
+) -> list[int]:
+    """
+    Groepeer bijna-identieke teksten.
+    Returns: per tekst de index van zijn representant (zie cluster_signatures).
+    """
+    return cluster_signatures([minhash_signature(text) for text in texts], threshold, bands)
+
+
+def cluster_signatures(
+    signatures: list[np.ndarray],
+    threshold: float = DEDUP_THRESHOLD,
+    bands: int = DEDUP_BANDS,
+) -> list[int]:
+    """
+    Groepeer bijna-identieke teksten op basis van hun MinHash-signaturen.
+    Kandidaat-paren komen uit LSH (gedeelde band); alleen die worden met de
+    volledige signatuur vergeleken tegen `threshold`.
+    Returns: per tekst de index van zijn representant (de eerste tekst van
+    het cluster); een tekst zonder duplicaat is zijn eigen representant.
+    """
+    rows = DEDUP_NUM_HASHES // bands
+
+    # Union-find over de gevonden duplicaat-paren
+    parent = list(range(len(signatures)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(bands):
+        buckets: dict[bytes, list[int]] = {}
+        for i, signature in enumerate(signatures):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            for other in members[1:]:
+                first = members[0]
+                if find(first) == find(other):
+                    continue
+                if estimated_similarity(signatures[first], signatures[other]) >= threshold:
+                    a, b = find(first), find(other)
+                    parent[max(a, b)] = min(a, b)
+
+    return [find(i) for i in range(len(signatures))]
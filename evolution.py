@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+
+"""
+Populatie-gebaseerde prompt-evolutie bovenop prompt_store.
+Houdt meerdere elite-varianten van het systeemprompt aan en maakt nakomelingen
+via crossover (secties en learnings van twee ouders) en LLM-mutatie (één sectie
+herschreven op basis van de judge-feedback). Alle nakomelingen worden
+gelijktijdig geëvalueerd op een vast panel van Bijbelteksten; de fitness van
+elke generatie wordt opgeslagen zodat een onderbroken run kan worden hervat.
+
+Gebruik:
+    python evolution.py [--generations 3]
+    python evolution.py --resume 20251220_101500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import (
+    EVOLUTION_POPULATION,
+    EVOLUTION_ELITE,
+    EVOLUTION_GENERATIONS,
+    EVOLUTION_PANEL_SIZE,
+    EVOLUTION_MUTATION_RATE,
+    EVOLUTION_MUTATION_MODEL,
+)
+from corpus import load_corpus
+from generator import BASE_SYSTEM_PROMPT, generate_sermon
+from llm import call_claude
+from prompt_store import (
+    LEARNINGS_SECTION_PATTERN,
+    compact_prompt,
+    evolve_prompt,
+    get_arm_posteriors,
+    get_prompt,
+    prompt_learnings,
+    store_prompt,
+)
+from scorer import ScoringError, compute_full_score
+
+EVOLUTION_DIR = Path(__file__).parent / "output" / "evolution"
+
+# Kopregels van prompt-secties: een regel zonder kleine letters die op ':' eindigt
+SECTION_HEADER_PATTERN = re.compile(r"^(?=[^\n]*[A-Z])[^a-z\n]{4,}:[ \t]*$", re.MULTILINE)
+
+# Run-specifieke feedback die generate_sermon aan het prompt toevoegt; wordt niet vererfd
+EPHEMERAL_SECTIONS = {"FEEDBACK OP EERDERE POGINGEN:"}
+
+MUTATION_SYSTEM_PROMPT = """Je verbetert systeemprompts voor een generator van preken in de stijl van Eberhard Jüngel.
+Je herschrijft telkens precies één sectie. Je behoudt de bedoeling van de sectie en de "show, don't tell"-regels:
+Jüngels theologische begrippen worden in de preek getoond, nooit letterlijk benoemd."""
+
+
+@dataclass
+class Individual:
+    """Een promptvariant in de populatie."""
+    id: str
+    prompt: str
+    origin: str                         # "v4" (opgeslagen versie), "crossover" of "mutatie"
+    parents: list[str] = field(default_factory=list)
+    root_version: Optional[int] = None  # Opgeslagen versie waar deze lijn van afstamt
+    fitness: Optional[float] = None     # Gemiddelde score over het panel (None = nog niet geëvalueerd)
+    scores: list[float] = field(default_factory=list)
+    feedback: str = ""                  # Judge-feedback bij de zwakste panel-preek (stuurt mutaties)
+    tokens_used: int = 0
+
+
+@dataclass
+class PanelItem:
+    """Een Bijbeltekst uit het evaluatie-panel."""
+    sermon_id: str
+    scripture_text: str
+    scripture_context: str
+
+
+def build_panel(corpus: list[dict], size: int = EVOLUTION_PANEL_SIZE, seed: int = 0) -> list[PanelItem]:
+    """
+    Kies een vast panel van Bijbelteksten uit het corpus (zelfde seed = zelfde panel).
+    De context blijft leeg: de opbouw van de preekteksten verschilt per bron (tekst,
+    verwijzing, gebed of aanhef vooraan), dus de Bijbeltekst is er niet betrouwbaar
+    uit te halen, en een verkeerde context beoordeelt elke variant tegen ruis.
+    """
+    return [
+        PanelItem(sermon["id"], sermon["schriftgedeelte"], "")
+        for sermon in random.Random(seed).sample(corpus, min(size, len(corpus)))
+    ]
+
+
+def split_sections(prompt: str) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Splits een prompt in een intro en (kop, inhoud)-secties.
+    Learnings-secties en run-specifieke feedback worden weggelaten.
+    """
+    prompt = LEARNINGS_SECTION_PATTERN.sub("", prompt)
+    headers = list(SECTION_HEADER_PATTERN.finditer(prompt))
+    if not headers:
+        return prompt, []
+
+    sections = []
+    for i, match in enumerate(headers):
+        end = headers[i + 1].start() if i + 1 < len(headers) else len(prompt)
+        header = match.group().strip()
+        if header not in EPHEMERAL_SECTIONS:
+            sections.append((header, prompt[match.end():end]))
+    return prompt[:headers[0].start()], sections
+
+
+def join_sections(intro: str, sections: list[tuple[str, str]]) -> str:
+    """Inverse van split_sections."""
+    return intro + "".join(header + body for header, body in sections)
+
+
+def crossover(a: Individual, b: Individual, child_id: str, rng: random.Random) -> Individual:
+    """
+    Combineer twee ouders: per sectie de versie van een willekeurige ouder,
+    en de learnings van beide (geselecteerd op effect door evolve_prompt).
+    """
+    intro, sections_a = split_sections(a.prompt)
+    _, sections_b = split_sections(b.prompt)
+    bodies_a, bodies_b = dict(sections_a), dict(sections_b)
+
+    sections = [
+        (header, bodies_b[header] if header in bodies_b and rng.random() < 0.5 else body)
+        for header, body in sections_a
+    ]
+    # Secties die alleen ouder B heeft, gaan met kans 1/2 mee
+    sections += [(h, body) for h, body in sections_b if h not in bodies_a and rng.random() < 0.5]
+
+    prompt = join_sections(intro, sections)
+    learnings = prompt_learnings(a.prompt) + prompt_learnings(b.prompt)
+    if learnings:
+        prompt = evolve_prompt(prompt, learnings)
+
+    return Individual(
+        id=child_id,
+        prompt=prompt,
+        origin="crossover",
+        parents=[a.id, b.id],
+        root_version=a.root_version,
+    )
+
+
+async def mutate(individual: Individual, feedback: str, rng: random.Random) -> Individual:
+    """Laat het LLM één willekeurige sectie herschrijven, gestuurd door de judge-feedback."""
+    intro, sections = split_sections(individual.prompt)
+    if not sections:
+        return individual
+    k = rng.randrange(len(sections))
+    header, body = sections[k]
+
+    message = f"""Hieronder staat de sectie "{header}" uit het systeemprompt.
+
+Feedback van de beoordelaar op preken die met dit prompt zijn geschreven:
+{feedback or "(geen feedback beschikbaar)"}
+
+Herschrijf ALLEEN deze sectie zodat preken op de zwakke punten beter worden. Houd de lengte ongeveer gelijk en geef uitsluitend de nieuwe sectietekst terug, zonder kop en zonder toelichting.
+
+SECTIE:
+{body.strip()}"""
+
+    text, _, _ = await call_claude(
+        model=EVOLUTION_MUTATION_MODEL,
+        system_prompt=MUTATION_SYSTEM_PROMPT,
+        user_message=message,
+        temperature=0.9,
+        max_tokens=2000,
+    )
+    sections[k] = (header, f"\n{text.strip()}\n\n")
+
+    learnings = prompt_learnings(individual.prompt)
+    prompt = join_sections(intro, sections)
+    if learnings:
+        prompt = evolve_prompt(prompt, learnings)
+
+    return Individual(
+        id=individual.id,
+        prompt=prompt,
+        origin="mutatie",
+        parents=individual.parents,
+        root_version=individual.root_version,
+    )
+
+
+async def evaluate_on_panel(
+    individual: Individual,
+    panel: list[PanelItem],
+    corpus: list[dict],
+) -> None:
+    """
+    Schrijf en beoordeel met dit prompt één preek per panel-tekst (gelijktijdig).
+    De panel-preek zelf zit niet bij de voorbeelden, anders wordt kopiëren beloond.
+    """
+    async def one(item: PanelItem):
+        references = [s["tekst"] for s in corpus if s["id"] != item.sermon_id]
+        text, _, in_tok, out_tok = await generate_sermon(
+            scripture_text=item.scripture_text,
+            scripture_context=item.scripture_context,
+            reference_sermons=references,
+            system_prompt=individual.prompt,
+        )
+        try:
+            score = await compute_full_score(text, item.scripture_text, references)
+        except ScoringError:
+            score = None
+        return score, in_tok + out_tok
+
+    results = await asyncio.gather(*(one(item) for item in panel))
+
+    scores = [score for score, _ in results if score is not None]
+    individual.tokens_used += sum(tokens for _, tokens in results)
+    individual.scores = [score.overall_score for score in scores]
+    # Een panel-tekst zonder geldige score telt als 0: het prompt moet op het hele panel werken
+    individual.fitness = sum(individual.scores) / len(panel) if panel else 0.0
+    if scores:
+        weakest = min(scores, key=lambda score: score.overall_score)
+        individual.feedback = f"{weakest.stylometric_feedback}\n{weakest.llm_feedback}"
+
+
+def tournament(population: list[Individual], rng: random.Random, size: int = 2) -> Individual:
+    """Toernooiselectie: de fitste van `size` willekeurige individuen."""
+    return max(rng.sample(population, min(size, len(population))), key=lambda ind: ind.fitness or 0.0)
+
+
+async def breed(
+    ranked: list[Individual],
+    count: int,
+    generation: int,
+    rng: random.Random,
+) -> list[Individual]:
+    """Maak `count` nakomelingen; mutaties (LLM-calls) lopen gelijktijdig."""
+    children = []
+    for k in range(count):
+        a = tournament(ranked, rng)
+        others = [ind for ind in ranked if ind is not a] or ranked
+        b = tournament(others, rng)
+        children.append(crossover(a, b, f"g{generation}_{k + 1}", rng))
+
+    mutations = [
+        (k, mutate(child, _parent_feedback(child, ranked), rng))
+        for k, child in enumerate(children)
+        if rng.random() < EVOLUTION_MUTATION_RATE
+    ]
+    for (k, _), mutated in zip(mutations, await asyncio.gather(*(m for _, m in mutations))):
+        children[k] = mutated
+    return children
+
+
+def _parent_feedback(child: Individual, population: list[Individual]) -> str:
+    """De judge-feedback van de eerste ouder van een nakomeling."""
+    parents = {ind.id: ind for ind in population}
+    parent = parents.get(child.parents[0])
+    return parent.feedback if parent else ""
+
+
+def initial_population(size: int = EVOLUTION_POPULATION) -> list[Individual]:
+    """
+    Start met de opgeslagen versies met de hoogste posterior-verwachting (zie prompt_store),
+    zonder de feedback-secties en herhalingen die oudere versies nog meedragen.
+    """
+    posteriors = get_arm_posteriors()
+    versions = sorted(posteriors, key=lambda v: posteriors[v]["mean"], reverse=True)[:size]
+
+    population = []
+    for version in versions:
+        stored = get_prompt(version)
+        if stored:
+            population.append(Individual(
+                id=f"v{version}",
+                prompt=compact_prompt(stored.system_prompt),
+                origin=f"v{version}",
+                root_version=version,
+            ))
+    if not population:
+        population.append(Individual(id="basis", prompt=BASE_SYSTEM_PROMPT, origin="basis"))
+    return population
+
+
+def save_generation(run_dir: Path, generation: int, population: list[Individual], panel: list[PanelItem]) -> Path:
+    """Sla een generatie (prompts, fitness, panel) op; het laatste bestand is het hervatpunt."""
+    os.makedirs(run_dir, exist_ok=True)
+    path = run_dir / f"generation_{generation:02d}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "generation": generation,
+            "timestamp": datetime.now().isoformat(),
+            "panel": [asdict(item) for item in panel],
+            "population": [asdict(ind) for ind in population],
+        }, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def load_latest_generation(run_dir: Path) -> tuple[int, list[Individual], list[PanelItem]]:
+    """Laad de laatst opgeslagen generatie van een run."""
+    files = sorted(run_dir.glob("generation_*.json"))
+    if not files:
+        raise FileNotFoundError(f"Geen generaties gevonden in {run_dir}")
+    with open(files[-1], "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return (
+        data["generation"],
+        [Individual(**ind) for ind in data["population"]],
+        [PanelItem(**item) for item in data["panel"]],
+    )
+
+
+async def run_evolution(
+    generations: int = EVOLUTION_GENERATIONS,
+    resume: Optional[str] = None,
+    seed: int = 0,
+    verbose: bool = True,
+) -> Individual:
+    """
+    Draai (of hervat) de evolutie en sla de beste nieuwe variant op in prompt_store.
+    Returns: het fitste individu.
+    """
+    corpus = load_corpus().records()
+    if resume:
+        run_dir = EVOLUTION_DIR / resume
+        generation, population, panel = load_latest_generation(run_dir)
+    else:
+        run_dir = EVOLUTION_DIR / datetime.now().strftime("%Y%m%d_%H%M%S")
+        generation, population, panel = 0, initial_population(), build_panel(corpus, seed=seed)
+    rng = random.Random(f"{seed}-{generation}")
+
+    if verbose:
+        print(f"Panel: {', '.join(item.scripture_text for item in panel)}")
+        print(f"Generaties worden opgeslagen in: {run_dir}")
+
+    while True:
+        pending = [ind for ind in population if ind.fitness is None]
+        if verbose:
+            print(f"\n--- Generatie {generation + 1}/{generations}: {len(pending)} varianten evalueren ---")
+        await asyncio.gather(*(evaluate_on_panel(ind, panel, corpus) for ind in pending))
+
+        ranked = sorted(population, key=lambda ind: ind.fitness or 0.0, reverse=True)
+        save_generation(run_dir, generation, ranked, panel)
+        if verbose:
+            for ind in ranked:
+                print(f"  {ind.id:<10} {ind.origin:<10} fitness {ind.fitness:.3f}  "
+                      f"({', '.join(f'{s:.2f}' for s in ind.scores)})")
+
+        if generation + 1 >= generations:
+            break
+        generation += 1
+        elite = ranked[:EVOLUTION_ELITE]
+        population = elite + await breed(ranked, EVOLUTION_POPULATION - len(elite), generation, rng)
+        # Nakomelingen vóór evaluatie opslaan: een hervatting kost dan geen nieuwe mutaties
+        save_generation(run_dir, generation, population, panel)
+
+    best = ranked[0]
+    if best.origin not in (f"v{best.root_version}", "basis"):
+        stored = store_prompt(
+            system_prompt=best.prompt,
+            score=best.fitness,
+            scripture_text=f"Evolutie-panel: {', '.join(item.scripture_text for item in panel)}",
+            iteration=generation + 1,
+            tokens_used=sum(ind.tokens_used for ind in ranked),
+            parent_version=best.root_version,
+            improvements=prompt_learnings(best.prompt) or None,
+        )
+        if verbose:
+            print(f"\nBeste variant ({best.id}) opgeslagen als v{stored.version}")
+    elif verbose:
+        print(f"\nGeen nakomeling versloeg de opgeslagen versies (beste: {best.id})")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Populatie-gebaseerde prompt-evolutie")
+    parser.add_argument("--generations", type=int, default=EVOLUTION_GENERATIONS)
+    parser.add_argument("--resume", help="Run-ID (map in output/evolution) om te hervatten")
+    parser.add_argument("--seed", type=int, default=0, help="Bepaalt panel en crossover")
+    args = parser.parse_args()
+    asyncio.run(run_evolution(generations=args.generations, resume=args.resume, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
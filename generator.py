@@ -2,32 +2,51 @@
 Preek-generator met iteratieve prompt-optimalisatie.
 Het prompt evolueert dynamisch op basis van feedback en wordt opgeslagen.
 """
+import asyncio
+import difflib
 import json
 import os
 import random
-from dataclasses import dataclass, asdict
+import re
+from dataclasses import dataclass, asdict, replace
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 from config import (
+    FINAL_EVAL_MODEL,
+    FINAL_EVAL_TOP_K,
     GENERATOR_MODEL,
     GENERATOR_TEMPERATURE,
     GENERATOR_MAX_TOKENS,
     MAX_ITERATIONS,
-    MAX_SOLUTIONS_IN_FEEDBACK,
+    FEEDBACK_DIGEST_MAX_POINTS,
+    FEEDBACK_DIGEST_POINT_CHARS,
+    LEARNING_SIMILARITY,
     SELECTION_PROBABILITY,
+    SELECTION_MODE,
+    CANDIDATES_PER_ITERATION,
+    SURROGATE_KEEP,
+    EARLY_STOP_PATIENCE,
     NUM_REFERENCE_EXAMPLES,
     EXAMPLE_FRAGMENT_START,
     EXAMPLE_FRAGMENT_LENGTH,
 )
 from llm import call_claude
-from scorer import SermonScore, compute_full_score
+from scorer import SermonScore, ScoringError, compute_full_score, scores_differ
+from dedup import cluster_signatures, minhash_signature
+from selection import rank_candidates, rejudge_top_candidates, surrogate_prerank, tournament_rank
 from prompt_store import (
     get_best_prompt_for_evolution,
+    enforce_prompt_budget,
     store_prompt,
     evolve_prompt,
     extract_learnings_from_feedback,
+    register_learnings,
+    record_learning_outcome,
+    prompt_learnings,
+    normalize_learning,
+    get_prompt,
     get_prompt_stats,
 )
 
@@ -45,6 +64,7 @@ class GeneratedSermon:
     output_tokens: int
     final_prompt: str  # Het prompt dat tot dit resultaat leidde
     prompt_version: int
+    candidate: int = 1  # Volgnummer binnen de iteratie (bij meerdere kandidaten per iteratie)
 
 
 @dataclass
@@ -169,13 +189,21 @@ TAAL:
 
 FEEDBACK_ADDITION = """
 
-FEEDBACK OP EERDERE POGINGEN:
-De volgende eerdere pogingen zijn beoordeeld. Leer van de feedback om een betere preek te schrijven.
-
-{feedback_block}
+VERBETERPUNTEN UIT EERDERE POGINGEN (belangrijkste eerst):
+{feedback_digest}
 
 Verbeter deze punten in je nieuwe preek."""
 
+# Feedbackregels zonder verbeterpunt
+NON_ACTIONABLE_FEEDBACK = (
+    "N/A",
+    "Stilometrisch gezien ligt de preek dicht bij Jüngels stijl.",
+    "(Beoordeling afgebroken na een diskwalificerende show-don't-tell score.)",
+)
+
+# Feedback voor een concept dat vrijwel gelijk is aan een eerdere poging
+NEAR_DUPLICATE_FEEDBACK = "De preek herhaalt een eerdere poging vrijwel letterlijk; kies een andere invalshoek."
+
 
 def save_iteration(
     run_id: str,
@@ -184,15 +212,18 @@ def save_iteration(
     score: SermonScore,
     prompt: str,
     is_best: bool = False,
+    candidate: Optional[int] = None,
 ) -> Path:
     """
     Sla een iteratie op naar disk.
+    Met `candidate` krijgen de bestanden een kandidaat-suffix (iter_NN_cK_*).
     Returns: pad naar het opgeslagen bestand.
     """
     os.makedirs(ITERATIONS_DIR / run_id, exist_ok=True)
+    prefix = f"iter_{iteration:02d}" if candidate is None else f"iter_{iteration:02d}_c{candidate}"
 
     # Preek opslaan
-    sermon_file = ITERATIONS_DIR / run_id / f"iter_{iteration:02d}_sermon.txt"
+    sermon_file = ITERATIONS_DIR / run_id / f"{prefix}_sermon.txt"
     with open(sermon_file, "w", encoding="utf-8") as f:
         f.write(f"Iteratie: {iteration}\n")
         f.write(f"Score: {score.overall_score:.2f}\n")
@@ -210,15 +241,16 @@ def save_iteration(
         f.write(sermon_text)
 
     # Prompt opslaan
-    prompt_file = ITERATIONS_DIR / run_id / f"iter_{iteration:02d}_prompt.txt"
+    prompt_file = ITERATIONS_DIR / run_id / f"{prefix}_prompt.txt"
     with open(prompt_file, "w", encoding="utf-8") as f:
         f.write(prompt)
 
     # Scores opslaan als JSON
-    scores_file = ITERATIONS_DIR / run_id / f"iter_{iteration:02d}_scores.json"
+    scores_file = ITERATIONS_DIR / run_id / f"{prefix}_scores.json"
     with open(scores_file, "w", encoding="utf-8") as f:
         json.dump({
             "iteration": iteration,
+            "candidate": candidate or 1,
             "overall_score": score.overall_score,
             "stylometric_score": score.stylometric_score,
             "theological_score": score.theological_score,
@@ -230,38 +262,125 @@ def save_iteration(
             "flow_score": score.flow_score,
             "humor_score": score.humor_score,
             "sdt_score": score.sdt_score,
+            "parse_failures": score.parse_failures,
+            "judge_count": score.judge_count,
+            "overall_stderr": score.overall_stderr,
+            "score_variance": score.score_variance,
+            "copied_span": score.copied_span,
+            "overlap_ratio": score.overlap_ratio,
+            "overlap_penalty": score.overlap_penalty,
+            "inherited": score.inherited,
+            "received_fields": score.received_fields,
             "is_best": is_best,
             "sermon_length": len(sermon_text),
         }, f, indent=2)
 
     # Als dit de beste is, maak ook een "best" symlink/copy
     if is_best:
-        best_sermon = ITERATIONS_DIR / run_id / "best_sermon.txt"
-        with open(best_sermon, "w", encoding="utf-8") as f:
-            f.write(f"Beste iteratie: {iteration}\n")
-            f.write(f"Score: {score.overall_score:.2f}\n")
-            f.write(f"{'='*60}\n\n")
-            f.write(sermon_text)
+        save_best_sermon(run_id, iteration, sermon_text, score)
 
     return sermon_file
 
 
-def create_feedback_block(solutions: list[Solution]) -> str:
-    """Creëer een feedback block van eerdere oplossingen."""
-    if not solutions:
-        return ""
+def save_best_sermon(run_id: str, iteration: int, sermon_text: str, score: SermonScore) -> Path:
+    """Sla de (voorlopig) beste preek van een run op als best_sermon.txt."""
+    best_sermon = ITERATIONS_DIR / run_id / "best_sermon.txt"
+    with open(best_sermon, "w", encoding="utf-8") as f:
+        f.write(f"Beste iteratie: {iteration}\n")
+        f.write(f"Score: {score.overall_score:.2f}\n")
+        f.write(f"{'='*60}\n\n")
+        f.write(sermon_text)
+    return best_sermon
+
+
+def print_score(score: SermonScore, sermon_length: int):
+    """Print de score-onderdelen van een kandidaat."""
+    print(f"Lengte: {sermon_length} karakters")
+    print(f"Stilometrische score: {score.stylometric_score:.2f}")
+    print(f"Theologie (Kreuzestheologie): {score.theological_score:.2f}")
+    print(f"Metaforische Waarheid: {score.metaphorical_score:.2f}")
+    print(f"Haben→Sein Transformatie: {score.transformation_score:.2f}")
+    print(f"Retorische score: {score.rhetorical_score:.2f}")
+    print(f"Coherentie score: {score.coherence_score:.2f}")
+    print(f"Taal score: {score.language_score:.2f}")
+    print(f"Flow score: {score.flow_score:.2f}")
+    print(f"Humor score: {score.humor_score:.2f}")
+    print(f"Show Don't Tell multiplier: {score.sdt_score:.2f}")
+    if score.overlap_penalty < 1.0:
+        print(f"Overname uit voorbeelden: {score.copied_span} woorden op rij "
+              f"(overlap {score.overlap_ratio:.0%}, penalty x{score.overlap_penalty:.2f})")
+    if score.received_fields is not None:
+        print("Judge afgebroken na diskwalificerende SDT-score (overige dimensies niet beoordeeld)")
+    if score.judge_count > 1:
+        print(f"Overall score: {score.overall_score:.2f} "
+              f"(± {score.overall_stderr:.3f}, {score.judge_count} judges)")
+    else:
+        print(f"Overall score: {score.overall_score:.2f}")
+
+
+def save_run_metadata(run_id: str, metadata: dict) -> Path:
+    """
+    Sla de metadata van een volledige run op (run.json naast de iteraties).
+    Returns: pad naar het opgeslagen bestand.
+    """
+    os.makedirs(ITERATIONS_DIR / run_id, exist_ok=True)
 
-    # Sorteer op score (beste eerst)
-    sorted_solutions = sorted(solutions, key=lambda x: x.score, reverse=True)
-    selected = sorted_solutions[:MAX_SOLUTIONS_IN_FEEDBACK]
+    metadata_file = ITERATIONS_DIR / run_id / "run.json"
+    with open(metadata_file, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2, ensure_ascii=False)
 
-    blocks = []
-    for i, sol in enumerate(selected, 1):
-        blocks.append(f"""--- Poging {i} (score: {sol.score:.2f}) ---
-Feedback: {sol.feedback}
-""")
+    return metadata_file
 
-    return "\n".join(blocks)
+
+def shorten_point(point: str, max_chars: int = FEEDBACK_DIGEST_POINT_CHARS) -> str:
+    """Kap een verbeterpunt af op het laatste zinseinde binnen max_chars."""
+    if len(point) <= max_chars:
+        return point
+    cut = point[:max_chars]
+    end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    return cut[:end + 1] if end > 0 else cut.rstrip() + "..."
+
+
+def digest_feedback(
+    solutions: list[Solution],
+    max_points: int = FEEDBACK_DIGEST_MAX_POINTS,
+) -> list[str]:
+    """
+    Voeg de feedback van eerdere pogingen samen tot één lijst verbeterpunten.
+    Elke feedbackregel is een punt; punten die (vrijwel) hetzelfde zeggen worden
+    samengevoegd. Prioriteit: som van (1 - score) over de pogingen die het punt
+    kregen, zodat terugkerende kritiek op zwakke pogingen bovenaan komt.
+    Returns: hoogstens max_points punten, belangrijkste eerst
+    """
+    # genormaliseerd -> [tekst, gewicht, aantal pogingen]
+    points: dict[str, list] = {}
+    for solution in solutions:
+        seen_here = set()
+        for line in solution.feedback.splitlines():
+            line = re.sub(r"^(Stilometrie|LLM feedback):\s*", "", line.strip())
+            if not line or line in NON_ACTIONABLE_FEEDBACK or line.endswith(": N/A"):
+                continue
+            normalized = normalize_learning(line)
+            key = next(
+                (
+                    known for known in points
+                    if known == normalized
+                    or difflib.SequenceMatcher(None, normalized, known).ratio() >= LEARNING_SIMILARITY
+                ),
+                normalized,
+            )
+            if key in seen_here:
+                continue
+            seen_here.add(key)
+            entry = points.setdefault(key, [line, 0.0, 0])
+            entry[1] += 1.0 - solution.score
+            entry[2] += 1
+
+    ranked = sorted(points.values(), key=lambda entry: entry[1], reverse=True)[:max_points]
+    return [
+        shorten_point(text) + (f" ({count}x)" if count > 1 else "")
+        for text, _, count in ranked
+    ]
 
 
 async def generate_sermon(
@@ -275,18 +394,20 @@ async def generate_sermon(
     Genereer een preek gegeven een Bijbeltekst.
     Returns: (sermon_text, used_prompt, input_tokens, output_tokens)
     """
-    current_prompt = system_prompt
-
-    # Voeg feedback toe als er eerdere pogingen zijn
+    # Feedback van eerdere pogingen gaat in de user message: het systeemprompt
+    # blijft zo byte-voor-byte gelijk over alle iteraties
+    feedback = ""
     if previous_solutions:
         # Selecteer random subset
         selected = [
             s for s in previous_solutions
             if random.random() < SELECTION_PROBABILITY
         ]
-        if selected:
-            feedback_block = create_feedback_block(selected)
-            current_prompt += FEEDBACK_ADDITION.format(feedback_block=feedback_block)
+        digest = digest_feedback(selected)
+        if digest:
+            feedback = FEEDBACK_ADDITION.format(
+                feedback_digest="\n".join(f"{i}. {point}" for i, point in enumerate(digest, 1))
+            )
 
     # Voeg voorbeelden van echte preken toe
     examples = ""
@@ -310,17 +431,17 @@ BIJBELTEKST: {scripture_text}
 CONTEXT: {scripture_context}
 {examples}
 
-Schrijf nu een volledige Jüngel-preek over deze tekst. Zorg dat de preek minimaal 10.000 karakters is."""
+Schrijf nu een volledige Jüngel-preek over deze tekst. Zorg dat de preek minimaal 10.000 karakters is.{feedback}"""
 
     response, input_tokens, output_tokens = await call_claude(
         model=GENERATOR_MODEL,
-        system_prompt=current_prompt,
+        system_prompt=system_prompt,
         user_message=user_message,
         temperature=GENERATOR_TEMPERATURE,
         max_tokens=GENERATOR_MAX_TOKENS,
     )
 
-    return response, current_prompt, input_tokens, output_tokens
+    return response, system_prompt, input_tokens, output_tokens
 
 
 async def generate_with_iteration(
@@ -332,6 +453,13 @@ async def generate_with_iteration(
     verbose: bool = True,
     save_best_prompt: bool = True,
     save_iterations: bool = True,
+    final_eval_top_k: int = FINAL_EVAL_TOP_K,
+    selection_mode: str = SELECTION_MODE,
+    candidates_per_iteration: int = CANDIDATES_PER_ITERATION,
+    surrogate_keep: int = SURROGATE_KEEP,
+    run_id: Optional[str] = None,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    start_version: Optional[int] = None,
 ) -> GeneratedSermon:
     """
     Genereer een preek met iteratieve verbetering.
@@ -341,22 +469,69 @@ async def generate_with_iteration(
     1. Laadt het beste beschikbare prompt als startpunt
     2. Evolueert het prompt op basis van feedback
     3. Slaat elke iteratie op naar disk (indien save_iterations=True)
-    4. Slaat het beste prompt op voor toekomstig gebruik
+    4. Kiest de winnaar: top-k herbeoordeeld met FINAL_EVAL_MODEL (selection_mode="cascade",
+       indien final_eval_top_k > 0) of via een paarsgewijs toernooi (selection_mode="pairwise")
+    5. Slaat het beste prompt op voor toekomstig gebruik
+
+    Met candidates_per_iteration > 1 worden per iteratie meerdere preken
+    gelijktijdig gegenereerd; een getraind surrogaat-model (surrogate.py)
+    laat daarvan alleen de surrogate_keep meest belovende door naar de judge.
+
+    on_progress wordt (synchroon) aangeroepen met een dict per gebeurtenis
+    ("start", "iteration", "score", "scoring_failed", "done"), bijv. voor de
+    voortgangs-events van server.py. run_id overschrijft de tijdstempel-ID,
+    zodat gelijktijdige runs elkaars iteratie-bestanden niet overschrijven.
+    start_version legt het startprompt vast (0 = basis prompt) in plaats van
+    het via get_best_prompt_for_evolution te kiezen, bijv. bij een herstarte job.
+    Met save_best_prompt=False schrijft de run niets naar de prompt-opslag: geen
+    prompt-versie, geen learnings-registry of effect-statistiek en geen condensatie.
     """
+    if selection_mode not in ("cascade", "pairwise"):
+        raise ValueError(f"Onbekende selectiemodus: {selection_mode}")
+
     solutions: list[Solution] = []
     best_result: Optional[GeneratedSermon] = None
     best_score = -1.0
-    best_prompt = ""
+    candidates: list[GeneratedSermon] = []
+    target_reached = False
     all_learnings: list[str] = []
 
     total_input_tokens = 0
     total_output_tokens = 0
 
-    # Unieke run ID voor deze sessie
-    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Judge-betrouwbaarheid: ongeldige responses en iteraties zonder geldige score
+    judge_parse_failures = 0
+    unscored_iterations = 0
+
+    # Iteraties op rij zonder verbetering buiten de judge-ruis
+    stalled_iterations = 0
+
+    # Kandidaten die het surrogaat niet naar de judge doorliet
+    surrogate_skipped = 0
 
-    # Laad het beste prompt als startpunt
-    base_prompt, parent_version = get_best_prompt_for_evolution()
+    # MinHash-signaturen van alle beoordeelde kandidaten (parallel aan `candidates`)
+    candidate_signatures = []
+    inherited_sermons = 0
+
+    # Unieke run ID voor deze sessie
+    run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def progress(event: str, **data):
+        if on_progress is not None:
+            on_progress({"event": event, "run_id": run_id, **data})
+
+    # Laad het beste prompt als startpunt (binnen het token-budget)
+    if start_version is None:
+        base_prompt, parent_version = get_best_prompt_for_evolution()
+    elif start_version == 0:
+        base_prompt, parent_version = BASE_SYSTEM_PROMPT, 0
+    else:
+        pinned = get_prompt(start_version)
+        if pinned is None:
+            raise ValueError(f"Onbekende prompt-versie: v{start_version}")
+        base_prompt, parent_version = pinned.system_prompt, pinned.version
+    # Zonder save_best_prompt (evaluatie, dry-run) blijven prompt-opslag en learnings-registry ongemoeid
+    base_prompt = await enforce_prompt_budget(base_prompt, verbose=verbose, persist=save_best_prompt)
 
     if verbose:
         stats = get_prompt_stats()
@@ -368,121 +543,319 @@ async def generate_with_iteration(
             print(f"Iteraties worden opgeslagen in: output/iterations/{run_id}/")
 
     current_prompt = base_prompt
+    progress("start", parent_version=parent_version)
 
+    iterations_run = 0
     for iteration in range(max_iterations):
+        iterations_run = iteration + 1
         if verbose:
             print(f"\n--- Iteratie {iteration + 1}/{max_iterations} ---")
+        progress("iteration", iteration=iteration + 1, max_iterations=max_iterations)
+
+        # Genereer kandidaat-preken (gelijktijdig bij candidates_per_iteration > 1)
+        drafts = await asyncio.gather(*(
+            generate_sermon(
+                scripture_text=scripture_text,
+                scripture_context=scripture_context,
+                reference_sermons=reference_sermons,
+                system_prompt=current_prompt,
+                previous_solutions=solutions if iteration > 0 else None,
+            )
+            for _ in range(candidates_per_iteration)
+        ))
+        for _, _, in_tok, out_tok in drafts:
+            total_input_tokens += in_tok
+            total_output_tokens += out_tok
+
+        # Near-duplicates (binnen de run): alleen één representant per cluster gaat naar de judge
+        draft_signatures = [minhash_signature(d[0]) for d in drafts]
+        representatives = cluster_signatures(candidate_signatures + draft_signatures)
+        offset = len(candidate_signatures)
+        to_judge = [k for k in range(len(drafts)) if representatives[offset + k] == offset + k]
+        duplicates = {
+            k: representatives[offset + k] for k in range(len(drafts)) if k not in to_judge
+        }
+        if duplicates and verbose:
+            print(f"Near-duplicates: {len(duplicates)} kandidaat/kandidaten niet opnieuw beoordeeld")
+
+        # Lokale voorselectie: alleen de meest belovende kandidaten gaan naar de betaalde judge
+        if len(to_judge) > surrogate_keep:
+            kept = surrogate_prerank([drafts[k][0] for k in to_judge], keep=surrogate_keep)
+            if kept is not None:
+                surrogate_skipped += len(to_judge) - len(kept)
+                if verbose:
+                    print(f"Surrogaat: {len(kept)} van {len(to_judge)} kandidaten naar de judge")
+                to_judge = [to_judge[k] for k in kept]
+
+        # Score de kandidaten
+        results = await asyncio.gather(*(
+            compute_full_score(
+                generated_sermon=drafts[k][0],
+                scripture_text=scripture_text,
+                reference_sermons=reference_sermons,
+            )
+            for k in to_judge
+        ), return_exceptions=True)
+
+        previous_best = best_result
+        iteration_results: list[GeneratedSermon] = []
+        judged: dict[int, GeneratedSermon] = {}
+        for k, score in zip(to_judge, results):
+            sermon_text, used_prompt, _, _ = drafts[k]
+            if isinstance(score, ScoringError):
+                # Geen nep-score verzinnen: deze kandidaat telt niet mee voor selectie of evolutie
+                judge_parse_failures += score.parse_failures
+                unscored_iterations += 1
+                if verbose:
+                    print(f"Scoring mislukt ({score}); kandidaat wordt overgeslagen.")
+                progress("scoring_failed", iteration=iteration + 1, candidate=k + 1, error=str(score))
+                continue
+            if isinstance(score, BaseException):
+                raise score
+            judge_parse_failures += score.parse_failures
 
-        # Genereer preek
-        sermon_text, used_prompt, in_tok, out_tok = await generate_sermon(
-            scripture_text=scripture_text,
-            scripture_context=scripture_context,
-            reference_sermons=reference_sermons,
-            system_prompt=current_prompt,
-            previous_solutions=solutions if iteration > 0 else None,
-        )
-        total_input_tokens += in_tok
-        total_output_tokens += out_tok
-
-        # Score de preek
-        score = await compute_full_score(
-            generated_sermon=sermon_text,
-            scripture_text=scripture_text,
-            reference_sermons=reference_sermons,
-        )
-
-        if verbose:
-            print(f"Lengte: {len(sermon_text)} karakters")
-            print(f"Stilometrische score: {score.stylometric_score:.2f}")
-            print(f"Theologie (Kreuzestheologie): {score.theological_score:.2f}")
-            print(f"Metaforische Waarheid: {score.metaphorical_score:.2f}")
-            print(f"Haben→Sein Transformatie: {score.transformation_score:.2f}")
-            print(f"Retorische score: {score.rhetorical_score:.2f}")
-            print(f"Coherentie score: {score.coherence_score:.2f}")
-            print(f"Taal score: {score.language_score:.2f}")
-            print(f"Flow score: {score.flow_score:.2f}")
-            print(f"Humor score: {score.humor_score:.2f}")
-            print(f"Show Don't Tell multiplier: {score.sdt_score:.2f}")
-            print(f"Overall score: {score.overall_score:.2f}")
-
-        result = GeneratedSermon(
-            text=sermon_text,
-            score=score,
-            iteration=iteration + 1,
-            input_tokens=total_input_tokens,
-            output_tokens=total_output_tokens,
-            final_prompt=used_prompt,
-            prompt_version=parent_version,
-        )
-
-        # Update beste resultaat
-        is_new_best = score.overall_score > best_score
-        if is_new_best:
-            best_score = score.overall_score
-            best_result = result
-            best_prompt = used_prompt
             if verbose:
-                print(f"Nieuwe beste score: {best_score:.2f}")
+                if len(drafts) > 1:
+                    print(f"\n[Kandidaat {k + 1}]")
+                print_score(score, len(sermon_text))
 
-        # Sla iteratie op naar disk
-        if save_iterations:
-            saved_path = save_iteration(
-                run_id=run_id,
-                iteration=iteration + 1,
-                sermon_text=sermon_text,
+            result = GeneratedSermon(
+                text=sermon_text,
                 score=score,
-                prompt=used_prompt,
-                is_best=is_new_best,
+                iteration=iteration + 1,
+                input_tokens=total_input_tokens,
+                output_tokens=total_output_tokens,
+                final_prompt=used_prompt,
+                prompt_version=parent_version,
+                candidate=k + 1,
             )
-            if verbose:
-                print(f"Opgeslagen: {saved_path.name}")
-
-        # Check of target bereikt
-        if score.overall_score >= target_score:
-            if verbose:
-                print(f"Target score {target_score} bereikt!")
-
-            # Sla het succesvolle prompt op
-            if save_best_prompt:
-                stored = store_prompt(
-                    system_prompt=used_prompt,
-                    score=score.overall_score,
-                    scripture_text=scripture_text,
+            candidates.append(result)
+            candidate_signatures.append(draft_signatures[k])
+            iteration_results.append(result)
+            judged[k] = result
+
+            # Update beste resultaat
+            is_new_best = score.overall_score > best_score
+            if is_new_best:
+                best_score = score.overall_score
+                best_result = result
+                if verbose:
+                    print(f"Nieuwe beste score: {best_score:.2f}")
+            progress("score", iteration=iteration + 1, candidate=k + 1, is_best=is_new_best, score=asdict(score))
+
+            # Sla iteratie op naar disk
+            if save_iterations:
+                saved_path = save_iteration(
+                    run_id=run_id,
+                    iteration=iteration + 1,
+                    sermon_text=sermon_text,
+                    score=score,
+                    prompt=used_prompt,
+                    is_best=is_new_best,
+                    candidate=k + 1 if candidates_per_iteration > 1 else None,
+                )
+                if verbose:
+                    print(f"Opgeslagen: {saved_path.name}")
+
+        # Duplicaten erven de score van hun representant (een eerdere of een zojuist beoordeelde kandidaat)
+        inherited_results: list[GeneratedSermon] = []
+        for k, representative in duplicates.items():
+            if representative < offset:
+                source = candidates[representative]
+            else:
+                source = judged.get(representative - offset)
+            if source is None:
+                continue
+            inherited_sermons += 1
+            inherited_results.append(source)
+            if save_iterations:
+                save_iteration(
+                    run_id=run_id,
                     iteration=iteration + 1,
-                    tokens_used=total_input_tokens + total_output_tokens,
-                    parent_version=parent_version if parent_version > 0 else None,
-                    improvements=all_learnings if all_learnings else None,
+                    sermon_text=drafts[k][0],
+                    score=replace(source.score, inherited=True),
+                    prompt=drafts[k][1],
+                    candidate=k + 1 if candidates_per_iteration > 1 else None,
                 )
-                result.prompt_version = stored.version
 
-            return result
+        if not iteration_results:
+            # Alleen near-duplicates: de geërfde feedback gaat mee naar de volgende poging,
+            # en de iteratie telt als stagnatie (anders blijft de loop hetzelfde concept maken)
+            if inherited_results:
+                for source in inherited_results:
+                    solutions.append(Solution(
+                        sermon=source.text,
+                        feedback=(
+                            f"Stilometrie: {source.score.stylometric_feedback}\n"
+                            f"LLM feedback: {source.score.llm_feedback}\n"
+                            f"{NEAR_DUPLICATE_FEEDBACK}"
+                        ),
+                        score=source.score.overall_score,
+                    ))
+                stalled_iterations += 1
+                if stalled_iterations >= EARLY_STOP_PATIENCE:
+                    if verbose:
+                        print(f"Geen nieuwe preek in {stalled_iterations} iteraties; gestopt.")
+                    break
+            continue
+
+        # De beste kandidaat van deze iteratie stuurt target-check, feedback en evolutie
+        iteration_best = max(iteration_results, key=lambda r: r.score.overall_score)
+        score = iteration_best.score
+
+        # Telt deze iteratie als echte vooruitgang, of valt het verschil binnen de ruis?
+        significant_gain = previous_best is None or (
+            score.overall_score > previous_best.score.overall_score
+            and scores_differ(score, previous_best.score)
+        )
+
+        # Check of target bereikt; met een ensemble moet ook de ondergrens (score - 1 SE) het halen
+        if score.overall_score - score.overall_stderr >= target_score:
+            if verbose:
+                print(f"Target score {target_score} bereikt!")
+            target_reached = True
+            break
 
         # Voeg toe aan solutions voor feedback
+        for result in iteration_results:
+            solutions.append(Solution(
+                sermon=result.text,
+                feedback=(
+                    f"Stilometrie: {result.score.stylometric_feedback}\n"
+                    f"LLM feedback: {result.score.llm_feedback}"
+                ),
+                score=result.score.overall_score,
+            ))
+
+        # Extraheer learnings en evolueer het prompt
         combined_feedback = (
             f"Stilometrie: {score.stylometric_feedback}\n"
             f"LLM feedback: {score.llm_feedback}"
         )
-        solutions.append(Solution(
-            sermon=sermon_text,
-            feedback=combined_feedback,
-            score=score.overall_score,
-        ))
-
-        # Extraheer learnings en evolueer het prompt
-        new_learnings = extract_learnings_from_feedback(combined_feedback, score.overall_score)
+        new_learnings = [
+            learning
+            for learning in register_learnings(
+                extract_learnings_from_feedback(combined_feedback, score.overall_score),
+                persist=save_best_prompt,
+            )
+            if learning not in all_learnings
+        ]
         if new_learnings:
             all_learnings.extend(new_learnings)
             current_prompt = evolve_prompt(base_prompt, all_learnings)
             if verbose:
                 print(f"Prompt geëvolueerd met {len(new_learnings)} nieuwe inzichten")
 
-    if verbose:
-        print(f"\nMax iteraties bereikt. Beste score: {best_score:.2f}")
+        # Vroegtijdig stoppen als verschillen binnen de judge-ruis blijven (alleen met variantie-schatting)
+        if score.judge_count > 1 and not significant_gain:
+            stalled_iterations += 1
+            if stalled_iterations >= EARLY_STOP_PATIENCE:
+                if verbose:
+                    print(f"Geen verbetering buiten de judge-ruis in {stalled_iterations} iteraties; gestopt.")
+                break
+        else:
+            stalled_iterations = 0
+
+    if verbose and not target_reached:
+        if iterations_run == max_iterations:
+            print(f"\nMax iteraties bereikt. Beste score: {best_score:.2f}")
+        else:
+            print(f"\nGestopt na {iterations_run} iteraties. Beste score: {best_score:.2f}")
+
+    run_metadata = {
+        "scripture_text": scripture_text,
+        "parent_version": parent_version,
+        "iterations": iterations_run,
+        "target_reached": target_reached,
+        "input_tokens": total_input_tokens,
+        "output_tokens": total_output_tokens,
+        "judge_parse_failures": judge_parse_failures,
+        "unscored_iterations": unscored_iterations,
+        "candidates_per_iteration": candidates_per_iteration,
+        "surrogate_skipped": surrogate_skipped,
+        "inherited_scores": inherited_sermons,
+    }
+
+    if best_result is None:
+        if save_iterations:
+            save_run_metadata(run_id, run_metadata)
+        raise ScoringError(
+            f"Geen enkele iteratie leverde een geldige score op ({judge_parse_failures} ongeldige responses)",
+            parse_failures=judge_parse_failures,
+        )
+
+    if selection_mode == "pairwise" and len(candidates) > 1:
+        # Toernooi: paarsgewijze vergelijkingen, gerangschikt met Bradley-Terry
+        if verbose:
+            print(f"\nToernooi-selectie over {len(candidates)} kandidaten...")
+        ranking, comparisons = await tournament_rank(
+            sermons=[c.text for c in candidates],
+            scripture_text=scripture_text,
+            initial_order=rank_candidates([c.score for c in candidates]),
+        )
+        best_result = candidates[ranking[0][0]]
+        best_score = best_result.score.overall_score
+        run_metadata["pairwise_comparisons"] = comparisons
+        run_metadata["pairwise_ranking"] = [
+            {
+                "iteration": candidates[i].iteration,
+                "candidate": candidates[i].candidate,
+                "strength": strength,
+                "cheap_score": candidates[i].score.overall_score,
+            }
+            for i, strength in ranking
+        ]
+        if verbose:
+            print(f"Winnaar na {comparisons} vergelijkingen: iteratie {best_result.iteration} "
+                  f"(score: {best_score:.2f})")
+        if save_iterations:
+            save_best_sermon(run_id, best_result.iteration, best_result.text, best_result.score)
+
+    # Cascade: alleen de top-k kandidaten worden herbeoordeeld door FINAL_EVAL_MODEL
+    elif selection_mode == "cascade" and final_eval_top_k > 0:
+        if verbose:
+            top_k = min(final_eval_top_k, len(candidates))
+            print(f"\nFinale evaluatie van top-{top_k} kandidaten met {FINAL_EVAL_MODEL}...")
+        final_scores = await rejudge_top_candidates(
+            sermons=[c.text for c in candidates],
+            scores=[c.score for c in candidates],
+            scripture_text=scripture_text,
+            reference_sermons=reference_sermons,
+            top_k=final_eval_top_k,
+        )
+        if final_scores:
+            winner = max(final_scores, key=lambda i: final_scores[i].overall_score)
+            best_result = replace(candidates[winner], score=final_scores[winner])
+            # Opslag en effect-attributie blijven op de schaal van de goedkope judge (net als
+            # de parent-scores); de finale score staat apart in run.json
+            best_score = candidates[winner].score.overall_score
+            run_metadata["final_eval_model"] = FINAL_EVAL_MODEL
+            run_metadata["final_score"] = final_scores[winner].overall_score
+            run_metadata["final_selection"] = [
+                {
+                    "iteration": candidates[i].iteration,
+                    "candidate": candidates[i].candidate,
+                    "cheap_score": candidates[i].score.overall_score,
+                    "final_score": final_scores[i].overall_score,
+                }
+                for i in final_scores
+            ]
+            if verbose:
+                for entry in run_metadata["final_selection"]:
+                    print(f"Iteratie {entry['iteration']}: {entry['cheap_score']:.2f} -> {entry['final_score']:.2f}")
+                print(f"Winnaar: iteratie {best_result.iteration} (finale score: {best_result.score.overall_score:.2f})")
+            if save_iterations:
+                save_best_sermon(run_id, best_result.iteration, best_result.text, best_result.score)
+
+    # Effect-attributie: hoeveel scoorde deze run boven het parent-prompt, met welke learnings?
+    parent = get_prompt(parent_version) if parent_version > 0 else None
+    if parent is not None and save_best_prompt:
+        record_learning_outcome(prompt_learnings(best_result.final_prompt), best_score - parent.score)
 
     # Sla het beste prompt op
-    if save_best_prompt and best_result:
+    if save_best_prompt:
         stored = store_prompt(
-            system_prompt=best_prompt,
+            system_prompt=best_result.final_prompt,
             score=best_score,
             scripture_text=scripture_text,
             iteration=best_result.iteration,
@@ -492,4 +865,19 @@ async def generate_with_iteration(
         )
         best_result.prompt_version = stored.version
 
-    return best_result or result
+    if save_iterations:
+        run_metadata.update({
+            "prompt_version": best_result.prompt_version,
+            "best_iteration": best_result.iteration,
+            "best_score": best_score,
+        })
+        save_run_metadata(run_id, run_metadata)
+
+    progress(
+        "done",
+        best_score=best_score,
+        best_iteration=best_result.iteration,
+        iterations=iterations_run,
+        prompt_version=best_result.prompt_version,
+    )
+    return best_result
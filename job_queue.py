@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+
+"""
+Duurzame job-wachtrij (SQLite) met een pool van worker-processen, voor grote backfills.
+Elke worker is een eigen proces met een eigen event loop en voert één job tegelijk uit.
+Een job wordt geclaimd met een lease die de worker met een heartbeat verlengt; verloopt
+de lease (worker gecrasht of vastgelopen), dan neemt een andere worker de job over.
+Mislukte jobs worden met backoff opnieuw geprobeerd en na JOB_MAX_ATTEMPTS pogingen
+als "dead" geparkeerd.
+
+Betaalde API-calls van een job worden in een journal vastgelegd (zie llm.py). Een
+herstarte job draait met dezelfde seed en hetzelfde startprompt, zodat dezelfde calls
+uit het journal komen in plaats van opnieuw betaald te worden. Ongeldige judge-responses
+worden niet vastgelegd, zodat een herstart ze opnieuw aanvraagt.
+
+Resultaten komen in de gewone output-indeling: output/iterations/jobNNNNN/.
+
+Gebruik:
+    python job_queue.py submit "Johannes 3:16" --context-file tekst.txt [--max-iterations 3]
+    python job_queue.py submit-file backfill.jsonl
+    python job_queue.py work [--workers 4] [--drain]
+    python job_queue.py status
+    python job_queue.py retry-dead [--drop-journal]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import sys
+import time
+import traceback
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import (
+    JOB_QUEUE_WORKERS,
+    JOB_LEASE_SECONDS,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_RETRY_BACKOFF_SECONDS,
+    JOB_POLL_SECONDS,
+    JOB_OPTIONS,
+    MAX_ITERATIONS,
+)
+
+JOB_QUEUE_DB_FILE = Path(__file__).parent / "output" / "job_queue.sqlite3"
+
+# Hoe vaak een gecrashte worker herstart wordt voordat de pool hem opgeeft
+MAX_WORKER_RESTARTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    scripture_text TEXT NOT NULL,
+    scripture_context TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,              -- Vroegste claim-moment (backoff na een fout)
+    lease_owner TEXT,
+    lease_expires REAL,
+    start_version INTEGER,                   -- Startprompt, vastgelegd bij de eerste claim
+    result TEXT,
+    error TEXT,
+    created TEXT NOT NULL,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, available_at);
+CREATE TABLE IF NOT EXISTS call_journal (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    call_key TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created TEXT NOT NULL,
+    PRIMARY KEY (job_id, call_key)
+);
+"""
+
+
+def connect() -> sqlite3.Connection:
+    """Open de wachtrij (WAL: workers lezen zonder elkaar te blokkeren)."""
+    os.makedirs(JOB_QUEUE_DB_FILE.parent, exist_ok=True)
+    # isolation_level=None: transacties expliciet met BEGIN IMMEDIATE
+    conn = sqlite3.connect(JOB_QUEUE_DB_FILE, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def parse_job_options(options: dict) -> dict:
+    """
+    Controleer type en bereik van job-opties (zie JOB_OPTIONS in config.py).
+    Raises: ValueError bij een onbekende, ongeldige of te grote optie
+    """
+    unknown = set(options) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError(f"Onbekende job-opties: {', '.join(sorted(unknown))}")
+    parsed = {}
+    for name, value in options.items():
+        kind, low, high = JOB_OPTIONS[name]
+        try:
+            parsed[name] = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} moet een {kind.__name__} zijn")
+        if not low <= parsed[name] <= high:
+            raise ValueError(f"{name} moet tussen {low} en {high} liggen")
+    return parsed
+
+
+def submit_job(conn: sqlite3.Connection, scripture_text: str, scripture_context: str, options: Optional[dict] = None) -> int:
+    """Zet een generatie-job in de wachtrij. Returns: job-ID"""
+    options = parse_job_options(options or {})
+    cursor = conn.execute(
+        "INSERT INTO jobs (scripture_text, scripture_context, options, available_at, created) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (scripture_text, scripture_context, json.dumps(options), time.time(), datetime.now().isoformat()),
+    )
+    return cursor.lastrowid
+
+
+def claim_job(conn: sqlite3.Connection, owner: str) -> Optional[sqlite3.Row]:
+    """
+    Claim de oudste beschikbare job: een wachtende job, of een lopende job
+    waarvan de lease verlopen is (de vorige worker is weg).
+    Een verlopen job zonder pogingen over gaat naar "dead".
+    """
+    while True:
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, status, attempts FROM jobs "
+            "WHERE (status = 'pending' AND available_at <= ?) OR (status = 'running' AND lease_expires < ?) "
+            "ORDER BY id LIMIT 1",
+            (now, now),
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        if row["status"] == "running" and row["attempts"] >= JOB_MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', lease_owner = NULL, finished = ?, "
+                "error = COALESCE(error, 'Lease verlopen tijdens de laatste poging') WHERE id = ?",
+                (datetime.now().isoformat(), row["id"]),
+            )
+            conn.execute("COMMIT")
+            continue
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_owner = ?, lease_expires = ? "
+            "WHERE id = ?",
+            (owner, now + JOB_LEASE_SECONDS, row["id"]),
+        )
+        conn.execute("COMMIT")
+        return conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+
+
+def renew_lease(conn: sqlite3.Connection, job_id: int, owner: str) -> bool:
+    """Heartbeat: verleng de lease. False als de job niet meer van deze worker is."""
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (time.time() + JOB_LEASE_SECONDS, job_id, owner),
+    )
+    return cursor.rowcount == 1
+
+
+def complete_job(conn: sqlite3.Connection, job_id: int, owner: str, result: dict) -> bool:
+    """Markeer een job als klaar (alleen door de huidige lease-houder)."""
+    cursor = conn.execute(
+        "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, finished = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (json.dumps(result, ensure_ascii=False), datetime.now().isoformat(), job_id, owner),
+    )
+    return cursor.rowcount == 1
+
+
+def fail_job(conn: sqlite3.Connection, job_id: int, owner: str, attempts: int, error: str):
+    """Plan een nieuwe poging met exponentiële backoff, of parkeer de job als dead."""
+    if attempts >= JOB_MAX_ATTEMPTS:
+        conn.execute(
+            "UPDATE jobs SET status = 'dead', error = ?, lease_owner = NULL, finished = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (error, datetime.now().isoformat(), job_id, owner),
+        )
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = 'pending', error = ?, lease_owner = NULL, lease_expires = NULL, "
+            "available_at = ? WHERE id = ? AND lease_owner = ?",
+            (error, time.time() + JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1), job_id, owner),
+        )
+
+
+def pin_start_version(conn: sqlite3.Connection, job_id: int) -> int:
+    """
+    Leg bij de eerste claim het startprompt vast (bandit-keuze, 0 = basis prompt),
+    zodat een herstarte job met precies hetzelfde prompt begint.
+    """
+    from prompt_store import select_prompt_version
+
+    conn.execute(
+        "UPDATE jobs SET start_version = ? WHERE id = ? AND start_version IS NULL",
+        (select_prompt_version() or 0, job_id),
+    )
+    return conn.execute("SELECT start_version FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+class CallJournal:
+    """
+    Journal van de API-calls van één job (voor llm.use_call_journal).
+    Een sleutel is de hash van de request plus het volgnummer van die identieke
+    request binnen deze poging, zodat bijv. meerdere ensemble-judges met hetzelfde
+    prompt elk hun eigen vastgelegde antwoord terugkrijgen.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, job_id: int):
+        self.conn = conn
+        self.job_id = job_id
+        self.occurrences: dict[str, int] = {}
+        self.replayed = 0
+        self.recorded = 0
+
+    def key(self, kind: str, request: dict) -> str:
+        digest = hashlib.sha256(
+            json.dumps([kind, request], sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        n = self.occurrences.get(digest, 0)
+        self.occurrences[digest] = n + 1
+        return f"{digest}:{n}"
+
+    def get(self, key: str) -> Optional[list]:
+        row = self.conn.execute(
+            "SELECT result FROM call_journal WHERE job_id = ? AND call_key = ?", (self.job_id, key)
+        ).fetchone()
+        if row is None:
+            return None
+        self.replayed += 1
+        return json.loads(row["result"])
+
+    def put(self, key: str, result: list):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO call_journal (job_id, call_key, result, created) VALUES (?, ?, ?, ?)",
+            (self.job_id, key, json.dumps(result, ensure_ascii=False), datetime.now().isoformat()),
+        )
+        self.recorded += 1
+
+
+async def run_job(conn: sqlite3.Connection, job: sqlite3.Row, owner: str, reference_sermons: list[str]):
+    """Voer een geclaimde job uit en houd intussen de lease vast."""
+    from generator import generate_with_iteration
+    from llm import reset_call_journal, use_call_journal
+
+    job_id = job["id"]
+    options = json.loads(job["options"])
+    start_version = job["start_version"]
+    if start_version is None:
+        start_version = pin_start_version(conn, job_id)
+    print(f"[{owner}] job {job_id} ({job['scripture_text']}), poging {job['attempts']}, prompt v{start_version}")
+
+    # Zelfde seed bij elke poging: de willekeurige keuzes (voorbeeldpreken,
+    # feedback-selectie) en dus de API-requests herhalen zich exact
+    random.seed(f"job-{job_id}")
+    journal = CallJournal(conn, job_id)
+    token = use_call_journal(journal)
+    try:
+        task = asyncio.create_task(generate_with_iteration(
+            scripture_text=job["scripture_text"],
+            scripture_context=job["scripture_context"],
+            reference_sermons=reference_sermons,
+            max_iterations=options.get("max_iterations", MAX_ITERATIONS),
+            target_score=options.get("target_score", 0.85),
+            candidates_per_iteration=options.get("candidates_per_iteration", 1),
+            verbose=False,
+            run_id=f"job{job_id:05d}",
+            start_version=start_version,
+        ))
+    finally:
+        reset_call_journal(token)
+
+    while not task.done():
+        await asyncio.wait({task}, timeout=JOB_HEARTBEAT_SECONDS)
+        if not task.done() and not renew_lease(conn, job_id, owner):
+            # Een andere worker heeft de job overgenomen: stoppen, niet dubbel betalen
+            task.cancel()
+            print(f"[{owner}] lease op job {job_id} kwijt; afgebroken")
+            return
+
+    try:
+        result = task.result()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        fail_job(conn, job_id, owner, job["attempts"], error)
+        print(f"[{owner}] job {job_id} mislukt: {error}")
+        return
+
+    complete_job(conn, job_id, owner, {
+        "run_id": f"job{job_id:05d}",
+        "score": result.score.overall_score,
+        "iteration": result.iteration,
+        "prompt_version": result.prompt_version,
+        "input_tokens": result.input_tokens,
+        "output_tokens": result.output_tokens,
+        "replayed_calls": journal.replayed,
+        "paid_calls": journal.recorded,
+    })
+    print(f"[{owner}] job {job_id} klaar: score {result.score.overall_score:.2f} "
+          f"({journal.recorded} betaalde calls, {journal.replayed} uit het journal)")
+
+
+async def worker_loop(owner: str, drain: bool = False):
+    """Claim en voer jobs uit; met drain stopt de worker zodra er niets te claimen valt."""
+    from corpus import load_corpus
+
+    reference_sermons = [sermon["tekst"] for sermon in load_corpus().records()]
+    with closing(connect()) as conn:
+        while True:
+            job = claim_job(conn, owner)
+            if job is None:
+                if drain:
+                    return
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+            await run_job(conn, job, owner, reference_sermons)
+
+
+def worker_process(index: int, drain: bool):
+    """Entry point van een worker-proces: eigen event loop, eigen database-verbinding."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    try:
+        asyncio.run(worker_loop(owner, drain))
+    except KeyboardInterrupt:
+        # De lease verloopt vanzelf; een andere worker neemt de job over
+        pass
+    except Exception:
+        print(f"[{owner}] worker gestopt door een fout:\n{traceback.format_exc()}")
+        sys.exit(1)
+
+
+def warm_caches():
+    """
+    Bouw de gedeelde caches één keer in het hoofdproces, zodat de workers ze
+    alleen lezen (het citatieprofiel erven ze bij fork direct mee).
+    """
+    from citations import get_citation_profile
+    from corpus import load_corpus
+
+    load_corpus()
+    get_citation_profile()
+
+
+def run_workers(count: int = JOB_QUEUE_WORKERS, drain: bool = False) -> int:
+    """
+    Start `count` worker-processen en wacht tot ze stoppen. Een gecrashte worker
+    wordt tot MAX_WORKER_RESTARTS keer herstart. Returns: exit-code (1 als een worker
+    definitief uitviel)
+    """
+    warm_caches()
+
+    def start(index: int) -> multiprocessing.Process:
+        process = multiprocessing.Process(target=worker_process, args=(index, drain), name=f"worker-{index}")
+        process.start()
+        return process
+
+    processes = {index: start(index) for index in range(count)}
+    restarts = dict.fromkeys(processes, 0)
+    failed = False
+    print(f"{count} workers gestart (wachtrij: {JOB_QUEUE_DB_FILE})")
+    try:
+        while processes:
+            for index, process in list(processes.items()):
+                process.join(timeout=1)
+                if process.is_alive():
+                    continue
+                del processes[index]
+                if process.exitcode == 0:
+                    continue
+                if restarts[index] < MAX_WORKER_RESTARTS:
+                    restarts[index] += 1
+                    print(f"worker-{index} uitgevallen (exit-code {process.exitcode}); "
+                          f"herstart {restarts[index]}/{MAX_WORKER_RESTARTS}")
+                    processes[index] = start(index)
+                else:
+                    print(f"worker-{index} uitgevallen (exit-code {process.exitcode}); niet meer herstart")
+                    failed = True
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+    return 1 if failed else 0
+
+
+def print_status(conn: sqlite3.Connection):
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    print(" | ".join(f"{status}: {counts.get(status, 0)}" for status in ("pending", "running", "done", "dead")))
+    journal = conn.execute("SELECT COUNT(*) FROM call_journal").fetchone()[0]
+    print(f"Vastgelegde API-calls: {journal}")
+    for row in conn.execute("SELECT id, scripture_text, attempts, error FROM jobs WHERE status = 'dead' ORDER BY id"):
+        print(f"  dead #{row['id']} {row['scripture_text']} ({row['attempts']} pogingen): {row['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duurzame job-wachtrij voor preek-generatie")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = subparsers.add_parser("submit", help="Zet één job in de wachtrij")
+    submit_parser.add_argument("scripture_text")
+    submit_parser.add_argument("--context", default="", help="De Bijbeltekst zelf")
+    submit_parser.add_argument("--context-file", type=Path, help="Lees de Bijbeltekst uit een bestand")
+    submit_parser.add_argument("--max-iterations", type=int)
+    submit_parser.add_argument("--target-score", type=float)
+    submit_parser.add_argument("--candidates-per-iteration", type=int)
+
+    file_parser = subparsers.add_parser("submit-file", help="Zet jobs uit een JSONL-bestand in de wachtrij")
+    file_parser.add_argument("path", type=Path, help='Per regel {"scripture_text", "scripture_context", "options"?}')
+
+    work_parser = subparsers.add_parser("work", help="Start de worker-pool")
+    work_parser.add_argument("--workers", type=int, default=JOB_QUEUE_WORKERS)
+    work_parser.add_argument("--drain", action="store_true", help="Stop zodra de wachtrij leeg is")
+
+    subparsers.add_parser("status", help="Toon de toestand van de wachtrij")
+    retry_parser = subparsers.add_parser("retry-dead", help="Zet alle dead jobs terug in de wachtrij")
+    retry_parser.add_argument("--drop-journal", action="store_true",
+                              help="Gooi de vastgelegde API-calls weg: de jobs beginnen volledig opnieuw")
+
+    args = parser.parse_args()
+
+    if args.command == "work":
+        sys.exit(run_workers(args.workers, args.drain))
+
+    with closing(connect()) as conn:
+        if args.command == "submit":
+            context = args.context_file.read_text(encoding="utf-8").strip() if args.context_file else args.context
+            options = {
+                name: getattr(args, name)
+                for name in JOB_OPTIONS
+                if getattr(args, name) is not None
+            }
+            try:
+                job_id = submit_job(conn, args.scripture_text, context, options)
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"Job {job_id} in de wachtrij")
+
+        elif args.command == "submit-file":
+            conn.execute("BEGIN IMMEDIATE")
+            count = 0
+            with open(args.path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if line.strip():
+                        job = json.loads(line)
+                        try:
+                            submit_job(conn, job["scripture_text"], job.get("scripture_context", ""), job.get("options"))
+                        except ValueError as e:
+                            # De transactie wordt niet gecommit: geen enkele job uit het bestand komt erin
+                            parser.error(f"{args.path}:{line_number}: {e}")
+                        count += 1
+            conn.execute("COMMIT")
+            print(f"{count} jobs in de wachtrij")
+
+        elif args.command == "status":
+            print_status(conn)
+
+        elif args.command == "retry-dead":
+            conn.execute("BEGIN IMMEDIATE")
+            if args.drop_journal:
+                dropped = conn.execute(
+                    "DELETE FROM call_journal WHERE job_id IN (SELECT id FROM jobs WHERE status = 'dead')"
+                ).rowcount
+                print(f"{dropped} vastgelegde API-calls verwijderd")
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, available_at = ?, finished = NULL "
+                "WHERE status = 'dead'",
+                (time.time(),),
+            )
+            conn.execute("COMMIT")
+            print(f"{cursor.rowcount} jobs opnieuw in de wachtrij")
+
+
+if __name__ == "__main__":
+    main()
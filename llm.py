@@ -2,44 +2,89 @@
 LLM interface voor Claude API calls.
 """
 import asyncio
-from typing import Optional
+import json
+import os
+from contextvars import ContextVar
+from typing import Callable, Optional
 
-import anthropic
+from config import MAX_CONCURRENT_CALLS
 
-from config import ANTHROPIC_API_KEY
+# SDK en client worden pas bij de eerste API-call geladen, zodat read-only
+# commando's (prompt-geschiedenis, statistieken) snel starten
+_client = None
 
 
-client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+def get_client():
+    """De gedeelde AsyncAnthropic client (bij de eerste aanroep aangemaakt)."""
+    global _client
+    if _client is None:
+        import anthropic
+        from dotenv import load_dotenv
 
+        load_dotenv()
+        _client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    return _client
 
-async def call_claude(
-    model: str,
-    system_prompt: str,
-    user_message: str,
-    temperature: float = 0.7,
-    max_tokens: int = 4096,
-    retries: int = 5,
-) -> tuple[str, int, int]:
+# Begrenst het aantal gelijktijdige API-calls (bijv. bij ensemble-scoring)
+_call_slots = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+
+# Journal van betaalde API-calls van de lopende job (zie job_queue.py): bij een
+# herstart van de job komen identieke calls uit het journal in plaats van de API
+_call_journal: ContextVar = ContextVar("call_journal", default=None)
+
+
+def use_call_journal(journal):
     """
-    Roep Claude API aan.
-    Returns: (response_text, input_tokens, output_tokens)
+    Laat de API-calls in de huidige context (en de taken die eruit ontstaan) via `journal` lopen.
+    `journal` biedt key(kind, request) -> sleutel, get(sleutel) -> Optional[list] en put(sleutel, list).
+    Returns: token voor reset_call_journal
+    """
+    return _call_journal.set(journal)
+
+
+def reset_call_journal(token):
+    _call_journal.reset(token)
+
+
+async def _journaled(kind: str, request: dict, call, keep: Optional[Callable[[tuple], bool]] = None) -> tuple:
+    """
+    Voer `call` uit, of geef het eerder vastgelegde resultaat van dezelfde call terug.
+    Een resultaat waarvoor keep() False geeft (bijv. een ongeldige judge-response) wordt
+    niet vastgelegd: een herstarte job vraagt het opnieuw aan in plaats van dezelfde fout na te spelen.
+    """
+    journal = _call_journal.get()
+    if journal is None:
+        return await call()
+    key = journal.key(kind, request)
+    recorded = journal.get(key)
+    if recorded is not None:
+        return tuple(recorded)
+    result = await call()
+    if keep is None or keep(result):
+        journal.put(key, list(result))
+    return result
+
+
+async def _create_message(retries: int, **kwargs):
+    """
+    Voer een messages.create aanroep uit met retry-logica.
+    Returns: het volledige response object.
+    """
+    return await _with_retries(retries, lambda: get_client().messages.create(**kwargs))
+
+
+async def _with_retries(retries: int, make_call):
+    """
+    Voer een API-aanroep uit met retry-logica.
+    `make_call` maakt per poging een nieuwe coroutine aan.
     """
+    import anthropic
+
     attempt = 0
     while attempt < retries:
         try:
-            response = await client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_message}],
-            )
-
-            text = response.content[0].text
-            input_tokens = response.usage.input_tokens
-            output_tokens = response.usage.output_tokens
-
-            return text, input_tokens, output_tokens
+            async with _call_slots:
+                return await make_call()
 
         except anthropic.RateLimitError as e:
             attempt += 1
@@ -67,3 +112,183 @@ async def call_claude(
             await asyncio.sleep(wait_time)
 
     raise RuntimeError("Max retries exceeded")
+
+
+async def call_claude(
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    temperature: float = 0.7,
+    max_tokens: int = 4096,
+    retries: int = 5,
+) -> tuple[str, int, int]:
+    """
+    Roep Claude API aan.
+    Returns: (response_text, input_tokens, output_tokens)
+    """
+    request = dict(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+    )
+
+    async def call():
+        response = await _create_message(retries, **request)
+        return response.content[0].text, response.usage.input_tokens, response.usage.output_tokens
+
+    return await _journaled("message", request, call)
+
+
+async def call_claude_tool(
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    tool: dict,
+    temperature: float = 0.7,
+    max_tokens: int = 4096,
+    retries: int = 5,
+    is_valid: Optional[Callable[[Optional[dict]], bool]] = None,
+) -> tuple[Optional[dict], int, int]:
+    """
+    Roep Claude API aan met een verplichte tool-aanroep (gestructureerde output).
+    Het model moet antwoorden via `tool`, waarvan input_schema de JSON-structuur vastlegt.
+    Met `is_valid` komen alleen geldige tool-inputs in het call-journal.
+    Returns: (tool_input, input_tokens, output_tokens); tool_input is None als
+    het model de tool toch niet aanriep.
+    """
+    request = dict(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+        tools=[tool],
+        tool_choice={"type": "tool", "name": tool["name"]},
+    )
+
+    async def call():
+        response = await _create_message(retries, **request)
+        tool_input = None
+        for block in response.content:
+            if block.type == "tool_use" and block.name == tool["name"]:
+                tool_input = block.input
+                break
+        return tool_input, response.usage.input_tokens, response.usage.output_tokens
+
+    keep = (lambda result: is_valid(result[0])) if is_valid else None
+    return await _journaled("tool", request, call, keep)
+
+
+class IncrementalJSONObject:
+    """
+    Incrementele parser voor een JSON-object dat in stukken binnenkomt.
+    Houdt bij welke top-level velden al volledig zijn ontvangen; elk teken
+    wordt maar één keer bekeken, ongeacht het aantal stukken.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member_start = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Voeg een stuk JSON toe.
+        Returns: True als er hierdoor nieuwe top-level velden compleet zijn.
+        """
+        self.buffer += chunk
+        completed = False
+        for i in range(self._pos, len(self.buffer)):
+            c = self.buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+                if self._depth == 1:
+                    self._member_start = i + 1
+            elif c in "}]":
+                if self._depth == 1:
+                    completed |= self._complete_member(i)
+                self._depth -= 1
+            elif c == "," and self._depth == 1:
+                completed |= self._complete_member(i)
+                self._member_start = i + 1
+        self._pos = len(self.buffer)
+        return completed
+
+    def _complete_member(self, end: int) -> bool:
+        """Parse het top-level veld `"key": value` dat op positie `end` eindigt."""
+        member = self.buffer[self._member_start:end].strip()
+        if not member:
+            return False
+        try:
+            self.fields.update(json.loads("{" + member + "}"))
+        except ValueError:
+            return False
+        return True
+
+
+async def stream_claude_tool(
+    model: str,
+    system_prompt: str,
+    user_message: str,
+    tool: dict,
+    should_abort: Callable[[dict], bool],
+    temperature: float = 0.7,
+    max_tokens: int = 4096,
+    retries: int = 5,
+    is_valid: Optional[Callable[[Optional[dict]], bool]] = None,
+) -> tuple[Optional[dict], int, int, bool]:
+    """
+    Als call_claude_tool, maar gestreamd: de tool-input wordt geparsed terwijl
+    hij binnenkomt. Na elk compleet top-level veld wordt `should_abort(velden)`
+    aangeroepen; bij True wordt de request direct afgebroken.
+    Returns: (tool_input, input_tokens, output_tokens, aborted); bij een
+    afgebroken request bevat tool_input alleen de ontvangen velden en is
+    output_tokens de (onvolledige) telling die de stream tot dan had gemeld.
+    `is_valid` als bij call_claude_tool; een afgebroken request wordt altijd vastgelegd.
+    """
+    request = dict(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        system=system_prompt,
+        messages=[{"role": "user", "content": user_message}],
+        tools=[tool],
+        tool_choice={"type": "tool", "name": tool["name"]},
+    )
+
+    async def stream_once():
+        parser = IncrementalJSONObject()
+        async with get_client().messages.stream(**request) as stream:
+            async for event in stream:
+                if event.type != "content_block_delta" or event.delta.type != "input_json_delta":
+                    continue
+                if parser.feed(event.delta.partial_json) and should_abort(parser.fields):
+                    # Het verlaten van de stream sluit de verbinding: geen verdere output-tokens
+                    usage = stream.current_message_snapshot.usage
+                    return parser.fields, usage.input_tokens, usage.output_tokens, True
+            response = await stream.get_final_message()
+
+        tool_input = None
+        for block in response.content:
+            if block.type == "tool_use" and block.name == tool["name"]:
+                tool_input = block.input
+                break
+        return tool_input, response.usage.input_tokens, response.usage.output_tokens, False
+
+    keep = (lambda result: result[3] or is_valid(result[0])) if is_valid else None
+    return await _journaled("stream", request, lambda: _with_retries(retries, stream_once), keep)
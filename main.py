@@ -5,16 +5,14 @@ Hoofdscript voor de Jüngel preek-generator.
 Implementeert iteratieve prompt-optimalisatie.
 Prompts evolueren dynamisch en worden opgeslagen voor hergebruik.
 """
-import asyncio
-import json
+import argparse
 import os
-import glob
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 from config import MAX_ITERATIONS
-from generator import generate_with_iteration, GeneratedSermon
-from scorer import compute_full_score
+from corpus import load_corpus
 from prompt_store import (
     get_current_best,
     get_prompt_stats,
@@ -22,19 +20,19 @@ from prompt_store import (
     PROMPTS_DIR,
 )
 
+# generator (en daarmee scorer, numpy en de API-client) wordt pas geïmporteerd
+# als er echt gegenereerd wordt; de read-only commando's starten zo direct
+if TYPE_CHECKING:
+    from generator import GeneratedSermon
+
 
 # Paths
 OUTPUT_DIR = Path(__file__).parent / "output"
-SERMONS_PATH = Path(__file__).parent / "vertaling_Wim" / "export"
 
 
 def load_sermons() -> list[dict]:
-    """Laad preken uit JSON bestanden."""
-    sermons = []
-    for file_path in glob.glob(str(SERMONS_PATH / "p*.json")):
-        with open(file_path, "r", encoding="utf-8") as f:
-            sermons.append(json.load(f))
-    return sermons
+    """Laad de referentiepreken uit de corpus-cache (zie corpus.py)."""
+    return load_corpus().records()
 
 
 def show_prompt_stats():
@@ -120,8 +118,10 @@ async def generate_for_scripture(
     scripture_context: str,
     reference_sermons: list[dict],
     verbose: bool = True,
-) -> GeneratedSermon:
+) -> "GeneratedSermon":
     """Genereer een preek voor een gegeven Bijbeltekst."""
+    from generator import generate_with_iteration
+
     # Extraheer teksten van training preken als referentie
     reference_texts = [s["tekst"] for s in reference_sermons]
 
@@ -292,5 +292,21 @@ async def main():
         print("Ongeldige keuze")
 
 
+# Read-only commando's zonder menu, voor scripts en monitoring (python main.py stats)
+READ_ONLY_COMMANDS = {
+    "stats": show_prompt_stats,
+    "best": show_current_best_prompt,
+    "history": show_prompt_history,
+}
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Jüngel preek-generator")
+    parser.add_argument("command", nargs="?", choices=sorted(READ_ONLY_COMMANDS),
+                        help="Toon direct statistieken, het beste prompt of de geschiedenis (zonder menu)")
+    args = parser.parse_args()
+    if args.command:
+        READ_ONLY_COMMANDS[args.command]()
+    else:
+        import asyncio
+        asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Detectie van letterlijk overgenomen passages uit de referentiepreken.
+Een gehashte woord-n-gram index over het corpus wordt één keer gebouwd;
+daarna kost een controle per preek alleen een lineaire scan over de preek zelf.
+"""
+import re
+from dataclasses import dataclass
+
+from config import OVERLAP_NGRAM_SIZE
+
+
+@dataclass
+class OverlapReport:
+    """Hoeveel van een preek letterlijk in het referentiecorpus voorkomt."""
+    longest_span: int       # Langste aaneengesloten overgenomen passage, in woorden
+    overlap_ratio: float    # Fractie van de woorden die in een overgenomen n-gram valt
+    longest_span_text: str  # De langste overgenomen passage zelf
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits tekst in kleine-letter woorden (interpunctie telt niet mee)."""
+    return re.findall(r"\w+", text.lower())
+
+
+class OverlapIndex:
+    """Set van gehashte woord-n-grammen uit de referentiepreken."""
+
+    def __init__(self, documents: list[str], n: int = OVERLAP_NGRAM_SIZE):
+        self.n = n
+        self.ngrams: set[int] = set()
+        for document in documents:
+            tokens = tokenize(document)
+            for i in range(len(tokens) - n + 1):
+                self.ngrams.add(hash(tuple(tokens[i:i + n])))
+
+    def check(self, text: str) -> OverlapReport:
+        """Meet de overlap van `text` met het corpus."""
+        tokens = tokenize(text)
+        n = self.n
+        matched = [
+            hash(tuple(tokens[i:i + n])) in self.ngrams
+            for i in range(len(tokens) - n + 1)
+        ]
+
+        covered = [False] * len(tokens)
+        longest_start, longest_len = 0, 0
+        run_start = None
+        for i, is_match in enumerate(matched + [False]):
+            if is_match:
+                for k in range(i, i + n):
+                    covered[k] = True
+                if run_start is None:
+                    run_start = i
+            elif run_start is not None:
+                # Een reeks van m opeenvolgende n-grammen beslaat m + n - 1 woorden
+                span = i - run_start + n - 1
+                if span > longest_len:
+                    longest_start, longest_len = run_start, span
+                run_start = None
+
+        return OverlapReport(
+            longest_span=longest_len,
+            overlap_ratio=sum(covered) / len(tokens) if tokens else 0.0,
+            longest_span_text=" ".join(tokens[longest_start:longest_start + longest_len]),
+        )
+
+
+# Eén index per proces, herbouwd zodra de referentiepreken veranderen
+_index_cache: dict[int, OverlapIndex] = {}
+
+
+def get_overlap_index(reference_sermons: list[str]) -> OverlapIndex:
+    """Geef de (gecachte) index voor deze set referentiepreken."""
+    key = hash(tuple(reference_sermons))
+    if key not in _index_cache:
+        _index_cache.clear()
+        _index_cache[key] = OverlapIndex(reference_sermons)
+    return _index_cache[key]
+
+
+def check_overlap(text: str, reference_sermons: list[str]) -> OverlapReport:
+    """Meet hoeveel van `text` letterlijk uit de referentiepreken komt."""
+    return get_overlap_index(reference_sermons).check(text)
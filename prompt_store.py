@@ -2,15 +2,40 @@
 Dynamisch prompt management systeem.
 Slaat prompts op, laadt de beste, en evolueert ze over tijd.
 """
+import difflib
+import hashlib
 import json
+import math
 import os
+import random
+import re
+import sqlite3
+import zlib
+from contextlib import closing
 from dataclasses import dataclass, asdict
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 
+from config import (
+    PROMPT_SNAPSHOT_INTERVAL,
+    LEARNINGS_TOKEN_BUDGET,
+    LEARNING_SIMILARITY,
+    LEARNING_PRIOR_RUNS,
+    PROMPT_SELECTION,
+    BANDIT_PRIOR_STRENGTH,
+    BANDIT_SCORE_STD,
+    BANDIT_UCB_C,
+    PROMPT_TOKEN_BUDGET,
+    PROMPT_CONDENSE_MODEL,
+    PROMPT_CONDENSE_PANEL_SIZE,
+    PROMPT_CONDENSE_TOLERANCE,
+)
 
 PROMPTS_DIR = Path(__file__).parent / "prompts"
+PROMPTS_DB_FILE = PROMPTS_DIR / "prompt_store.sqlite3"
+
+# Oude opslag (hele bestand per wijziging herschreven); alleen nog bron voor de migratie
 PROMPT_HISTORY_FILE = PROMPTS_DIR / "prompt_history.json"
 CURRENT_BEST_FILE = PROMPTS_DIR / "current_best.json"
 
@@ -29,50 +54,382 @@ class StoredPrompt:
     improvements: Optional[list[str]] = None
 
 
+# Elke versie bewaart zijn prompt als gecomprimeerde delta t.o.v. delta_base
+# (de parent), of als volledige snapshot (delta_base NULL). chain_length is het
+# aantal delta's tot de dichtstbijzijnde snapshot.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    version INTEGER PRIMARY KEY,
+    score REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    scripture_text TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    tokens_used INTEGER NOT NULL,
+    parent_version INTEGER,
+    improvements TEXT,
+    delta_base INTEGER REFERENCES prompts(version),
+    chain_length INTEGER NOT NULL,
+    prompt_data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_score ON prompts(score);
+CREATE INDEX IF NOT EXISTS idx_prompts_parent ON prompts(parent_version);
+CREATE TABLE IF NOT EXISTS current_best (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL REFERENCES prompts(version)
+);
+CREATE TABLE IF NOT EXISTS learnings (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    normalized TEXT NOT NULL UNIQUE,
+    times_seen INTEGER NOT NULL DEFAULT 0,
+    times_applied INTEGER NOT NULL DEFAULT 0,
+    delta_sum REAL NOT NULL DEFAULT 0,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompt_arms (
+    version INTEGER PRIMARY KEY REFERENCES prompts(version),
+    observations INTEGER NOT NULL,
+    score_sum REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS prompt_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL,
+    total_versions INTEGER NOT NULL,
+    score_sum REAL NOT NULL,
+    best_score REAL,
+    first_score REAL,
+    last_score REAL,
+    latest_version INTEGER
+);
+CREATE TABLE IF NOT EXISTS condensed_prompts (
+    prompt_hash TEXT NOT NULL,
+    token_budget INTEGER NOT NULL,
+    condensed TEXT NOT NULL,
+    original_fitness REAL,
+    condensed_fitness REAL,
+    accepted INTEGER,  -- NULL zolang de panel-validatie nog niet gedaan is
+    created TEXT NOT NULL,
+    PRIMARY KEY (prompt_hash, token_budget)
+);
+"""
+
+PROMPT_COLUMNS = (
+    "score, timestamp, scripture_text, iteration, "
+    "tokens_used, version, parent_version, improvements"
+)
+
+# Gereconstrueerde prompts per versie (versies zijn onveranderlijk na opslag)
+_prompt_cache: dict[int, str] = {}
+
+# Proces-cache voor history, current_best en stats. Geldig zolang de
+# database-bestanden (mtime/grootte) en de generatie in prompt_stats niet veranderen.
+_read_cache: dict = {}
+_cache_signature = None
+_cache_generation = None
+
+
 def ensure_prompts_dir():
     """Zorg dat de prompts directory bestaat."""
     os.makedirs(PROMPTS_DIR, exist_ok=True)
 
 
-def load_prompt_history() -> list[dict]:
-    """Laad de volledige prompt geschiedenis."""
+def connect() -> sqlite3.Connection:
+    """
+    Open de prompt-database (WAL, zodat gelijktijdige runs elkaar niet blokkeren bij lezen).
+    Bij de eerste keer wordt de oude JSON-opslag gemigreerd.
+    """
     ensure_prompts_dir()
-    if not PROMPT_HISTORY_FILE.exists():
-        return []
-    with open(PROMPT_HISTORY_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+    is_new = not PROMPTS_DB_FILE.exists()
+    # isolation_level=None: transacties expliciet met BEGIN IMMEDIATE
+    conn = sqlite3.connect(PROMPTS_DB_FILE, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    _upgrade_full_text_schema(conn)
+    conn.executescript(SCHEMA)
+    if is_new:
+        migrate_json_store(conn)
+    missing_stats = conn.execute("SELECT 1 FROM prompt_stats WHERE id = 1").fetchone() is None
+    missing_arms = (
+        conn.execute("SELECT 1 FROM prompt_arms LIMIT 1").fetchone() is None
+        and conn.execute("SELECT 1 FROM prompts LIMIT 1").fetchone() is not None
+    )
+    if missing_stats or missing_arms:
+        conn.execute("BEGIN IMMEDIATE")
+        _recompute_stats(conn)
+        conn.execute("COMMIT")
+    return conn
+
+
+def _recompute_stats(conn: sqlite3.Connection):
+    """
+    Herbereken prompt_stats en prompt_arms volledig (na bulk-wijzigingen) en verhoog de generatie.
+    Een versie heeft als observaties zijn eigen score plus de score van elke run die ervan uitging.
+    """
+    conn.execute("DELETE FROM prompt_arms")
+    conn.execute(
+        """
+        INSERT INTO prompt_arms (version, observations, score_sum)
+        SELECT p.version, 1 + COUNT(c.version), p.score + COALESCE(SUM(c.score), 0)
+        FROM prompts p LEFT JOIN prompts c ON c.parent_version = p.version
+        GROUP BY p.version
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO prompt_stats (
+            id, generation, total_versions, score_sum, best_score, first_score, last_score, latest_version
+        )
+        SELECT 1,
+               COALESCE((SELECT generation FROM prompt_stats WHERE id = 1), 0) + 1,
+               COUNT(*), COALESCE(SUM(score), 0), MAX(score),
+               (SELECT score FROM prompts ORDER BY version LIMIT 1),
+               (SELECT score FROM prompts ORDER BY version DESC LIMIT 1),
+               MAX(version)
+        FROM prompts
+        """
+    )
+
+
+def _store_signature() -> tuple:
+    """(mtime, grootte) van de database en de WAL: verandert bij elke commit."""
+    signature = []
+    for path in (PROMPTS_DB_FILE, PROMPTS_DB_FILE.with_name(PROMPTS_DB_FILE.name + "-wal")):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _cached(key: str, load):
+    """
+    Geef een gecacht leesresultaat; `load()` draait alleen als de store sinds
+    de vorige keer veranderd is (door dit of een ander proces).
+    Zonder wijzigingen kost een lees-aanroep twee stat-calls.
+    """
+    global _cache_signature, _cache_generation
+    signature = _store_signature()
+    if signature != _cache_signature:
+        with closing(connect()) as conn:
+            generation = conn.execute("SELECT generation FROM prompt_stats WHERE id = 1").fetchone()[0]
+        if generation != _cache_generation:
+            _read_cache.clear()
+            _cache_generation = generation
+        # De signature van vóór het lezen: een latere commit wordt bij de volgende aanroep gezien
+        _cache_signature = signature
+    if key not in _read_cache:
+        _read_cache[key] = load()
+    return _read_cache[key]
+
+
+def _upgrade_full_text_schema(conn: sqlite3.Connection):
+    """Zet een database met volledige prompt-teksten per versie om naar delta-opslag."""
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(prompts)")]
+    if "system_prompt" not in columns:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    rows = [dict(row) for row in conn.execute("SELECT * FROM prompts ORDER BY version")]
+    best = conn.execute("SELECT version FROM current_best WHERE id = 1").fetchone()
+    conn.execute("DROP TABLE current_best")
+    conn.execute("DROP TABLE prompts")
+    # executescript zou de lopende transactie committen
+    for statement in SCHEMA.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+    for row in rows:
+        row["improvements"] = json.loads(row["improvements"]) if row["improvements"] is not None else None
+        _insert_prompt(conn, row)
+    if best is not None:
+        conn.execute("INSERT INTO current_best (id, version) VALUES (1, ?)", (best["version"],))
+    _recompute_stats(conn)
+    conn.execute("COMMIT")
+
+
+def encode_delta(base: str, text: str) -> list:
+    """
+    Regel-gebaseerde delta van `base` naar `text`.
+    Returns: lijst van [start, eind] (regels overnemen uit base) en strings (nieuwe tekst).
+    """
+    base_lines = base.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    """Reconstrueer een tekst uit `base` en een delta van encode_delta."""
+    base_lines = base.splitlines(keepends=True)
+    return "".join(
+        "".join(base_lines[op[0]:op[1]]) if isinstance(op, list) else op
+        for op in ops
+    )
+
+
+def _prompt_text(conn: sqlite3.Connection, version: int) -> str:
+    """Reconstrueer het prompt van een versie (snapshot + keten van delta's), met cache."""
+    chain = []
+    while version not in _prompt_cache:
+        row = conn.execute(
+            "SELECT delta_base, prompt_data FROM prompts WHERE version = ?", (version,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Prompt v{version} bestaat niet")
+        chain.append((version, row["delta_base"], zlib.decompress(row["prompt_data"]).decode("utf-8")))
+        if row["delta_base"] is None:
+            break
+        version = row["delta_base"]
+
+    for chain_version, delta_base, data in reversed(chain):
+        if delta_base is None:
+            _prompt_cache[chain_version] = data
+        else:
+            _prompt_cache[chain_version] = apply_delta(_prompt_cache[delta_base], json.loads(data))
+    return _prompt_cache[chain[0][0] if chain else version]
+
+
+def _row_to_dict(conn: sqlite3.Connection, row: sqlite3.Row) -> dict:
+    """Zet een prompts-rij om naar hetzelfde dict als asdict(StoredPrompt)."""
+    data = dict(row)
+    data["improvements"] = json.loads(data["improvements"]) if data["improvements"] is not None else None
+    return {"system_prompt": _prompt_text(conn, data["version"]), **data}
+
+
+def _insert_prompt(conn: sqlite3.Connection, prompt: dict):
+    """
+    Voeg een prompt toe (of vervang de rij met hetzelfde versienummer).
+    Opgeslagen als delta t.o.v. de parent, tenzij de keten PROMPT_SNAPSHOT_INTERVAL
+    lang wordt of de delta niet kleiner is dan een volledige snapshot.
+    """
+    text = prompt["system_prompt"]
+    snapshot = zlib.compress(text.encode("utf-8"))
+    prompt_data, delta_base, chain_length = snapshot, None, 0
+
+    parent = conn.execute(
+        "SELECT chain_length FROM prompts WHERE version = ?", (prompt.get("parent_version"),)
+    ).fetchone()
+    if parent is not None and prompt["parent_version"] != prompt["version"] \
+            and parent["chain_length"] + 1 < PROMPT_SNAPSHOT_INTERVAL:
+        ops = encode_delta(_prompt_text(conn, prompt["parent_version"]), text)
+        delta = zlib.compress(json.dumps(ops, ensure_ascii=False).encode("utf-8"))
+        if len(delta) < len(snapshot):
+            prompt_data, delta_base, chain_length = delta, prompt["parent_version"], parent["chain_length"] + 1
+
+    _prompt_cache.pop(prompt["version"], None)
+    conn.execute(
+        f"INSERT OR REPLACE INTO prompts ({PROMPT_COLUMNS}, delta_base, chain_length, prompt_data) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            prompt["score"],
+            prompt["timestamp"],
+            prompt["scripture_text"],
+            prompt["iteration"],
+            prompt["tokens_used"],
+            prompt["version"],
+            prompt.get("parent_version"),
+            json.dumps(prompt["improvements"], ensure_ascii=False)
+            if prompt.get("improvements") is not None else None,
+            delta_base,
+            chain_length,
+            prompt_data,
+        ),
+    )
+    _prompt_cache[prompt["version"]] = text
+
+
+def migrate_json_store(conn: sqlite3.Connection) -> int:
+    """
+    Eenmalige migratie van prompt_history.json en current_best.json naar SQLite.
+    Returns: het aantal gemigreerde versies.
+    """
+    history = []
+    if PROMPT_HISTORY_FILE.exists():
+        with open(PROMPT_HISTORY_FILE, "r", encoding="utf-8") as f:
+            history = json.load(f)
+    best = None
+    if CURRENT_BEST_FILE.exists():
+        with open(CURRENT_BEST_FILE, "r", encoding="utf-8") as f:
+            best = json.load(f)
+    if not history and best is None:
+        return 0
+
+    conn.execute("BEGIN IMMEDIATE")
+    for prompt in sorted(history, key=lambda p: p["version"]):
+        _insert_prompt(conn, prompt)
+    if best is not None:
+        if not any(p["version"] == best["version"] for p in history):
+            _insert_prompt(conn, best)
+        conn.execute("INSERT OR REPLACE INTO current_best (id, version) VALUES (1, ?)", (best["version"],))
+    _recompute_stats(conn)
+    conn.execute("COMMIT")
+
+    print(f"Prompt-geschiedenis gemigreerd naar {PROMPTS_DB_FILE.name} ({len(history)} versies)")
+    return len(history)
+
+
+def load_prompt_history() -> list[dict]:
+    """Laad de volledige prompt geschiedenis (gecacht zolang de store niet verandert)."""
+    return list(_cached("history", _load_prompt_history))
+
+
+def _load_prompt_history() -> list[dict]:
+    with closing(connect()) as conn:
+        rows = conn.execute(f"SELECT {PROMPT_COLUMNS} FROM prompts ORDER BY version").fetchall()
+        # Oplopende versies: parents staan vóór hun kinderen in de cache
+        return [_row_to_dict(conn, row) for row in rows]
 
 
 def save_prompt_history(history: list[dict]):
-    """Sla de prompt geschiedenis op."""
-    ensure_prompts_dir()
-    with open(PROMPT_HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+    """Vervang de prompt geschiedenis."""
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM current_best")
+        conn.execute("DELETE FROM prompts")
+        _prompt_cache.clear()
+        for prompt in sorted(history, key=lambda p: p["version"]):
+            _insert_prompt(conn, prompt)
+        _recompute_stats(conn)
+        conn.execute("COMMIT")
 
 
 def get_current_best() -> Optional[StoredPrompt]:
-    """Haal het huidige beste prompt op."""
-    ensure_prompts_dir()
-    if not CURRENT_BEST_FILE.exists():
-        return None
-    with open(CURRENT_BEST_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        return StoredPrompt(**data)
+    """Haal het huidige beste prompt op (gecacht zolang de store niet verandert)."""
+    return _cached("current_best", _load_current_best)
+
+
+def _load_current_best() -> Optional[StoredPrompt]:
+    with closing(connect()) as conn:
+        row = conn.execute(
+            f"SELECT {PROMPT_COLUMNS} FROM prompts "
+            "WHERE version = (SELECT version FROM current_best WHERE id = 1)"
+        ).fetchone()
+        return StoredPrompt(**_row_to_dict(conn, row)) if row else None
 
 
 def save_current_best(prompt: StoredPrompt):
     """Sla het nieuwe beste prompt op."""
-    ensure_prompts_dir()
-    with open(CURRENT_BEST_FILE, "w", encoding="utf-8") as f:
-        json.dump(asdict(prompt), f, indent=2, ensure_ascii=False)
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # Een bestaande versie niet herschrijven: latere versies kunnen er een delta op hebben
+        exists = conn.execute("SELECT 1 FROM prompts WHERE version = ?", (prompt.version,)).fetchone()
+        if not exists:
+            _insert_prompt(conn, asdict(prompt))
+        conn.execute("INSERT OR REPLACE INTO current_best (id, version) VALUES (1, ?)", (prompt.version,))
+        _recompute_stats(conn)
+        conn.execute("COMMIT")
 
 
 def get_next_version() -> int:
     """Bepaal het volgende versienummer."""
-    history = load_prompt_history()
-    if not history:
-        return 1
-    return max(p.get("version", 0) for p in history) + 1
+    with closing(connect()) as conn:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM prompts").fetchone()[0]
 
 
 def store_prompt(
@@ -86,41 +443,187 @@ def store_prompt(
 ) -> StoredPrompt:
     """
     Sla een nieuw prompt op en update current_best indien nodig.
+    Versienummer, insert en current_best-update gebeuren in één transactie,
+    zodat gelijktijdige runs geen versies overschrijven of kwijtraken.
     Returns: het opgeslagen StoredPrompt object.
     """
-    version = get_next_version()
-
-    stored = StoredPrompt(
-        system_prompt=system_prompt,
-        score=score,
-        timestamp=datetime.now().isoformat(),
-        scripture_text=scripture_text,
-        iteration=iteration,
-        tokens_used=tokens_used,
-        version=version,
-        parent_version=parent_version,
-        improvements=improvements,
-    )
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("SELECT COALESCE(MAX(version), 0) + 1 FROM prompts").fetchone()[0]
+        stored = StoredPrompt(
+            system_prompt=system_prompt,
+            score=score,
+            timestamp=datetime.now().isoformat(),
+            scripture_text=scripture_text,
+            iteration=iteration,
+            tokens_used=tokens_used,
+            version=version,
+            parent_version=parent_version,
+            improvements=improvements,
+        )
+        _insert_prompt(conn, asdict(stored))
 
-    # Voeg toe aan geschiedenis
-    history = load_prompt_history()
-    history.append(asdict(stored))
-    save_prompt_history(history)
+        # Update current_best als dit beter is
+        best = conn.execute(
+            "SELECT p.score FROM current_best b JOIN prompts p ON p.version = b.version WHERE b.id = 1"
+        ).fetchone()
+        is_new_best = best is None or score > best["score"]
+        if is_new_best:
+            conn.execute("INSERT OR REPLACE INTO current_best (id, version) VALUES (1, ?)", (version,))
 
-    # Update current_best als dit beter is
-    current_best = get_current_best()
-    if current_best is None or score > current_best.score:
-        save_current_best(stored)
-        print(f"Nieuw beste prompt opgeslagen (v{version}, score: {score:.2f})")
+        # Bandit-observaties: de nieuwe versie en de versie waar deze run van uitging
+        observe = (
+            "INSERT INTO prompt_arms (version, observations, score_sum) VALUES (?, 1, ?) "
+            "ON CONFLICT(version) DO UPDATE SET observations = observations + 1, "
+            "score_sum = score_sum + excluded.score_sum"
+        )
+        conn.execute(observe, (version, score))
+        if parent_version is not None and conn.execute(
+            "SELECT 1 FROM prompts WHERE version = ?", (parent_version,)
+        ).fetchone():
+            conn.execute(observe, (parent_version, score))
+
+        # Stats incrementeel bijwerken: lezen blijft O(1)
+        conn.execute(
+            """
+            UPDATE prompt_stats SET
+                generation = generation + 1,
+                total_versions = total_versions + 1,
+                score_sum = score_sum + :score,
+                best_score = MAX(COALESCE(best_score, :score), :score),
+                first_score = COALESCE(first_score, :score),
+                last_score = :score,
+                latest_version = :version
+            WHERE id = 1
+            """,
+            {"score": score, "version": version},
+        )
+        conn.execute("COMMIT")
 
+    if is_new_best:
+        print(f"Nieuw beste prompt opgeslagen (v{version}, score: {score:.2f})")
     return stored
 
 
-def get_best_prompt_for_evolution() -> tuple[str, int]:
+def get_prompt(version: int) -> Optional[StoredPrompt]:
+    """Haal een specifieke versie op."""
+    with closing(connect()) as conn:
+        row = conn.execute(f"SELECT {PROMPT_COLUMNS} FROM prompts WHERE version = ?", (version,)).fetchone()
+        return StoredPrompt(**_row_to_dict(conn, row)) if row else None
+
+
+def get_ancestors(version: int) -> list[int]:
+    """Voorouders van een versie via parent_version, dichtstbijzijnde eerst."""
+    with closing(connect()) as conn:
+        rows = conn.execute(
+            """
+            WITH RECURSIVE lineage(version, depth) AS (
+                SELECT parent_version, 1 FROM prompts WHERE version = ?
+                UNION ALL
+                SELECT p.parent_version, l.depth + 1
+                FROM prompts p JOIN lineage l ON p.version = l.version
+            )
+            SELECT version FROM lineage WHERE version IS NOT NULL ORDER BY depth
+            """,
+            (version,),
+        ).fetchall()
+    return [row["version"] for row in rows]
+
+
+def get_descendants(version: int) -> list[int]:
+    """Alle (klein)kinderen van een versie, oplopend op versienummer."""
+    with closing(connect()) as conn:
+        rows = conn.execute(
+            """
+            WITH RECURSIVE lineage(version) AS (
+                SELECT version FROM prompts WHERE parent_version = ?
+                UNION
+                SELECT p.version FROM prompts p JOIN lineage l ON p.parent_version = l.version
+            )
+            SELECT version FROM lineage ORDER BY version
+            """,
+            (version,),
+        ).fetchall()
+    return [row["version"] for row in rows]
+
+
+def diff_versions(old_version: int, new_version: int) -> str:
+    """Unified diff tussen de prompts van twee versies."""
+    with closing(connect()) as conn:
+        old = _prompt_text(conn, old_version)
+        new = _prompt_text(conn, new_version)
+    return "".join(difflib.unified_diff(
+        old.splitlines(keepends=True),
+        new.splitlines(keepends=True),
+        fromfile=f"v{old_version}",
+        tofile=f"v{new_version}",
+    ))
+
+
+def get_arm_posteriors() -> dict[int, dict]:
+    """
+    Posterior over de verwachte score per promptversie (normaal model met
+    bekende ruis BANDIT_SCORE_STD; prior = gemiddelde over alle versies,
+    met het gewicht van BANDIT_PRIOR_STRENGTH observaties).
+    Returns: {versie: {"mean", "std", "observations"}}
+    """
+    return dict(_cached("arms", _load_arm_posteriors))
+
+
+def _load_arm_posteriors() -> dict[int, dict]:
+    with closing(connect()) as conn:
+        rows = conn.execute("SELECT version, observations, score_sum FROM prompt_arms").fetchall()
+    if not rows:
+        return {}
+    prior_mean = sum(r["score_sum"] for r in rows) / sum(r["observations"] for r in rows)
+    posteriors = {}
+    for row in rows:
+        weight = BANDIT_PRIOR_STRENGTH + row["observations"]
+        posteriors[row["version"]] = {
+            "mean": (BANDIT_PRIOR_STRENGTH * prior_mean + row["score_sum"]) / weight,
+            "std": BANDIT_SCORE_STD / math.sqrt(weight),
+            "observations": row["observations"],
+        }
+    return posteriors
+
+
+def select_prompt_version(selection: str = PROMPT_SELECTION, rng: random.Random = random) -> Optional[int]:
+    """
+    Kies een promptversie om van uit te gaan.
+    "thompson": trek per versie een verwachte score uit de posterior en neem de hoogste;
+    "ucb": posterior-gemiddelde plus BANDIT_UCB_C keer de onzekerheidsbonus;
+    "best": de versie met de hoogste posterior-verwachting.
+    Returns: None als er nog geen versies zijn.
+    """
+    posteriors = get_arm_posteriors()
+    if not posteriors:
+        return None
+
+    if selection == "thompson":
+        value = lambda p: rng.gauss(p["mean"], p["std"])
+    elif selection == "ucb":
+        total = sum(p["observations"] for p in posteriors.values())
+        value = lambda p: p["mean"] + BANDIT_UCB_C * p["std"] * math.sqrt(math.log(total + 1))
+    elif selection == "best":
+        value = lambda p: p["mean"]
+    else:
+        raise ValueError(f"Onbekende prompt-selectie: {selection}")
+    return max(posteriors, key=lambda version: value(posteriors[version]))
+
+
+def get_best_prompt_for_evolution(selection: str = PROMPT_SELECTION) -> tuple[str, int]:
     """
-    Haal het beste prompt op om verder te evolueren.
+    Haal het prompt op om verder te evolueren.
+    selection: "current_best" (hoogste enkele score), of een bandit-modus van
+    select_prompt_version ("thompson", "ucb", "best") over alle scores per versie.
     Returns: (system_prompt, version)
     """
+    if selection != "current_best":
+        version = select_prompt_version(selection)
+        prompt = get_prompt(version) if version is not None else None
+        if prompt:
+            return prompt.system_prompt, prompt.version
+
     best = get_current_best()
     if best:
         return best.system_prompt, best.version
@@ -130,16 +633,192 @@ def get_best_prompt_for_evolution() -> tuple[str, int]:
     return BASE_SYSTEM_PROMPT, 0
 
 
+LEARNINGS_HEADER = "GELEERDE VERBETERINGEN (uit eerdere iteraties):"
+LEARNINGS_SECTION_PATTERN = re.compile(r"\n*" + re.escape(LEARNINGS_HEADER) + r"\n((?:- .*\n?)*)")
+
+# Grove schatting voor Nederlandse tekst; genoeg om het learnings-budget te bewaken
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Schat het aantal tokens van een tekst."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def normalize_learning(learning: str) -> str:
+    """
+    Normaliseer een learning voor vergelijking: zonder bron-prefix,
+    getallen en interpunctie, in kleine letters.
+    """
+    text = learning.lower().lstrip("- ")
+    text = re.sub(r"^(stilometrie|llm feedback)\s*:\s*", "", text)
+    text = re.sub(r"\d+([.,]\d+)?", " ", text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def _find_similar(normalized: str, known: dict[str, str]) -> Optional[str]:
+    """Zoek een geregistreerde learning (genormaliseerd -> tekst) die vrijwel hetzelfde zegt."""
+    if normalized in known:
+        return normalized
+    for candidate in known:
+        matcher = difflib.SequenceMatcher(None, normalized, candidate, autojunk=False)
+        if matcher.quick_ratio() >= LEARNING_SIMILARITY and matcher.ratio() >= LEARNING_SIMILARITY:
+            return candidate
+    return None
+
+
+def _register_learning(conn: sqlite3.Connection, known: dict[str, str], learning: str) -> Optional[str]:
+    """
+    Zoek of registreer een learning binnen een lopende transactie.
+    Returns: de genormaliseerde sleutel in de registry (None voor een lege learning).
+    """
+    normalized = normalize_learning(learning)
+    if not normalized:
+        return None
+    match = _find_similar(normalized, known)
+    if match is None:
+        conn.execute(
+            "INSERT INTO learnings (text, normalized, created) VALUES (?, ?, ?)",
+            (learning, normalized, datetime.now().isoformat()),
+        )
+        known[normalized] = learning
+        match = normalized
+    return match
+
+
+def register_learnings(learnings: list[str], persist: bool = True) -> list[str]:
+    """
+    Registreer learnings in de registry; herformuleringen van een bekende
+    learning worden daarop samengevoegd (en tellen als opnieuw gezien).
+    Met persist=False (bijv. een evaluatie-run) wordt alleen tegen de registry
+    gecanonicaliseerd en niets geschreven.
+    Returns: de canonieke teksten, zonder duplicaten, in volgorde van `learnings`.
+    """
+    canonical = []
+    if not persist:
+        with closing(connect()) as conn:
+            known = {row["normalized"]: row["text"] for row in conn.execute("SELECT normalized, text FROM learnings")}
+        for learning in learnings:
+            normalized = normalize_learning(learning)
+            if not normalized:
+                continue
+            match = _find_similar(normalized, known)
+            if match is None:
+                known[normalized] = learning
+                match = normalized
+            if known[match] not in canonical:
+                canonical.append(known[match])
+        return canonical
+
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        known = {row["normalized"]: row["text"] for row in conn.execute("SELECT normalized, text FROM learnings")}
+        for learning in learnings:
+            key = _register_learning(conn, known, learning)
+            if key is None:
+                continue
+            conn.execute("UPDATE learnings SET times_seen = times_seen + 1 WHERE normalized = ?", (key,))
+            if known[key] not in canonical:
+                canonical.append(known[key])
+        conn.execute("COMMIT")
+    return canonical
+
+
+def record_learning_outcome(learnings: list[str], score_delta: float):
+    """
+    Leg vast dat een run met deze learnings in zijn prompt `score_delta`
+    boven (of onder) de score van zijn parent-prompt uitkwam.
+    Learnings die nog niet in de registry staan (bijv. uit oudere prompts) worden toegevoegd.
+    """
+    if not learnings:
+        return
+    with closing(connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        known = {row["normalized"]: row["text"] for row in conn.execute("SELECT normalized, text FROM learnings")}
+        keys = {_register_learning(conn, known, learning) for learning in learnings} - {None}
+        for key in keys:
+            conn.execute(
+                "UPDATE learnings SET times_applied = times_applied + 1, delta_sum = delta_sum + ? "
+                "WHERE normalized = ?",
+                (score_delta, key),
+            )
+        conn.execute("COMMIT")
+
+
+def get_learning_effects() -> dict[str, dict]:
+    """Per geregistreerde learning: hoe vaak gezien, toegepast en het gemiddelde score-effect."""
+    with closing(connect()) as conn:
+        rows = conn.execute("SELECT * FROM learnings ORDER BY id").fetchall()
+    return {
+        row["normalized"]: {
+            "text": row["text"],
+            "times_seen": row["times_seen"],
+            "times_applied": row["times_applied"],
+            "avg_delta": row["delta_sum"] / row["times_applied"] if row["times_applied"] else None,
+            # Gekrompen naar 0: een enkele gelukkige run telt niet meteen zwaar
+            "effect": row["delta_sum"] / (row["times_applied"] + LEARNING_PRIOR_RUNS),
+        }
+        for row in rows
+    }
+
+
+def select_learnings(learnings: list[str], token_budget: int = LEARNINGS_TOKEN_BUDGET) -> list[str]:
+    """
+    Kies binnen `token_budget` de learnings met het beste gemeten effect
+    (onbekend effect telt als 0; bij gelijk effect gaan recentere voor).
+    Dubbele formuleringen vallen weg. Returns: de gekozen learnings in oorspronkelijke volgorde.
+    """
+    effects = get_learning_effects()
+    known = {normalized: info["text"] for normalized, info in effects.items()}
+
+    unique: dict[str, tuple[int, str]] = {}
+    for position, learning in enumerate(learnings):
+        normalized = normalize_learning(learning)
+        key = _find_similar(normalized, known) or normalized
+        # Bij duplicaten telt de laatste (meest recente) positie
+        unique[key] = (position, unique.get(key, (position, learning))[1])
+
+    ranked = sorted(
+        unique.items(),
+        key=lambda item: (effects[item[0]]["effect"] if item[0] in effects else 0.0, item[1][0]),
+        reverse=True,
+    )
+    chosen, used = [], 0
+    for _, (position, learning) in ranked:
+        cost = estimate_tokens(f"- {learning}\n")
+        if used + cost > token_budget:
+            continue
+        chosen.append((position, learning))
+        used += cost
+    return [learning for _, learning in sorted(chosen)]
+
+
+def prompt_learnings(prompt: str) -> list[str]:
+    """De learnings uit alle GELEERDE VERBETERINGEN-secties van een prompt."""
+    return [
+        line[2:].strip()
+        for section in LEARNINGS_SECTION_PATTERN.findall(prompt)
+        for line in section.splitlines()
+        if line.startswith("- ")
+    ]
+
+
 def evolve_prompt(
     base_prompt: str,
     feedback_learnings: list[str],
+    token_budget: int = LEARNINGS_TOKEN_BUDGET,
 ) -> str:
     """
     Evolueer een prompt door geleerde lessen toe te voegen.
+    Bestaande learnings-secties in het prompt worden samengevoegd met de nieuwe
+    learnings tot één sectie, geselecteerd op gemeten effect binnen `token_budget`,
+    zodat het prompt niet per evolutie blijft groeien.
 
     Args:
         base_prompt: Het huidige prompt
         feedback_learnings: Lijst van geleerde verbeterpunten
+        token_budget: Maximale (geschatte) omvang van de learnings-sectie in tokens
 
     Returns:
         Geëvolueerd prompt met nieuwe inzichten
@@ -147,21 +826,180 @@ def evolve_prompt(
     if not feedback_learnings:
         return base_prompt
 
+    learnings = select_learnings(prompt_learnings(base_prompt) + feedback_learnings, token_budget)
+    base_prompt = LEARNINGS_SECTION_PATTERN.sub("", base_prompt)
+
     # Zoek de plek om learnings toe te voegen (voor de STRUCTUUR sectie)
-    learnings_section = "\n\nGELEERDE VERBETERINGEN (uit eerdere iteraties):\n"
-    for i, learning in enumerate(feedback_learnings[-10:], 1):  # Max 10 learnings
+    learnings_section = f"\n\n{LEARNINGS_HEADER}\n"
+    for learning in learnings:
         learnings_section += f"- {learning}\n"
 
     # Voeg toe na de RETORISCHE STIJL sectie
     if "STRUCTUUR:" in base_prompt:
-        parts = base_prompt.split("STRUCTUUR:")
-        evolved = parts[0] + learnings_section + "\nSTRUCTUUR:" + parts[1]
+        parts = base_prompt.split("STRUCTUUR:", 1)
+        evolved = parts[0].rstrip("\n") + learnings_section + "\n\nSTRUCTUUR:" + parts[1]
     else:
         evolved = base_prompt + learnings_section
 
     return evolved
 
 
+# Run-specifieke feedback die generate_sermon aan het prompt toevoegt; hoort niet in een opgeslagen prompt
+FEEDBACK_SECTION_PATTERN = re.compile(
+    r"\n*FEEDBACK OP EERDERE POGINGEN:\n.*?Verbeter deze punten in je nieuwe preek\.", re.DOTALL
+)
+
+CONDENSE_SYSTEM_PROMPT = """Je redigeert systeemprompts voor een generator van preken in de stijl van Eberhard Jüngel.
+Je maakt een prompt korter zonder instructies te verliezen: herhalingen samenvoegen, uitleg inkorten, opsommingen compacter.
+Behoud alle sectiekoppen, alle concrete getallen en doelen, en alle "show, don't tell"-verboden letterlijk."""
+
+
+def deduplicate_instructions(prompt: str) -> str:
+    """
+    Verwijder instructieregels die eerder in het prompt al (genormaliseerd) voorkomen,
+    ook als ze in een andere sectie staan. Koppen en lege regels blijven staan.
+    """
+    seen = set()
+    lines = []
+    for line in prompt.split("\n"):
+        normalized = normalize_learning(line)
+        is_instruction = len(normalized) >= 20 and not line.rstrip().endswith(":")
+        if is_instruction and normalized in seen:
+            continue
+        seen.add(normalized)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def compact_prompt(prompt: str) -> str:
+    """
+    Goedkope opschoning zonder LLM: oude feedback-secties eruit, learnings-secties
+    samengevoegd tot één (binnen het learnings-budget) en herhaalde instructies weg.
+    """
+    prompt = FEEDBACK_SECTION_PATTERN.sub("", prompt)
+    prompt = evolve_prompt(prompt, prompt_learnings(prompt))
+    return deduplicate_instructions(prompt)
+
+
+def _condensation(prompt_hash: str, token_budget: int) -> Optional[sqlite3.Row]:
+    with closing(connect()) as conn:
+        return conn.execute(
+            "SELECT * FROM condensed_prompts WHERE prompt_hash = ? AND token_budget = ?",
+            (prompt_hash, token_budget),
+        ).fetchone()
+
+
+async def condense_prompt(prompt: str, token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """
+    Laat het LLM een prompt inkorten tot binnen `token_budget` (gecacht op prompt-hash).
+    De learnings-sectie gaat niet mee: die blijft letterlijk staan, zodat de
+    effect-attributie in de learnings-registry klopt.
+    """
+    # Lokale import: het lezen van de prompt-opslag heeft de API-client niet nodig
+    from llm import call_claude
+
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    cached = _condensation(prompt_hash, token_budget)
+    if cached:
+        return cached["condensed"]
+
+    learnings = prompt_learnings(prompt)
+    body = LEARNINGS_SECTION_PATTERN.sub("", prompt)
+    learnings_tokens = estimate_tokens(prompt) - estimate_tokens(body)
+    target_words = max(100, (token_budget - learnings_tokens) * CHARS_PER_TOKEN // 6)
+
+    text, _, _ = await call_claude(
+        model=PROMPT_CONDENSE_MODEL,
+        system_prompt=CONDENSE_SYSTEM_PROMPT,
+        user_message=(
+            f"Maak dit systeemprompt korter: hoogstens ongeveer {target_words} woorden. "
+            f"Geef uitsluitend het nieuwe prompt terug.\n\n{body}"
+        ),
+        temperature=0.2,
+        max_tokens=8000,
+    )
+    condensed = evolve_prompt(text.strip(), learnings)
+
+    with closing(connect()) as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO condensed_prompts (prompt_hash, token_budget, condensed, created) "
+            "VALUES (?, ?, ?, ?)",
+            (prompt_hash, token_budget, condensed, datetime.now().isoformat()),
+        )
+    return condensed
+
+
+async def validate_condensed_prompt(original: str, condensed: str) -> tuple[float, float]:
+    """
+    Evalueer origineel en ingekort prompt op hetzelfde panel (zie evolution.py).
+    Returns: (fitness origineel, fitness ingekort)
+    """
+    # Lokale import: evolution importeert (via generator) prompt_store
+    import asyncio
+    from corpus import load_corpus
+    from evolution import Individual, build_panel, evaluate_on_panel
+
+    corpus = load_corpus().records()
+    panel = build_panel(corpus, size=PROMPT_CONDENSE_PANEL_SIZE)
+    original_individual = Individual(id="origineel", prompt=original, origin="origineel")
+    condensed_individual = Individual(id="ingekort", prompt=condensed, origin="ingekort")
+    await asyncio.gather(
+        evaluate_on_panel(original_individual, panel, corpus),
+        evaluate_on_panel(condensed_individual, panel, corpus),
+    )
+    return original_individual.fitness, condensed_individual.fitness
+
+
+async def enforce_prompt_budget(
+    prompt: str,
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+    verbose: bool = True,
+    persist: bool = True,
+) -> str:
+    """
+    Houd een systeemprompt binnen `token_budget` (geschatte tokens).
+    Eerst compact_prompt; is het dan nog te groot, dan een LLM-condensatie die
+    het origineel pas vervangt als ze op het validatie-panel niet meer dan
+    PROMPT_CONDENSE_TOLERANCE slechter scoort. Condensatie en oordeel worden per
+    prompt-hash bewaard, zodat elk prompt hoogstens één keer gevalideerd wordt.
+    Met persist=False wordt alleen een eerder geaccepteerde condensatie gebruikt:
+    geen nieuwe condensatie, validatie of schrijfactie.
+    Returns: het prompt dat gebruikt mag worden
+    """
+    compacted = compact_prompt(prompt)
+    if verbose and len(compacted) < len(prompt):
+        print(f"Prompt opgeschoond: {estimate_tokens(prompt)} -> {estimate_tokens(compacted)} tokens")
+    if estimate_tokens(compacted) <= token_budget:
+        return compacted
+
+    prompt_hash = hashlib.sha256(compacted.encode("utf-8")).hexdigest()
+    verdict = _condensation(prompt_hash, token_budget)
+    if not persist:
+        if verdict is not None and verdict["accepted"]:
+            return verdict["condensed"]
+        if verbose:
+            print(f"Prompt boven het token-budget ({estimate_tokens(compacted)} tokens); niet ingekort (geen opslag)")
+        return compacted
+    if verdict is None or verdict["accepted"] is None:
+        condensed = await condense_prompt(compacted, token_budget)
+        original_fitness, condensed_fitness = await validate_condensed_prompt(compacted, condensed)
+        accepted = condensed_fitness >= original_fitness - PROMPT_CONDENSE_TOLERANCE
+        with closing(connect()) as conn:
+            conn.execute(
+                "UPDATE condensed_prompts SET original_fitness = ?, condensed_fitness = ?, accepted = ? "
+                "WHERE prompt_hash = ? AND token_budget = ?",
+                (original_fitness, condensed_fitness, int(accepted), prompt_hash, token_budget),
+            )
+        if verbose:
+            print(
+                f"Prompt ingekort tot {estimate_tokens(condensed)} tokens; panel-fitness "
+                f"{original_fitness:.3f} -> {condensed_fitness:.3f} ({'geaccepteerd' if accepted else 'verworpen'})"
+            )
+        verdict = _condensation(prompt_hash, token_budget)
+
+    return verdict["condensed"] if verdict["accepted"] else compacted
+
+
 def extract_learnings_from_feedback(feedback: str, score: float) -> list[str]:
     """
     Extraheer concrete verbeterpunten uit feedback.
@@ -196,16 +1034,20 @@ def extract_learnings_from_feedback(feedback: str, score: float) -> list[str]:
 
 
 def get_prompt_stats() -> dict:
-    """Haal statistieken op over prompt-evolutie."""
-    history = load_prompt_history()
-    if not history:
+    """Haal statistieken op over prompt-evolutie (bijgehouden in prompt_stats, gecacht)."""
+    return dict(_cached("stats", _load_prompt_stats))
+
+
+def _load_prompt_stats() -> dict:
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT * FROM prompt_stats WHERE id = 1").fetchone()
+    if not row["total_versions"]:
         return {"total_versions": 0, "best_score": 0, "avg_score": 0}
 
-    scores = [p["score"] for p in history]
     return {
-        "total_versions": len(history),
-        "best_score": max(scores),
-        "avg_score": sum(scores) / len(scores),
-        "latest_version": history[-1]["version"],
-        "score_improvement": scores[-1] - scores[0] if len(scores) > 1 else 0,
+        "total_versions": row["total_versions"],
+        "best_score": row["best_score"],
+        "avg_score": row["score_sum"] / row["total_versions"],
+        "latest_version": row["latest_version"],
+        "score_improvement": row["last_score"] - row["first_score"] if row["total_versions"] > 1 else 0,
     }
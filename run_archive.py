@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+Index en analyses over het run-archief in output/iterations.
+Leest de iter_NN_scores.json- en run.json-bestanden van alle runs één keer in een
+SQLite-tabel (output/run_archive.sqlite3); bij een volgende scan worden alleen nieuwe
+of gewijzigde run-directories opnieuw gelezen. Daarop draaien de analyses waarmee
+MAX_ITERATIONS en target_score uit data afgesteld kunnen worden: convergentiecurves,
+verdelingen per score-dimensie, tokens per gewonnen scorepunt en het plateau-moment.
+
+Gebruik:
+    python run_archive.py scan [--rebuild]
+    python run_archive.py report [--targets 0.8 0.85 0.9]
+    python run_archive.py curve | dimensions [--best] | tokens | plateau
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from config import MAX_ITERATIONS
+
+ITERATIONS_DIR = Path(__file__).parent / "output" / "iterations"
+RUN_ARCHIVE_DB_FILE = Path(__file__).parent / "output" / "run_archive.sqlite3"
+
+# Score-dimensies zoals in iter_NN_scores.json (oudere runs missen sommige velden)
+SCORE_DIMENSIONS = [
+    "overall_score",
+    "stylometric_score",
+    "theological_score",
+    "metaphorical_score",
+    "transformation_score",
+    "rhetorical_score",
+    "coherence_score",
+    "language_score",
+    "flow_score",
+    "humor_score",
+    "sdt_score",
+]
+
+# iter_NN_scores.json of iter_NN_cK_scores.json (meerdere kandidaten per iteratie)
+SCORES_FILE_PATTERN = re.compile(r"^iter_(\d+)(?:_c(\d+))?_scores\.json$")
+
+# Dimensies die de LLM-judge geeft: bij een afgebroken judgement zijn de niet-ontvangen
+# dimensies met 0 gevuld (overall, stilometrie en SDT zijn er dan wel)
+JUDGED_DIMENSIONS = [
+    name for name in SCORE_DIMENSIONS if name not in ("overall_score", "stylometric_score", "sdt_score")
+]
+
+# Binnen deze marge van de eindscore geldt een run als op zijn plateau
+PLATEAU_EPSILON = 0.005
+
+# Verhoog bij een wijziging van het schema: de index wordt dan opnieuw opgebouwd
+ARCHIVE_FORMAT_VERSION = 2
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    stamp TEXT NOT NULL,          -- Aantal bestanden en laatste mtime: bepaalt of opnieuw lezen nodig is
+    scripture_text TEXT,
+    iterations INTEGER,
+    target_reached INTEGER,
+    input_tokens INTEGER,         -- NULL voor runs zonder run.json
+    output_tokens INTEGER,
+    prompt_version INTEGER,
+    indexed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    iteration INTEGER NOT NULL,
+    candidate INTEGER NOT NULL,
+    {", ".join(f"{name} REAL" for name in SCORE_DIMENSIONS)},
+    sermon_length INTEGER,
+    is_best INTEGER,
+    inherited INTEGER NOT NULL,   -- Score overgenomen van een near-duplicate, niet zelf beoordeeld
+    received_fields TEXT,         -- JSON-lijst bij een afgebroken judgement, anders NULL
+    PRIMARY KEY (run_id, iteration, candidate)
+);
+"""
+
+
+def connect(db_file: Path = RUN_ARCHIVE_DB_FILE) -> sqlite3.Connection:
+    os.makedirs(db_file.parent, exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    if conn.execute("PRAGMA user_version").fetchone()[0] != ARCHIVE_FORMAT_VERSION:
+        # De index is afgeleid van output/iterations: bij een nieuw schema opnieuw opbouwen
+        conn.executescript("DROP TABLE IF EXISTS scores; DROP TABLE IF EXISTS runs;")
+        conn.execute(f"PRAGMA user_version = {ARCHIVE_FORMAT_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def run_stamp(run_dir: Path) -> str:
+    """Goedkope vingerafdruk van een run-directory (alleen stat, geen inhoud)."""
+    files = [entry for entry in os.scandir(run_dir) if entry.is_file() and entry.name.endswith(".json")]
+    latest = max((entry.stat().st_mtime_ns for entry in files), default=0)
+    return f"{len(files)}:{latest}"
+
+
+def index_run(conn: sqlite3.Connection, run_dir: Path, stamp: str):
+    """Lees alle score-bestanden en run.json van één run in (vervangt een eerdere versie)."""
+    metadata = {}
+    metadata_file = run_dir / "run.json"
+    if metadata_file.exists():
+        with open(metadata_file, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+    rows = []
+    for path in run_dir.iterdir():
+        match = SCORES_FILE_PATTERN.match(path.name)
+        if not match:
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        rows.append((
+            run_dir.name,
+            int(match.group(1)),
+            int(match.group(2) or 1),
+            *(data.get(name) for name in SCORE_DIMENSIONS),
+            data.get("sermon_length"),
+            int(bool(data.get("is_best"))),
+            int(bool(data.get("inherited"))),
+            None if data.get("received_fields") is None else json.dumps(data["received_fields"]),
+        ))
+
+    conn.execute("DELETE FROM runs WHERE run_id = ?", (run_dir.name,))
+    conn.execute(
+        "INSERT INTO runs (run_id, stamp, scripture_text, iterations, target_reached, "
+        "input_tokens, output_tokens, prompt_version, indexed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            run_dir.name,
+            stamp,
+            metadata.get("scripture_text"),
+            metadata.get("iterations", max((row[1] for row in rows), default=0)),
+            None if "target_reached" not in metadata else int(metadata["target_reached"]),
+            metadata.get("input_tokens"),
+            metadata.get("output_tokens"),
+            metadata.get("prompt_version"),
+            datetime.now().isoformat(),
+        ),
+    )
+    placeholders = ", ".join("?" * (len(SCORE_DIMENSIONS) + 7))
+    conn.executemany(f"INSERT INTO scores VALUES ({placeholders})", rows)
+
+
+def scan(conn: sqlite3.Connection, iterations_dir: Path = ITERATIONS_DIR, rebuild: bool = False) -> dict:
+    """
+    Werk de index bij: nieuwe en gewijzigde runs worden (opnieuw) gelezen,
+    verdwenen runs verwijderd. Returns: aantallen per soort wijziging
+    """
+    if rebuild:
+        conn.execute("DELETE FROM runs")
+    known = dict(conn.execute("SELECT run_id, stamp FROM runs").fetchall())
+    counts = {"new": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    present = set()
+
+    with conn:
+        if iterations_dir.exists():
+            for entry in sorted(os.scandir(iterations_dir), key=lambda e: e.name):
+                if not entry.is_dir():
+                    continue
+                present.add(entry.name)
+                stamp = run_stamp(Path(entry.path))
+                if known.get(entry.name) == stamp:
+                    counts["unchanged"] += 1
+                    continue
+                index_run(conn, Path(entry.path), stamp)
+                counts["updated" if entry.name in known else "new"] += 1
+
+        for run_id in set(known) - present:
+            conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            counts["removed"] += 1
+
+    return counts
+
+
+def best_per_iteration(conn: sqlite3.Connection) -> dict[str, np.ndarray]:
+    """Per run de beste overall_score per iteratie (over de kandidaten), in iteratievolgorde."""
+    curves: dict[str, list[float]] = {}
+    for row in conn.execute(
+        "SELECT run_id, iteration, MAX(overall_score) FROM scores "
+        "WHERE overall_score IS NOT NULL GROUP BY run_id, iteration ORDER BY run_id, iteration"
+    ):
+        curves.setdefault(row[0], []).append(row[2])
+    return {run_id: np.array(scores) for run_id, scores in curves.items()}
+
+
+def convergence_curve(conn: sqlite3.Connection) -> list[dict]:
+    """
+    Verloop van de beste score tot nu toe per iteratie, over alle runs.
+    Runs die eerder stopten tellen na hun laatste iteratie mee met hun eindscore.
+    """
+    curves = best_per_iteration(conn)
+    if not curves:
+        return []
+    length = max(len(scores) for scores in curves.values())
+    # Running best, aangevuld met de eindscore tot de langste run
+    matrix = np.array([
+        np.pad(np.maximum.accumulate(scores), (0, length - len(scores)), mode="edge")
+        for scores in curves.values()
+    ])
+    gains = matrix - matrix[:, :1]
+    active = np.array([[len(scores) > i for i in range(length)] for scores in curves.values()])
+    return [
+        {
+            "iteration": i + 1,
+            "runs_active": int(active[:, i].sum()),
+            "mean_best": float(matrix[:, i].mean()),
+            "median_best": float(np.median(matrix[:, i])),
+            "mean_gain": float(gains[:, i].mean()),
+        }
+        for i in range(length)
+    ]
+
+
+def dimension_distributions(conn: sqlite3.Connection, best_only: bool = False) -> dict[str, dict]:
+    """
+    Verdeling per score-dimensie over alle iteraties, of met best_only alleen de rij
+    met de hoogste overall_score per run. (is_best markeert elke verbetering van het
+    lopende maximum en staat dus op meerdere rijen per run.) Overgenomen scores van
+    near-duplicates tellen niet mee, en van een afgebroken judgement alleen de
+    dimensies die echt beoordeeld zijn.
+    """
+    columns = ", ".join(SCORE_DIMENSIONS)
+    query = f"SELECT {columns}, received_fields FROM scores WHERE inherited = 0"
+    if best_only:
+        query = (
+            f"SELECT {columns}, received_fields FROM ("
+            f"SELECT *, ROW_NUMBER() OVER (PARTITION BY run_id "
+            f"ORDER BY overall_score DESC, iteration, candidate) AS rank FROM scores "
+            f"WHERE overall_score IS NOT NULL AND inherited = 0) WHERE rank = 1"
+        )
+    rows = []
+    for row in conn.execute(query):
+        values = list(row[:len(SCORE_DIMENSIONS)])
+        if row["received_fields"] is not None:
+            received = set(json.loads(row["received_fields"]))
+            for j, name in enumerate(SCORE_DIMENSIONS):
+                if name in JUDGED_DIMENSIONS and name not in received:
+                    values[j] = None
+        rows.append(values)
+    values = np.array(rows, dtype=float).reshape(-1, len(SCORE_DIMENSIONS))
+
+    distributions = {}
+    for j, name in enumerate(SCORE_DIMENSIONS):
+        column = values[:, j]
+        column = column[~np.isnan(column)]
+        if len(column) == 0:
+            continue
+        p10, p50, p90 = np.percentile(column, [10, 50, 90])
+        distributions[name] = {
+            "n": len(column),
+            "mean": float(column.mean()),
+            "std": float(column.std()),
+            "p10": float(p10),
+            "p50": float(p50),
+            "p90": float(p90),
+        }
+    return distributions
+
+
+def tokens_per_point(conn: sqlite3.Connection) -> list[dict]:
+    """
+    Tokens per gewonnen scorepunt (0.01 overall) per run: totaal tokens gedeeld door
+    de winst van de eerste iteratie naar de beste. Alleen runs met run.json en winst.
+    """
+    curves = best_per_iteration(conn)
+    results = []
+    for row in conn.execute(
+        "SELECT run_id, input_tokens, output_tokens FROM runs WHERE input_tokens IS NOT NULL"
+    ):
+        scores = curves.get(row["run_id"])
+        if scores is None:
+            continue
+        gain = float(scores.max() - scores[0])
+        tokens = row["input_tokens"] + (row["output_tokens"] or 0)
+        results.append({
+            "run_id": row["run_id"],
+            "tokens": tokens,
+            "gain": gain,
+            "tokens_per_point": tokens / (gain * 100) if gain > 0 else None,
+        })
+    return results
+
+
+def plateau_statistics(conn: sqlite3.Connection, targets: tuple[float, ...] = (0.80, 0.85, 0.90)) -> dict:
+    """
+    Op welke iteratie runs hun eindscore (binnen PLATEAU_EPSILON) bereiken, welke
+    MAX_ITERATIONS daarvoor nodig is, en hoe vaak en wanneer elke target gehaald wordt.
+    """
+    curves = best_per_iteration(conn)
+    if not curves:
+        return {"runs": 0}
+    plateau = np.array([
+        int(np.argmax(scores >= scores.max() - PLATEAU_EPSILON)) + 1 for scores in curves.values()
+    ])
+
+    target_stats = {}
+    for target in targets:
+        reached = [int(np.argmax(scores >= target)) + 1 for scores in curves.values() if scores.max() >= target]
+        target_stats[target] = {
+            "share": len(reached) / len(curves),
+            "median_iteration": float(np.median(reached)) if reached else None,
+        }
+
+    return {
+        "runs": len(curves),
+        "mean_plateau": float(plateau.mean()),
+        "histogram": {int(k): int((plateau == k).sum()) for k in np.unique(plateau)},
+        # Kleinste MAX_ITERATIONS waarbij 90% van de runs zijn plateau al bereikt
+        "max_iterations_p90": int(np.ceil(np.percentile(plateau, 90))),
+        "targets": target_stats,
+    }
+
+
+def print_curve(curve: list[dict]):
+    print(f"{'Iteratie':>8} {'Runs':>5} {'Gem. beste':>11} {'Mediaan':>8} {'Winst':>7}")
+    for point in curve:
+        print(f"{point['iteration']:>8} {point['runs_active']:>5} {point['mean_best']:>11.3f} "
+              f"{point['median_best']:>8.3f} {point['mean_gain']:>+7.3f}")
+
+
+def print_dimensions(distributions: dict[str, dict]):
+    print(f"{'Dimensie':<22} {'n':>4} {'Gem.':>6} {'Std':>6} {'P10':>6} {'P50':>6} {'P90':>6}")
+    for name, stats in distributions.items():
+        print(f"{name:<22} {stats['n']:>4} {stats['mean']:>6.3f} {stats['std']:>6.3f} "
+              f"{stats['p10']:>6.3f} {stats['p50']:>6.3f} {stats['p90']:>6.3f}")
+
+
+def print_tokens(results: list[dict]):
+    if not results:
+        print("Geen runs met token-gegevens (run.json)")
+        return
+    for result in results:
+        per_point = f"{result['tokens_per_point']:,.0f}" if result["tokens_per_point"] else "-"
+        print(f"{result['run_id']:<20} {result['tokens']:>10,} tokens  winst {result['gain']:+.3f}  "
+              f"tokens/punt {per_point}")
+    ratios = [r["tokens_per_point"] for r in results if r["tokens_per_point"]]
+    if ratios:
+        print(f"Mediaan: {np.median(ratios):,.0f} tokens per 0.01 scorewinst ({len(ratios)} runs)")
+
+
+def print_plateau(stats: dict):
+    if not stats["runs"]:
+        print("Geen runs in de index")
+        return
+    print(f"Plateau (eindscore ± {PLATEAU_EPSILON}) bereikt op iteratie, over {stats['runs']} runs:")
+    for iteration, count in stats["histogram"].items():
+        print(f"  {iteration:>2}: {'#' * count} {count}")
+    print(f"Gemiddeld: {stats['mean_plateau']:.1f}; 90% van de runs op iteratie "
+          f"{stats['max_iterations_p90']} (MAX_ITERATIONS nu {MAX_ITERATIONS})")
+    for target, target_stats in stats["targets"].items():
+        when = f", mediaan iteratie {target_stats['median_iteration']:.0f}" if target_stats["median_iteration"] else ""
+        print(f"  target {target:.2f}: gehaald in {target_stats['share']:.0%} van de runs{when}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index en analyses over output/iterations")
+    parser.add_argument("command", choices=["scan", "report", "curve", "dimensions", "tokens", "plateau"])
+    parser.add_argument("--rebuild", action="store_true", help="Lees alle runs opnieuw in")
+    parser.add_argument("--best", action="store_true", help="Dimensies: alleen de iteratie met de hoogste overall_score per run")
+    parser.add_argument("--targets", type=float, nargs="+", default=[0.80, 0.85, 0.90])
+    args = parser.parse_args()
+
+    with closing(connect()) as conn:
+        # Elke query werkt eerst de index bij; alleen nieuwe of gewijzigde runs kosten tijd
+        counts = scan(conn, rebuild=args.rebuild)
+        if args.command == "scan":
+            print(f"Nieuw: {counts['new']}, bijgewerkt: {counts['updated']}, "
+                  f"verwijderd: {counts['removed']}, ongewijzigd: {counts['unchanged']}")
+            return
+
+        if args.command in ("report", "curve"):
+            print("Convergentie (beste score tot nu toe):")
+            print_curve(convergence_curve(conn))
+            print()
+        if args.command in ("report", "dimensions"):
+            print("Score-dimensies" + (" (beste per run):" if args.best else " (alle iteraties):"))
+            print_dimensions(dimension_distributions(conn, args.best))
+            print()
+        if args.command in ("report", "tokens"):
+            print("Tokens per gewonnen scorepunt:")
+            print_tokens(tokens_per_point(conn))
+            print()
+        if args.command in ("report", "plateau"):
+            print_plateau(plateau_statistics(conn, tuple(args.targets)))
+
+
+if __name__ == "__main__":
+    main()
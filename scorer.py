@@ -2,21 +2,31 @@
 Stilometrische analyse en scoring voor Jüngel-preken.
 Combineert stilometrische analyse met LLM-gebaseerde theologische beoordeling.
 """
-import json
+import asyncio
 import re
 import statistics
 from collections import Counter
 from dataclasses import dataclass
-from typing import TypedDict
+from typing import Optional, TypedDict
 
+from citations import citation_feedback
 from config import (
     SCORER_MODEL,
     SCORER_TEMPERATURE,
     SCORER_MAX_TOKENS,
+    SCORER_PARSE_RETRIES,
+    SCORER_ENSEMBLE_SIZE,
+    SCORER_ENSEMBLE_MODE,
+    SCORER_AGGREGATION,
+    SCORER_STREAMING,
+    SCORER_SDT_ABORT_AT,
+    OVERLAP_MAX_SPAN,
+    OVERLAP_PENALTY,
     STYLOMETRIC_TARGETS,
     THEOLOGICAL_WORD_TARGETS,
 )
-from llm import call_claude
+from llm import call_claude_tool, stream_claude_tool
+from overlap import check_overlap
 
 
 class StylometricMetrics(TypedDict):
@@ -50,6 +60,23 @@ class SermonScore:
     flow_score: float
     humor_score: float
     sdt_score: float  # Show Don't Tell discipline multiplier
+    parse_failures: int = 0  # Ongeldige judge-responses voordat deze score lukte
+    judge_count: int = 1  # Onafhankelijke oordelen per dimensie (minimum over de dimensies)
+    score_variance: Optional[dict[str, float]] = None  # Per dimensie, tussen judges (0-1 schaal)
+    overall_stderr: float = 0.0  # Standaardfout van overall_score door judge-ruis
+    copied_span: int = 0  # Langste letterlijk uit de referentiepreken overgenomen passage (woorden)
+    overlap_ratio: float = 0.0  # Fractie van de preek die in overgenomen n-grammen valt
+    overlap_penalty: float = 1.0  # Vermenigvuldiger op overall_score (< 1 bij kopiëren)
+    inherited: bool = False  # Overgenomen van een bijna-identieke kandidaat, niet zelf beoordeeld
+    received_fields: Optional[list[str]] = None  # Alleen bij een afgebroken judge-call: de ontvangen velden
+
+
+class ScoringError(Exception):
+    """De judge leverde binnen het retry-budget geen geldige score op."""
+
+    def __init__(self, message: str, parse_failures: int = 0):
+        super().__init__(message)
+        self.parse_failures = parse_failures
 
 
 # Scoring rubric voor LLM evaluatie
@@ -143,7 +170,7 @@ C. HOMILETISCHE EN RETORISCHE KWALITEIT:
 
 --- BEOORDELINGSPROCES ---
 
-Beoordeel de preek op de volgende aspecten (elk 0-10) en geef je beoordeling in een strikt JSON-formaat. Geef ALLEEN het JSON-object terug, zonder enige extra tekst of uitleg. Een perfecte Jüngel-preek scoort 9-10 op alle dimensies.
+Beoordeel de preek op de volgende aspecten (elk 0-10) en geef je beoordeling uitsluitend via de tool `record_sermon_score`, met de volgende structuur. Een perfecte Jüngel-preek scoort 9-10 op alle dimensies.
 
 {
     "show_dont_tell_discipline": {
@@ -172,6 +199,101 @@ Beoordeel de preek op de volgende aspecten (elk 0-10) en geef je beoordeling in
 }"""
 
 
+LLM_SCORE_FIELDS = [
+    "theological_score",
+    "metaphorical_score",
+    "transformation_score",
+    "rhetorical_score",
+    "coherence_score",
+    "language_score",
+    "flow_score",
+    "humor_score",
+    "length_score",
+]
+
+FEEDBACK_DETAIL_FIELDS = [
+    "theological",
+    "metaphorical",
+    "transformation",
+    "rhetorical",
+    "coherence",
+    "language_and_flow",
+    "humor",
+]
+
+# Welk feedback_details-veld bij welke score hoort (length_score heeft geen eigen veld)
+FIELD_FEEDBACK_KEYS = {
+    "theological_score": "theological",
+    "metaphorical_score": "metaphorical",
+    "transformation_score": "transformation",
+    "rhetorical_score": "rhetorical",
+    "coherence_score": "coherence",
+    "language_score": "language_and_flow",
+    "flow_score": "language_and_flow",
+    "humor_score": "humor",
+}
+
+SDT_FIELD = "show_dont_tell_discipline"
+
+# Rubric-delen voor ensemble_mode="split": kleinere, dimensie-specifieke judge-calls
+RUBRIC_GROUPS = {
+    "theologie": [SDT_FIELD, "theological_score", "transformation_score"],
+    "homiletiek": ["metaphorical_score", "rhetorical_score", "humor_score"],
+    "vorm": ["coherence_score", "language_score", "flow_score", "length_score"],
+}
+
+_SCORE_SCHEMA = {"type": "number", "minimum": 0, "maximum": 10}
+
+
+def build_score_tool(fields: list[str] | None = None) -> dict:
+    """
+    Bouw de tool-definitie die de judge dwingt het JSON-formaat van de rubric te volgen.
+    Met `fields` wordt alleen dat deel van de rubric gevraagd (None = volledige rubric).
+    """
+    fields = fields or [SDT_FIELD, *LLM_SCORE_FIELDS]
+    feedback_keys = _feedback_keys_for(fields)
+
+    properties = {}
+    for field in fields:
+        if field == SDT_FIELD:
+            properties[field] = {
+                "type": "object",
+                "properties": {
+                    "score": _SCORE_SCHEMA,
+                    "feedback": {"type": "string"},
+                },
+                "required": ["score", "feedback"],
+            }
+        else:
+            properties[field] = _SCORE_SCHEMA
+    if feedback_keys:
+        properties["feedback_details"] = {
+            "type": "object",
+            "properties": {key: {"type": "string"} for key in feedback_keys},
+            "required": feedback_keys,
+        }
+    properties["overall_assessment"] = {"type": "string"}
+
+    return {
+        "name": "record_sermon_score",
+        "description": "Leg de beoordeling van de preek vast volgens de rubric.",
+        "input_schema": {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+        },
+    }
+
+
+def _feedback_keys_for(fields: list[str]) -> list[str]:
+    """Geef de feedback_details-velden die bij een set scores horen, in rubric-volgorde."""
+    wanted = {FIELD_FEEDBACK_KEYS[f] for f in fields if f in FIELD_FEEDBACK_KEYS}
+    return [key for key in FEEDBACK_DETAIL_FIELDS if key in wanted]
+
+
+SCORE_TOOL = build_score_tool()
+
+
 def analyze_sermon(text: str) -> tuple[StylometricMetrics, list[str]]:
     """Analyseer stilometrische kenmerken van een preek."""
     # Verwijder NBV21 header indien aanwezig
@@ -349,56 +471,188 @@ def generate_stylometric_feedback(metrics: StylometricMetrics, words: list[str])
     return "\n".join(feedback_parts)
 
 
-def parse_llm_score(response: str) -> dict:
-    """Parse de JSON response van de LLM scorer."""
-    # Probeer JSON te extraheren
-    try:
-        # Soms zit er tekst omheen
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if json_match:
-            return json.loads(json_match.group())
-    except json.JSONDecodeError:
-        pass
+def validate_llm_score(data, fields: list[str] | None = None) -> list[str]:
+    """
+    Controleer een judge-response tegen de tool-definitie van build_score_tool(fields).
+    Returns: lijst met schendingen (leeg = geldig).
+    """
+    if not isinstance(data, dict):
+        return ["response is geen object (tool niet aangeroepen?)"]
+
+    fields = fields or [SDT_FIELD, *LLM_SCORE_FIELDS]
+    errors = []
+
+    for field in fields:
+        if field != SDT_FIELD:
+            errors.extend(_validate_score_value(field, data.get(field)))
+            continue
+        sdt = data.get(SDT_FIELD)
+        if not isinstance(sdt, dict):
+            errors.append(f"{SDT_FIELD} ontbreekt of is geen object")
+        else:
+            errors.extend(_validate_score_value(f"{SDT_FIELD}.score", sdt.get("score")))
+            if not isinstance(sdt.get("feedback"), str):
+                errors.append(f"{SDT_FIELD}.feedback ontbreekt")
+
+    feedback_keys = _feedback_keys_for(fields)
+    if feedback_keys:
+        details = data.get("feedback_details")
+        if not isinstance(details, dict):
+            errors.append("feedback_details ontbreekt of is geen object")
+        else:
+            for key in feedback_keys:
+                if not isinstance(details.get(key), str):
+                    errors.append(f"feedback_details.{key} ontbreekt")
 
-    # Fallback: lege scores
-    return {
-        "show_dont_tell_discipline": {"score": 5, "feedback": "Kon response niet parsen"},
-        "theological_score": 5,
-        "metaphorical_score": 5,
-        "transformation_score": 5,
-        "rhetorical_score": 5,
-        "coherence_score": 5,
-        "language_score": 5,
-        "flow_score": 5,
-        "humor_score": 5,
-        "length_score": 5,
-        "feedback_details": {
-            "theological": "Parsing error",
-            "metaphorical": "Parsing error",
-            "transformation": "Parsing error",
-            "rhetorical": "Parsing error",
-            "coherence": "Parsing error",
-            "language_and_flow": "Parsing error",
-            "humor": "Parsing error",
-        },
-        "overall_assessment": "Kon LLM response niet parsen.",
-    }
+    if not isinstance(data.get("overall_assessment"), str):
+        errors.append("overall_assessment ontbreekt")
+
+    return errors
+
+
+def _validate_score_value(name: str, value) -> list[str]:
+    """Controleer dat een score een getal tussen 0 en 10 is."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return [f"{name} ontbreekt of is geen getal"]
+    if not 0 <= value <= 10:
+        return [f"{name} valt buiten 0-10 ({value})"]
+    return []
+
+
+def sdt_disqualifies(fields: dict) -> bool:
+    """
+    Is er al een geldige SDT-score binnen die de rest van de beoordeling irrelevant maakt?
+    (SDT vermenigvuldigt de overall score; bij expliciete Jüngel-termen telt de rest niet meer.)
+    """
+    sdt = fields.get(SDT_FIELD)
+    if not isinstance(sdt, dict) or _validate_score_value(SDT_FIELD, sdt.get("score")):
+        return False
+    return isinstance(sdt.get("feedback"), str) and sdt["score"] <= SCORER_SDT_ABORT_AT
+
+
+async def request_llm_score(
+    user_message: str,
+    model: str = SCORER_MODEL,
+    fields: list[str] | None = None,
+) -> tuple[dict, int]:
+    """
+    Vraag de judge om een gestructureerde score via de score-tool.
+    Met `fields` wordt alleen dat deel van de rubric beoordeeld.
+    Bij schema-schendingen wordt alleen de judge-call herhaald, maximaal
+    SCORER_PARSE_RETRIES keer.
+    Met SCORER_STREAMING wordt de response gestreamd en afgebroken zodra een
+    diskwalificerende SDT-score binnen is; llm_scores bevat dan alleen SDT_FIELD.
+    Returns: (llm_scores, parse_failures)
+    Raises: ScoringError als ook de laatste poging ongeldig is.
+    """
+    tool = SCORE_TOOL if fields is None else build_score_tool(fields)
+    streaming = SCORER_STREAMING and (fields is None or SDT_FIELD in fields)
+
+    parse_failures = 0
+
+    def is_valid(tool_input) -> bool:
+        return not validate_llm_score(tool_input, fields)
+
+    for attempt in range(SCORER_PARSE_RETRIES + 1):
+        if streaming:
+            tool_input, _, _, aborted = await stream_claude_tool(
+                model=model,
+                system_prompt=SCORING_SYSTEM_PROMPT,
+                user_message=user_message,
+                tool=tool,
+                should_abort=sdt_disqualifies,
+                temperature=SCORER_TEMPERATURE,
+                max_tokens=SCORER_MAX_TOKENS,
+                is_valid=is_valid,
+            )
+            if aborted:
+                # Alleen de (door sdt_disqualifies gevalideerde) SDT-score; de overige
+                # velden van de afgebroken stream zijn niet gecontroleerd
+                return {SDT_FIELD: tool_input[SDT_FIELD]}, parse_failures
+        else:
+            tool_input, _, _ = await call_claude_tool(
+                model=model,
+                system_prompt=SCORING_SYSTEM_PROMPT,
+                user_message=user_message,
+                tool=tool,
+                temperature=SCORER_TEMPERATURE,
+                max_tokens=SCORER_MAX_TOKENS,
+                is_valid=is_valid,
+            )
+
+        errors = validate_llm_score(tool_input, fields)
+        if not errors:
+            return tool_input, parse_failures
+
+        parse_failures += 1
+        print(f"Ongeldige judge-response (poging {attempt + 1}/{SCORER_PARSE_RETRIES + 1}): "
+              f"{'; '.join(errors[:3])}")
+
+    raise ScoringError(
+        f"Geen geldige score na {parse_failures} pogingen",
+        parse_failures=parse_failures,
+    )
+
+
+def aggregate_judgements(values: list[float], aggregation: str = "median") -> float:
+    """
+    Combineer meerdere judge-scores voor dezelfde dimensie.
+    aggregation: "median" of "trimmed_mean" (20% van beide kanten weg, vanaf 3 waarden).
+    """
+    if aggregation == "median":
+        return statistics.median(values)
+    if aggregation == "trimmed_mean":
+        ordered = sorted(values)
+        trim = int(len(ordered) * 0.2) if len(ordered) >= 3 else 0
+        return statistics.mean(ordered[trim:len(ordered) - trim])
+    raise ValueError(f"Onbekende aggregatie: {aggregation}")
+
+
+def scores_differ(a: SermonScore, b: SermonScore, z: float = 2.0) -> bool:
+    """
+    Is het verschil tussen twee scores groter dan de judge-ruis?
+    Zonder variantie-schatting (enkele judge) telt elk verschil.
+    """
+    noise = z * (a.overall_stderr ** 2 + b.overall_stderr ** 2) ** 0.5
+    return abs(a.overall_score - b.overall_score) > noise
 
 
 async def compute_full_score(
     generated_sermon: str,
     scripture_text: str,
     reference_sermons: list[str],
+    ensemble_size: int = SCORER_ENSEMBLE_SIZE,
+    ensemble_mode: str = SCORER_ENSEMBLE_MODE,
+    aggregation: str = SCORER_AGGREGATION,
+    model: str = SCORER_MODEL,
 ) -> SermonScore:
     """
     Bereken de volledige score voor een gegenereerde preek.
     Combineert stilometrische analyse met LLM-gebaseerde theologische beoordeling.
+
+    Met ensemble_size > 1 worden meerdere judge-calls gelijktijdig gedaan
+    ("repeat": de volledige rubric K keer; "split": elk rubric-deel uit
+    RUBRIC_GROUPS K keer) en per dimensie geaggregeerd met `aggregation`.
     """
     # Stilometrische analyse
     metrics, words = analyze_sermon(generated_sermon)
     stylometric_score, _ = compute_stylometric_score(metrics, words)
     stylometric_feedback = generate_stylometric_feedback(metrics, words)
 
+    # Letterlijke overname uit de voorbeeldpreken (de judge zou die als "authentiek" belonen)
+    overlap = check_overlap(generated_sermon, reference_sermons)
+    overlap_penalty = OVERLAP_PENALTY if overlap.longest_span >= OVERLAP_MAX_SPAN else 1.0
+    if overlap_penalty < 1.0:
+        stylometric_feedback += (
+            f"\nVermijd letterlijk overnemen uit de voorbeeldpreken: {overlap.longest_span} woorden "
+            f"op rij zijn gekopieerd (\"{overlap.longest_span_text[:120]}...\")."
+        )
+
+    # Citaten van dichters en filosofen, vergeleken met het corpusprofiel (zonder LLM-call)
+    citations = citation_feedback(generated_sermon)
+    if citations:
+        stylometric_feedback += f"\n{citations}"
+
     # LLM-gebaseerde score
     user_message = f"""Beoordeel de volgende preek:
 
@@ -407,34 +661,81 @@ BIJBELTEKST: {scripture_text}
 PREEK:
 {generated_sermon}
 
-Geef je beoordeling in het gevraagde JSON-formaat."""
+Geef je beoordeling via de tool record_sermon_score."""
 
-    response, _, _ = await call_claude(
-        model=SCORER_MODEL,
-        system_prompt=SCORING_SYSTEM_PROMPT,
-        user_message=user_message,
-        temperature=SCORER_TEMPERATURE,
-        max_tokens=SCORER_MAX_TOKENS,
-    )
-
-    llm_scores = parse_llm_score(response)
+    if ensemble_mode == "split":
+        groups = list(RUBRIC_GROUPS.values())
+    elif ensemble_mode == "repeat":
+        groups = [None]
+    else:
+        raise ValueError(f"Onbekende ensemble-modus: {ensemble_mode}")
+
+    calls = []
+    for fields in groups:
+        message = user_message
+        if fields is not None:
+            message += f"\n\nBeoordeel in deze ronde ALLEEN: {', '.join(fields)}."
+        calls.extend(
+            request_llm_score(message, model=model, fields=fields)
+            for _ in range(max(1, ensemble_size))
+        )
+    results = await asyncio.gather(*calls, return_exceptions=True)
+
+    # Verzamel alle geldige judgements; mislukte calls tellen alleen mee als parse failures
+    samples: dict[str, list[float]] = {}
+    judgements: list[dict] = []
+    parse_failures = 0
+    for result in results:
+        if isinstance(result, ScoringError):
+            parse_failures += result.parse_failures
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        llm_scores, failures = result
+        parse_failures += failures
+        judgements.append(llm_scores)
+        for field in [SDT_FIELD, *LLM_SCORE_FIELDS]:
+            if field == SDT_FIELD and SDT_FIELD in llm_scores:
+                samples.setdefault(field, []).append(llm_scores[SDT_FIELD]["score"])
+            elif field in llm_scores:
+                samples.setdefault(field, []).append(llm_scores[field])
+
+    # Aggregeer per dimensie (normaliseer naar 0-1)
+    aggregated = {
+        field: aggregate_judgements(values, aggregation) / 10
+        for field, values in samples.items()
+    }
+    score_variance = {
+        field: statistics.variance([v / 10 for v in values]) if len(values) > 1 else 0.0
+        for field, values in samples.items()
+    }
 
-    # Extraheer individuele scores (normaliseer naar 0-1)
-    theological = llm_scores.get("theological_score", 5) / 10
-    metaphorical = llm_scores.get("metaphorical_score", 5) / 10
-    transformation = llm_scores.get("transformation_score", 5) / 10
-    rhetorical = llm_scores.get("rhetorical_score", 5) / 10
-    coherence = llm_scores.get("coherence_score", 5) / 10
-    language = llm_scores.get("language_score", 5) / 10
-    flow = llm_scores.get("flow_score", 5) / 10
-    humor = llm_scores.get("humor_score", 5) / 10
+    # Afgebroken judge-calls leveren alleen een (diskwalificerende) SDT-score op:
+    # de ontbrekende dimensies tellen als 0, zodat overall_score een ondergrens is
+    missing = [f for f in [SDT_FIELD, *LLM_SCORE_FIELDS] if f not in samples]
+    received_fields = None
+    if missing:
+        if SDT_FIELD not in aggregated or aggregated[SDT_FIELD] * 10 > SCORER_SDT_ABORT_AT:
+            raise ScoringError(
+                f"Geen geldige judgement voor: {', '.join(missing)}",
+                parse_failures=parse_failures,
+            )
+        received_fields = [f for f in [SDT_FIELD, *LLM_SCORE_FIELDS] if f in samples]
+        for field in missing:
+            aggregated[field] = 0.0
+            score_variance[field] = 0.0
+
+    theological = aggregated["theological_score"]
+    metaphorical = aggregated["metaphorical_score"]
+    transformation = aggregated["transformation_score"]
+    rhetorical = aggregated["rhetorical_score"]
+    coherence = aggregated["coherence_score"]
+    language = aggregated["language_score"]
+    flow = aggregated["flow_score"]
+    humor = aggregated["humor_score"]
 
     # Show don't tell penalty
-    show_dont_tell = llm_scores.get("show_dont_tell_discipline", {})
-    if isinstance(show_dont_tell, dict):
-        sdt_score = show_dont_tell.get("score", 10) / 10
-    else:
-        sdt_score = 1.0
+    sdt_score = aggregated[SDT_FIELD]
 
     # Gewogen overall score
     # Weights gebaseerd op het belang voor Jüngel-authenticiteit
@@ -462,11 +763,38 @@ Geef je beoordeling in het gevraagde JSON-formaat."""
 
     # Combineer stilometrie en LLM, met SDT penalty
     # 30% stilometrie, 70% LLM, vermenigvuldigd met SDT factor
-    combined_score = (0.3 * stylometric_score + 0.7 * llm_overall) * sdt_score
+    # Overname uit de voorbeeldpreken drukt de score nog eens met overlap_penalty
+    base_score = 0.3 * stylometric_score + 0.7 * llm_overall
+    combined_score = base_score * sdt_score * overlap_penalty
+
+    # Standaardfout van de overall score (delta-methode, dimensies onafhankelijk verondersteld).
+    # Per dimensie gedeeld door het aantal werkelijk ontvangen samples: bij mislukte
+    # calls of rubric-delen is dat minder dan ensemble_size
+    sample_counts = {field: len(values) for field, values in samples.items()}
 
-    # Maak feedback string
-    feedback_details = llm_scores.get("feedback_details", {})
-    overall_assessment = llm_scores.get("overall_assessment", "")
+    def mean_variance(field: str) -> float:
+        return score_variance[field] / sample_counts.get(field, 1)
+
+    llm_variance = sum(
+        (weights[name] ** 2) * mean_variance(f"{name}_score") for name in weights
+    )
+    overall_variance = (
+        (0.7 * sdt_score) ** 2 * llm_variance + base_score ** 2 * mean_variance(SDT_FIELD)
+    )
+    overall_stderr = overlap_penalty * overall_variance ** 0.5
+
+    # Maak feedback string (eerste beschikbare feedback per onderdeel)
+    feedback_details = {}
+    assessments = []
+    sdt_feedback = ""
+    for judgement in judgements:
+        for key, text in judgement.get("feedback_details", {}).items():
+            feedback_details.setdefault(key, text)
+        if judgement.get("overall_assessment") and judgement["overall_assessment"] not in assessments:
+            assessments.append(judgement["overall_assessment"])
+        if not sdt_feedback and SDT_FIELD in judgement:
+            sdt_feedback = judgement[SDT_FIELD].get("feedback", "")
+    overall_assessment = " ".join(assessments[:len(groups)])
 
     llm_feedback = f"""Overall: {overall_assessment}
 Theologisch: {feedback_details.get('theological', 'N/A')}
@@ -477,8 +805,10 @@ Coherentie: {feedback_details.get('coherence', 'N/A')}
 Taal/Flow: {feedback_details.get('language_and_flow', 'N/A')}
 Humor: {feedback_details.get('humor', 'N/A')}"""
 
-    if isinstance(show_dont_tell, dict) and show_dont_tell.get("feedback"):
-        llm_feedback += f"\nShow don't tell: {show_dont_tell['feedback']}"
+    if sdt_feedback:
+        llm_feedback += f"\nShow don't tell: {sdt_feedback}"
+    if received_fields is not None:
+        llm_feedback += "\n(Beoordeling afgebroken na een diskwalificerende show-don't-tell score.)"
 
     return SermonScore(
         overall_score=combined_score,
@@ -494,4 +824,13 @@ Humor: {feedback_details.get('humor', 'N/A')}"""
         flow_score=flow,
         humor_score=humor,
         sdt_score=sdt_score,
+        parse_failures=parse_failures,
+        # Onafhankelijke oordelen per dimensie (bij "split" niet het aantal calls)
+        judge_count=min(sample_counts.values()),
+        score_variance=score_variance,
+        overall_stderr=overall_stderr,
+        copied_span=overlap.longest_span,
+        overlap_ratio=overlap.overlap_ratio,
+        overlap_penalty=overlap_penalty,
+        received_fields=received_fields,
     )
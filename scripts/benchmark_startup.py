@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Startup-benchmark voor de CLI.
+Meet met `python -X importtime` hoe lang het importeren van de entry points
+duurt, toont de traagste imports, meet de wandkloktijd van de read-only
+commando's en controleert dat die de API-SDK en numpy niet laden.
+
+Gebruik (vanuit de root van de repository):
+    python scripts/benchmark_startup.py [--runs 5] [--max-ms 150]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# Modules die een read-only commando niet mag laden
+HEAVY_MODULES = ["anthropic", "numpy", "dotenv", "generator", "scorer"]
+
+# Entry points waarvan de import-tijd gemeten wordt
+ENTRY_MODULES = ["main", "prompt_store", "corpus", "llm"]
+
+READ_ONLY_COMMANDS = ["stats", "best", "history"]
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def run_python(args: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=REPO_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulatieve import-tijd (µs) per module voor `import module`."""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} mislukt:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def best_of(runs: int, measure) -> float:
+    """Minimum over `runs` metingen (het minst verstoord door andere processen)."""
+    return min(measure() for _ in range(runs))
+
+
+def command_ms(command: str) -> float:
+    start = time.perf_counter()
+    result = run_python(["main.py", command])
+    if result.returncode != 0:
+        raise RuntimeError(f"main.py {command} mislukt:\n{result.stderr}")
+    return (time.perf_counter() - start) * 1000
+
+
+def loaded_heavy_modules() -> list[str]:
+    """Welke HEAVY_MODULES `import main` meeneemt."""
+    code = f"import sys, main; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return run_python(["-c", code]).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup-benchmark voor de CLI")
+    parser.add_argument("--runs", type=int, default=5, help="Metingen per onderdeel (minimum telt)")
+    parser.add_argument("--max-ms", type=float, help="Faal als een read-only commando trager is")
+    parser.add_argument("--top", type=int, default=10, help="Aantal traagste imports om te tonen")
+    args = parser.parse_args()
+
+    print("Import-tijd (cumulatief, beste van {} runs):".format(args.runs))
+    for module in ENTRY_MODULES:
+        us = best_of(args.runs, lambda: import_times(module)[module])
+        print(f"  {module:<14} {us / 1000:7.1f} ms")
+
+    print(f"\nTraagste imports onder main:")
+    times = import_times("main")
+    for module, us in sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {module:<40} {us / 1000:7.1f} ms")
+
+    print("\nRead-only commando's (wandklok, inclusief interpreter-start):")
+    baseline = best_of(args.runs, lambda: _interpreter_ms())
+    slow = []
+    for command in READ_ONLY_COMMANDS:
+        ms = best_of(args.runs, lambda: command_ms(command))
+        print(f"  main.py {command:<8} {ms:7.1f} ms  (kale interpreter: {baseline:.1f} ms)")
+        if args.max_ms is not None and ms > args.max_ms:
+            slow.append(command)
+
+    heavy = loaded_heavy_modules()
+    if heavy:
+        print(f"\nLET OP: import main laadt {', '.join(heavy)}")
+    else:
+        print("\nimport main laadt geen API-SDK, numpy of generator")
+
+    if heavy or slow:
+        sys.exit(1)
+
+
+def _interpreter_ms() -> float:
+    start = time.perf_counter()
+    run_python(["-c", "pass"])
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    main()
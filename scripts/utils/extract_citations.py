@@ -1,63 +1,37 @@
-import glob
-import json
-import re
+import sys
 from collections import defaultdict
+from pathlib import Path
 
-def extract_unique_citations():
+# Draait vanuit de root van de repository; de citatie-index staat daar
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from citations import update_citation_index
+
+
+def extract_unique_citations(kind: str = "corpus"):
     """
-    Finds all 'mogelijk*.json' files, extracts author citations from the
-    '_wijzigingen' field, and prints a unique list.
-    Corrected to handle Unicode characters in names.
+    Lists every cited poet, philosopher and theologian (CITATION_AUTHORS in config.py)
+    with the sermons that mention them. Uses the citation index (citations.py), which
+    scans the full text of every sermon instead of only the '_wijzigingen' log.
     """
-    files = glob.glob('docs/mogelijk_*.json')
-    citations = defaultdict(set)
-
-    # Regex to capture author and optional quote from the '_wijzigingen' field.
-    # Now handles Unicode characters and is case-insensitive.
-    pattern = re.compile(r"([\w\s\.]+)[\- ](?:citaat|referentie) toegevoegd(?:\s*\((.*?)\))?", re.IGNORECASE)
-
-    for file_path in files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            changes = data.get('_wijzigingen', [])
-            for change in changes:
-                # Special case for Heidegger/Otto from mogelijk_06_nl.json which is not in ()
-                if "Heidegger en Rudolf Otto referenties behouden" in change:
-                    citations["Heidegger"].add("Referentie (geen specifieke quote in log)")
-                    citations["Rudolf Otto"].add("Referentie (geen specifieke quote in log)")
-                    continue
-
-                match = pattern.search(change)
-                if match:
-                    author = match.group(1).strip()
-                    quote = match.group(2)
-                    
-                    # Capitalize author name for consistency
-                    author = ' '.join(word.capitalize() for word in author.split())
-
-                    # Skip known non-author patterns
-                    if author.lower() in ["haben→zijn", "expliciete hebben→sein terminologie"]:
-                        continue
-                    
-                    if quote:
-                        citations[author].add(quote.strip())
-
-        except (json.JSONDecodeError, FileNotFoundError) as e:
-            print(f"Error processing {file_path}: {e}")
+    citations = defaultdict(list)
+    for path, doc in sorted(update_citation_index().items()):
+        if doc["kind"] != kind:
+            continue
+        for author, count in doc["counts"].items():
+            citations[author].append((doc["title"] or path, count))
 
     if not citations:
         print("Geen citaten gevonden in de opgegeven bestanden.")
         return
 
-    print("Unieke citaten en referenties gevonden in de 'mogelijke preken' (gecorrigeerde versie):\n")
-    for author, quotes in sorted(citations.items()):
+    print(f"Geciteerde auteurs in de {kind}-preken:\n")
+    for author, sermons in sorted(citations.items()):
         print(f"--- {author} ---")
-        if quotes:
-            for i, quote in enumerate(sorted(list(quotes)), 1):
-                print(f"  {i}. {quote}")
+        for i, (title, count) in enumerate(sermons, 1):
+            print(f"  {i}. {title} ({count}x)")
         print()
 
+
 if __name__ == "__main__":
-    extract_unique_citations()
\ No newline at end of file
+    extract_unique_citations(sys.argv[1] if len(sys.argv) > 1 else "corpus")
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+
+"""
+Full-text zoekindex over het referentiecorpus en alle gegenereerde preken.
+Een inverted index met posities per woord (SQLite, cache/search_index.sqlite3)
+ondersteunt woorden, prefixen (`hölderl*`) en frasen (`"het lege huis"`).
+Bij elke zoekopdracht wordt de index eerst bijgewerkt: alleen bestanden waarvan
+grootte of mtime veranderd is worden opnieuw geïndexeerd.
+
+Query-syntax: alle termen moeten voorkomen (AND); een frase tussen dubbele
+aanhalingstekens moet letterlijk (op woordniveau) voorkomen.
+
+Gebruik:
+    python search_index.py query Hölderlin
+    python search_index.py query '"lege huis" gemeente' [--kind output] [--passage "Lukas 11"]
+    python search_index.py update [--rebuild]
+    python search_index.py stats
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+from array import array
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from config import CORPUS_SOURCES
+from corpus import normalize_text
+
+BASE_DIR = Path(__file__).parent
+SEARCH_INDEX_DB_FILE = BASE_DIR / "cache" / "search_index.sqlite3"
+
+# Gegenereerde preken (relatief aan de repository); *_prompt.txt zijn geen preken
+OUTPUT_SOURCES = ["output/sermon_*.txt", "output/iterations/*/iter_*_sermon.txt"]
+
+# Scheidt de score-header van de preek in de output-bestanden (zie save_iteration)
+SERMON_HEADER_SEPARATOR = "=" * 60
+
+WORD_PATTERN = re.compile(r"\w+")
+QUERY_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,    -- Relatief aan de repository
+    kind TEXT NOT NULL,           -- corpus of output
+    title TEXT NOT NULL,          -- Schriftgedeelte
+    stamp TEXT NOT NULL,          -- Grootte en mtime van het bestand bij het indexeren
+    token_count INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    positions BLOB NOT NULL,      -- array('I') met woordposities
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+"""
+
+
+@dataclass
+class SearchHit:
+    """Een document dat aan de query voldoet."""
+    path: str
+    kind: str
+    title: str
+    matches: int              # Aantal treffers (woorden en frasen samen)
+    first_position: int       # Woordpositie van de eerste treffer
+
+
+def tokenize_with_offsets(text: str) -> list[tuple[str, int, int]]:
+    """Kleine-letter woorden met hun begin- en eind-offset in de tekst."""
+    return [(m.group().lower(), m.start(), m.end()) for m in WORD_PATTERN.finditer(text)]
+
+
+def connect(db_file: Path = SEARCH_INDEX_DB_FILE) -> sqlite3.Connection:
+    os.makedirs(db_file.parent, exist_ok=True)
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def source_documents() -> dict[str, tuple[str, Path]]:
+    """Alle te indexeren bestanden: relatief pad -> (kind, absoluut pad)."""
+    documents = {}
+    for kind, patterns in (("corpus", CORPUS_SOURCES), ("output", OUTPUT_SOURCES)):
+        for pattern in patterns:
+            for path in glob.glob(str(BASE_DIR / pattern)):
+                if path.endswith("_prompt.txt"):
+                    continue
+                documents[str(Path(path).relative_to(BASE_DIR))] = (kind, Path(path))
+    return documents
+
+
+def run_scripture_text(run_dir: Path) -> str:
+    """Bijbeltekst van een run uit zijn run.json; zonder run.json de run-ID."""
+    metadata_file = run_dir / "run.json"
+    if metadata_file.exists():
+        with open(metadata_file, "r", encoding="utf-8") as f:
+            scripture_text = json.load(f).get("scripture_text")
+        if scripture_text:
+            return scripture_text
+    return run_dir.name
+
+
+def document_stamp(path: Path) -> str:
+    """
+    Grootte en mtime van een bestand. Voor een iteratie-preek telt ook run.json mee:
+    die wordt pas aan het eind van de run geschreven en levert de titel.
+    """
+    stat = path.stat()
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    metadata_file = path.parent / "run.json"
+    if path.name.startswith("iter_") and metadata_file.exists():
+        stamp += f":{metadata_file.stat().st_mtime_ns}"
+    return stamp
+
+
+def read_document(kind: str, path: Path) -> tuple[str, str]:
+    """Lees titel (schriftgedeelte) en preektekst van een bron- of output-bestand."""
+    if kind == "corpus":
+        with open(path, "r", encoding="utf-8") as f:
+            sermon = json.load(f)
+        return sermon.get("schriftgedeelte", ""), normalize_text(sermon["tekst"])
+
+    content = path.read_text(encoding="utf-8")
+    header, separator, body = content.partition(SERMON_HEADER_SEPARATOR)
+    if not separator:
+        header, body = "", content
+    title = ""
+    for line in header.splitlines():
+        if line.startswith("Bijbeltekst:"):
+            title = line.split(":", 1)[1].strip()
+    if not title:
+        # Iteratie-bestanden hebben geen Bijbeltekst-regel; die staat in run.json van de run
+        title = run_scripture_text(path.parent)
+    return title, body.strip()
+
+
+def index_document(conn: sqlite3.Connection, rel_path: str, kind: str, path: Path, stamp: str):
+    """(Her)indexeer één document: oude postings vervallen via ON DELETE CASCADE."""
+    title, text = read_document(kind, path)
+    positions: dict[str, array] = {}
+    tokens = tokenize_with_offsets(text)
+    for position, (term, _, _) in enumerate(tokens):
+        positions.setdefault(term, array("I")).append(position)
+
+    conn.execute("DELETE FROM documents WHERE path = ?", (rel_path,))
+    doc_id = conn.execute(
+        "INSERT INTO documents (path, kind, title, stamp, token_count, text) VALUES (?, ?, ?, ?, ?, ?)",
+        (rel_path, kind, title, stamp, len(tokens), text),
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO postings (term, doc_id, positions) VALUES (?, ?, ?)",
+        ((term, doc_id, term_positions.tobytes()) for term, term_positions in positions.items()),
+    )
+
+
+def update_index(conn: sqlite3.Connection, rebuild: bool = False) -> dict:
+    """
+    Breng de index in lijn met de bestanden op schijf (alleen een stat per bestand
+    als er niets veranderd is). Returns: aantallen per soort wijziging
+    """
+    counts = {"new": 0, "updated": 0, "removed": 0, "unchanged": 0}
+    with conn:
+        if rebuild:
+            conn.execute("DELETE FROM documents")
+        known = dict(conn.execute("SELECT path, stamp FROM documents").fetchall())
+        documents = source_documents()
+        for rel_path, (kind, path) in sorted(documents.items()):
+            stamp = document_stamp(path)
+            if known.get(rel_path) == stamp:
+                counts["unchanged"] += 1
+                continue
+            index_document(conn, rel_path, kind, path, stamp)
+            counts["updated" if rel_path in known else "new"] += 1
+
+        for rel_path in set(known) - set(documents):
+            conn.execute("DELETE FROM documents WHERE path = ?", (rel_path,))
+            counts["removed"] += 1
+    return counts
+
+
+def term_positions(conn: sqlite3.Connection, term: str) -> dict[int, set[int]]:
+    """Posities per document voor een term; `term*` neemt alle termen met dat prefix samen."""
+    if term.endswith("*"):
+        prefix = term[:-1]
+        # Bereik-query op de primaire sleutel: alle termen die met het prefix beginnen
+        rows = conn.execute(
+            "SELECT doc_id, positions FROM postings WHERE term >= ? AND term < ?",
+            (prefix, prefix + "\U0010ffff"),
+        )
+    else:
+        rows = conn.execute("SELECT doc_id, positions FROM postings WHERE term = ?", (term,))
+
+    result: dict[int, set[int]] = {}
+    for doc_id, blob in rows:
+        positions = array("I")
+        positions.frombytes(blob)
+        result.setdefault(doc_id, set()).update(positions)
+    return result
+
+
+def phrase_positions(conn: sqlite3.Connection, terms: list[str]) -> dict[int, list[int]]:
+    """Startposities per document waar de termen direct na elkaar voorkomen."""
+    postings = [term_positions(conn, term) for term in terms]
+    documents = set(postings[0])
+    for term_postings in postings[1:]:
+        documents &= set(term_postings)
+
+    result = {}
+    for doc_id in documents:
+        starts = [
+            start for start in sorted(postings[0][doc_id])
+            if all(start + offset in postings[offset][doc_id] for offset in range(1, len(terms)))
+        ]
+        if starts:
+            result[doc_id] = starts
+    return result
+
+
+def parse_query(query: str) -> list[list[str]]:
+    """Splits een query in clauses: een enkel woord of een frase (lijst van woorden)."""
+    clauses = []
+    for phrase, word in QUERY_PATTERN.findall(query):
+        if phrase:
+            terms = [m.group().lower() for m in WORD_PATTERN.finditer(phrase)]
+        else:
+            prefix = word.endswith("*")
+            terms = [m.group().lower() for m in WORD_PATTERN.finditer(word)]
+            if prefix and len(terms) == 1:
+                terms = [terms[0] + "*"]
+        if terms:
+            clauses.append(terms)
+    return clauses
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    kind: Optional[str] = None,
+    passage: Optional[str] = None,
+    limit: Optional[int] = 20,
+) -> list[SearchHit]:
+    """
+    Zoek documenten die alle clauses van `query` bevatten, gesorteerd op aantal treffers.
+    `kind` beperkt tot corpus of output, `passage` tot titels die die tekst bevatten.
+    """
+    clauses = parse_query(query)
+    if not clauses and not passage:
+        return []
+
+    matches: Counter = Counter()
+    first_position: dict[int, int] = {}
+    candidates: Optional[set[int]] = None
+    for terms in clauses:
+        if len(terms) == 1:
+            hits = {doc_id: sorted(positions) for doc_id, positions in term_positions(conn, terms[0]).items()}
+        else:
+            hits = phrase_positions(conn, terms)
+        candidates = set(hits) if candidates is None else candidates & set(hits)
+        for doc_id, positions in hits.items():
+            matches[doc_id] += len(positions)
+            first_position[doc_id] = min(first_position.get(doc_id, positions[0]), positions[0])
+        if not candidates:
+            return []
+
+    sql = "SELECT id, path, kind, title FROM documents WHERE 1 = 1"
+    params: list = []
+    if kind:
+        sql += " AND kind = ?"
+        params.append(kind)
+    if passage:
+        sql += " AND title LIKE ?"
+        params.append(f"%{passage}%")
+    hits = [
+        SearchHit(row["path"], row["kind"], row["title"], matches[row["id"]], first_position.get(row["id"], 0))
+        for row in conn.execute(sql, params)
+        if candidates is None or row["id"] in candidates
+    ]
+    hits.sort(key=lambda hit: (-hit.matches, hit.path))
+    return hits[:limit] if limit else hits
+
+
+def snippet(conn: sqlite3.Connection, hit: SearchHit, width: int = 12) -> str:
+    """Tekstfragment rond de eerste treffer (`width` woorden aan weerszijden)."""
+    text = conn.execute("SELECT text FROM documents WHERE path = ?", (hit.path,)).fetchone()[0]
+    tokens = tokenize_with_offsets(text)
+    if not tokens:
+        return ""
+    start = tokens[max(0, hit.first_position - width)][1]
+    end = tokens[min(len(tokens) - 1, hit.first_position + width)][2]
+    return " ".join(text[start:end].split())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-text zoekindex over corpus en gegenereerde preken")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="Zoek in de index")
+    query_parser.add_argument("query", nargs="?", default="", help='Woorden, prefix* en "frasen"')
+    query_parser.add_argument("--kind", choices=["corpus", "output"])
+    query_parser.add_argument("--passage", help="Alleen preken over dit schriftgedeelte (deel van de titel)")
+    query_parser.add_argument("--limit", type=int, default=20)
+
+    update_parser = subparsers.add_parser("update", help="Werk de index bij")
+    update_parser.add_argument("--rebuild", action="store_true", help="Indexeer alles opnieuw")
+
+    subparsers.add_parser("stats", help="Omvang van de index")
+    args = parser.parse_args()
+
+    with closing(connect()) as conn:
+        start = time.perf_counter()
+        counts = update_index(conn, rebuild=getattr(args, "rebuild", False))
+        update_ms = (time.perf_counter() - start) * 1000
+
+        if args.command == "update":
+            print(f"Nieuw: {counts['new']}, bijgewerkt: {counts['updated']}, "
+                  f"verwijderd: {counts['removed']}, ongewijzigd: {counts['unchanged']} ({update_ms:.0f} ms)")
+
+        elif args.command == "stats":
+            for row in conn.execute("SELECT kind, COUNT(*), SUM(token_count) FROM documents GROUP BY kind"):
+                print(f"{row[0]:<8} {row[1]:>5} documenten {row[2]:>9,} woorden")
+            terms = conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0]
+            print(f"{terms:,} unieke termen")
+
+        elif args.command == "query":
+            start = time.perf_counter()
+            hits = search(conn, args.query, args.kind, args.passage, args.limit)
+            query_ms = (time.perf_counter() - start) * 1000
+            for hit in hits:
+                print(f"{hit.matches:>4}x  {hit.title:<28} {hit.path}")
+                if args.query:
+                    print(f"       …{snippet(conn, hit)}…")
+            print(f"{len(hits)} resultaten in {query_ms:.1f} ms (index bijwerken: {update_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
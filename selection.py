@@ -0,0 +1,268 @@
+"""
+Selectie van de beste kandidaat-preek binnen een run.
+De goedkope scorer rangschikt alle kandidaten; duurdere beoordeling
+wordt alleen besteed aan de kandidaten die ertoe doen.
+"""
+import asyncio
+import math
+import random
+from typing import Optional
+
+from config import (
+    FINAL_EVAL_MODEL,
+    FINAL_EVAL_TOP_K,
+    PAIRWISE_MODEL,
+    PAIRWISE_MAX_TOKENS,
+    SCORER_PARSE_RETRIES,
+    SCORER_TEMPERATURE,
+    SURROGATE_KEEP,
+)
+from llm import call_claude_tool
+from scorer import SermonScore, ScoringError, compute_full_score
+
+
+def rank_candidates(scores: list[SermonScore]) -> list[int]:
+    """
+    Rangschik kandidaten op hun goedkope score.
+    Bij gelijke overall score beslist de (lokale) stilometrische score.
+    Returns: indices, beste eerst.
+    """
+    return sorted(
+        range(len(scores)),
+        key=lambda i: (scores[i].overall_score, scores[i].stylometric_score),
+        reverse=True,
+    )
+
+
+def surrogate_prerank(sermons: list[str], keep: int = SURROGATE_KEEP) -> Optional[list[int]]:
+    """
+    Rangschik kandidaten lokaal met het surrogaat-model (zie surrogate.py).
+    Returns: indices van de `keep` meest belovende kandidaten, beste eerst;
+    None als er (nog) geen getraind model is.
+    """
+    # Laat import: NumPy en het model zijn alleen nodig als er echt voorgeselecteerd wordt
+    from surrogate import load_surrogate
+
+    model = load_surrogate()
+    if model is None or "overall_score" not in model.targets:
+        return None
+
+    predicted = [model.predict(text)["overall_score"] for text in sermons]
+    order = sorted(range(len(sermons)), key=lambda i: predicted[i], reverse=True)
+    return order[:keep]
+
+
+async def rejudge_top_candidates(
+    sermons: list[str],
+    scores: list[SermonScore],
+    scripture_text: str,
+    reference_sermons: list[str],
+    top_k: int = FINAL_EVAL_TOP_K,
+    model: str = FINAL_EVAL_MODEL,
+) -> dict[int, SermonScore]:
+    """
+    Herbeoordeel alleen de top-k kandidaten (volgens rank_candidates) met `model`.
+    De calls lopen gelijktijdig.
+    Returns: {kandidaat-index: finale score}; kandidaten waarvan de finale
+    beoordeling mislukte ontbreken.
+    """
+    top = rank_candidates(scores)[:top_k]
+    results = await asyncio.gather(
+        *(
+            compute_full_score(
+                generated_sermon=sermons[i],
+                scripture_text=scripture_text,
+                reference_sermons=reference_sermons,
+                model=model,
+            )
+            for i in top
+        ),
+        return_exceptions=True,
+    )
+
+    final_scores = {}
+    for index, result in zip(top, results):
+        if isinstance(result, ScoringError):
+            print(f"Finale beoordeling van kandidaat {index + 1} mislukt: {result}")
+            continue
+        if isinstance(result, BaseException):
+            raise result
+        final_scores[index] = result
+
+    return final_scores
+
+
+PAIRWISE_SYSTEM_PROMPT = """Je bent een expert in de theologie en preekstijl van Eberhard Jüngel (1934-2021).
+Je krijgt twee preken (A en B) over dezelfde Bijbeltekst. Kies welke van de twee het meest aanvoelt als een preek die Jüngel zelf had kunnen houden.
+
+Weeg daarbij:
+- "Show, don't tell": theologie wordt getoond in verhaal en beeld, niet benoemd met Jüngel-terminologie
+- Theologische authenticiteit: God in concreet handelen, genade die voorafgaat, het kruis als venster
+- Metaforen die ontsluiten en verwondering wekken
+- Retoriek: paradoxen, retorische vragen, lange zinnen afgewisseld met korte klappers
+- Samenhang, pastorale warmte, ironie en lichtheid
+
+Negeer de volgorde waarin de preken staan en hun lengte zolang beide binnen 10.000-15.000 karakters vallen.
+Geef je oordeel uitsluitend via de tool `record_preference`."""
+
+COMPARISON_TOOL = {
+    "name": "record_preference",
+    "description": "Leg vast welke van de twee preken het meest Jüngeliaans is.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "reason": {"type": "string"},
+            "winner": {"type": "string", "enum": ["A", "B"]},
+        },
+        "required": ["reason", "winner"],
+    },
+}
+
+
+def is_valid_comparison(tool_input) -> bool:
+    return isinstance(tool_input, dict) and tool_input.get("winner") in ("A", "B")
+
+
+async def compare_sermons(
+    sermon_a: str,
+    sermon_b: str,
+    scripture_text: str,
+    model: str = PAIRWISE_MODEL,
+) -> Optional[bool]:
+    """
+    Laat de judge twee preken over dezelfde tekst vergelijken.
+    De presentatievolgorde wordt willekeurig omgedraaid tegen positie-bias.
+    Returns: True als sermon_a wint, False als sermon_b wint, None als de
+    judge binnen het retry-budget geen geldig oordeel gaf.
+    """
+    swapped = random.random() < 0.5
+    first, second = (sermon_b, sermon_a) if swapped else (sermon_a, sermon_b)
+
+    user_message = f"""BIJBELTEKST: {scripture_text}
+
+=== PREEK A ===
+{first}
+
+=== PREEK B ===
+{second}
+
+Welke preek is het meest Jüngeliaans?"""
+
+    for _ in range(SCORER_PARSE_RETRIES + 1):
+        tool_input, _, _ = await call_claude_tool(
+            model=model,
+            system_prompt=PAIRWISE_SYSTEM_PROMPT,
+            user_message=user_message,
+            tool=COMPARISON_TOOL,
+            temperature=SCORER_TEMPERATURE,
+            max_tokens=PAIRWISE_MAX_TOKENS,
+            is_valid=is_valid_comparison,
+        )
+        if is_valid_comparison(tool_input):
+            first_wins = tool_input["winner"] == "A"
+            return first_wins != swapped
+
+    return None
+
+
+def fit_bradley_terry(
+    n: int,
+    outcomes: list[tuple[int, int]],
+    prior: float = 0.5,
+    iterations: int = 200,
+    tolerance: float = 1e-9,
+) -> list[float]:
+    """
+    Schat Bradley-Terry sterktes met het MM-algoritme (Hunter, 2004).
+    outcomes: lijst van (winnaar, verliezer) indices.
+    Elke kandidaat speelt `prior` virtuele winst en verlies tegen een
+    referentiespeler met sterkte 1, zodat de schatting ook bestaat bij
+    schaarse vergelijkingen of kandidaten die nooit verloren.
+    Returns: log-sterktes (hoger = beter).
+    """
+    wins = [prior] * n
+    games: list[dict[int, int]] = [{} for _ in range(n)]
+    for winner, loser in outcomes:
+        wins[winner] += 1
+        games[winner][loser] = games[winner].get(loser, 0) + 1
+        games[loser][winner] = games[loser].get(winner, 0) + 1
+
+    strengths = [1.0] * n
+    for _ in range(iterations):
+        updated = []
+        for i in range(n):
+            denominator = 2 * prior / (strengths[i] + 1.0)
+            denominator += sum(
+                count / (strengths[i] + strengths[j]) for j, count in games[i].items()
+            )
+            updated.append(wins[i] / denominator)
+        change = max(abs(a - b) for a, b in zip(updated, strengths))
+        strengths = updated
+        if change < tolerance:
+            break
+
+    return [math.log(s) for s in strengths]
+
+
+def _swiss_pairs(order: list[int], played: set[frozenset]) -> list[tuple[int, int]]:
+    """
+    Koppel kandidaten met een vergelijkbare rangorde (Zwitsers systeem).
+    Herhaalde paren worden waar mogelijk vermeden.
+    """
+    remaining = list(order)
+    pairs = []
+    while len(remaining) > 1:
+        first = remaining.pop(0)
+        partner_index = next(
+            (k for k, other in enumerate(remaining) if frozenset((first, other)) not in played),
+            0,
+        )
+        pairs.append((first, remaining.pop(partner_index)))
+    return pairs
+
+
+async def tournament_rank(
+    sermons: list[str],
+    scripture_text: str,
+    initial_order: Optional[list[int]] = None,
+    rounds: Optional[int] = None,
+    model: str = PAIRWISE_MODEL,
+) -> tuple[list[tuple[int, float]], int]:
+    """
+    Rangschik kandidaten met paarsgewijze vergelijkingen en een Bradley-Terry model.
+
+    Per ronde worden kandidaten met een vergelijkbare huidige sterkte tegen
+    elkaar uitgezet en alle vergelijkingen van die ronde lopen gelijktijdig.
+    Met ceil(log2 N) + 1 rondes van N/2 vergelijkingen is het totaal
+    O(N log N) in plaats van alle O(N²) paren.
+
+    initial_order: startvolgorde (bijv. rank_candidates), anders willekeurig.
+    Returns: ([(index, log-sterkte)], beste eerst; aantal geldige vergelijkingen)
+    """
+    n = len(sermons)
+    if n < 2:
+        return [(i, 0.0) for i in range(n)], 0
+
+    rounds = rounds or math.ceil(math.log2(n)) + 1
+    order = list(initial_order) if initial_order else random.sample(range(n), n)
+    # Bij gelijke sterkte beslist de startvolgorde
+    seed_position = {index: position for position, index in enumerate(order)}
+    outcomes: list[tuple[int, int]] = []
+    played: set[frozenset] = set()
+
+    for _ in range(rounds):
+        pairs = _swiss_pairs(order, played)
+        results = await asyncio.gather(*(
+            compare_sermons(sermons[a], sermons[b], scripture_text, model=model)
+            for a, b in pairs
+        ))
+        for (a, b), a_wins in zip(pairs, results):
+            played.add(frozenset((a, b)))
+            if a_wins is None:
+                continue
+            outcomes.append((a, b) if a_wins else (b, a))
+
+        strengths = fit_bradley_terry(n, outcomes)
+        order = sorted(range(n), key=lambda i: (-strengths[i], seed_position[i]))
+
+    return [(i, strengths[i]) for i in order], len(outcomes)
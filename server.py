@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+"""
+Lokale HTTP-service voor de preek-generator (alleen standaardbibliotheek).
+Eén langlevend proces: alle jobs delen de API-client, de limiet op gelijktijdige
+API-calls (llm.py) en het al geladen corpus. Voortgang per job is te volgen
+als server-sent events.
+
+Endpoints:
+    POST /jobs               {"scripture_text", "scripture_context", "max_iterations"?,
+                              "target_score"?, "candidates_per_iteration"?}  -> 202 {"id", ...}
+    GET  /jobs               Overzicht van alle jobs
+    GET  /jobs/<id>          Status en (na afloop) resultaat
+    GET  /jobs/<id>/events   Voortgang als text/event-stream
+    POST /score              {"sermon", "scripture_text"}  -> scores
+    GET  /prompts/stats      Statistieken van de prompt-opslag
+
+Gebruik:
+    python server.py [--host 127.0.0.1] [--port 8765]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Optional
+
+from config import SERVER_HOST, SERVER_PORT, SERVER_MAX_CONCURRENT_JOBS, MAX_ITERATIONS, JOB_OPTIONS
+from corpus import load_corpus
+from generator import generate_with_iteration
+from job_queue import parse_job_options
+from prompt_store import get_prompt_stats
+from scorer import ScoringError, compute_full_score
+
+HTTP_REASONS = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+}
+
+MAX_BODY_BYTES = 1_000_000
+
+# Events waarna een job niet meer verandert
+TERMINAL_EVENTS = ("finished", "failed")
+
+
+class HTTPError(Exception):
+    """Fout die als HTTP-response met JSON-body naar de client gaat."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class Job:
+    """Een generatie-job en zijn voortgang."""
+    id: str
+    scripture_text: str
+    scripture_context: str
+    options: dict
+    status: str = "queued"          # queued, running, done, failed
+    created: str = field(default_factory=lambda: datetime.now().isoformat())
+    events: list[dict] = field(default_factory=list)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    subscribers: list[asyncio.Queue] = field(default_factory=list, repr=False)
+
+    def publish(self, event: dict):
+        """Bewaar een event en stuur het door naar alle open event-streams."""
+        self.events.append(event)
+        for queue in self.subscribers:
+            queue.put_nowait(event)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "scripture_text": self.scripture_text,
+            "options": self.options,
+            "events": len(self.events),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class GeneratorService:
+    """Gedeelde toestand van de server: corpus, jobs en de werkers die ze uitvoeren."""
+
+    def __init__(self, max_concurrent_jobs: int = SERVER_MAX_CONCURRENT_JOBS):
+        self.reference_sermons = [sermon["tekst"] for sermon in load_corpus().records()]
+        self.jobs: dict[str, Job] = {}
+        self.queue: asyncio.Queue[Job] = asyncio.Queue()
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self._ids = itertools.count(1)
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrent_jobs)]
+
+    def submit(self, payload: dict) -> Job:
+        scripture_text = payload.get("scripture_text")
+        scripture_context = payload.get("scripture_context", "")
+        if not isinstance(scripture_text, str) or not scripture_text.strip():
+            raise HTTPError(422, "scripture_text is verplicht")
+        if not isinstance(scripture_context, str):
+            raise HTTPError(422, "scripture_context moet tekst zijn")
+
+        try:
+            options = parse_job_options({name: payload[name] for name in JOB_OPTIONS if name in payload})
+        except ValueError as e:
+            raise HTTPError(422, str(e))
+
+        job_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_job{next(self._ids)}"
+        job = Job(job_id, scripture_text.strip(), scripture_context.strip(), options)
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        job.publish({"event": "queued", "position": self.queue.qsize()})
+        return job
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.publish({"event": "running"})
+        try:
+            result = await generate_with_iteration(
+                scripture_text=job.scripture_text,
+                scripture_context=job.scripture_context,
+                reference_sermons=self.reference_sermons,
+                max_iterations=job.options.get("max_iterations", MAX_ITERATIONS),
+                target_score=job.options.get("target_score", 0.85),
+                candidates_per_iteration=job.options.get("candidates_per_iteration", 1),
+                verbose=False,
+                run_id=job.id,
+                on_progress=job.publish,
+            )
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            job.publish({"event": "failed", "error": job.error})
+            print(f"Job {job.id} mislukt: {job.error}")
+            return
+
+        job.result = {
+            "text": result.text,
+            "score": asdict(result.score),
+            "iteration": result.iteration,
+            "prompt_version": result.prompt_version,
+            "input_tokens": result.input_tokens,
+            "output_tokens": result.output_tokens,
+        }
+        job.status = "done"
+        job.publish({"event": "finished"})
+
+    def get_job(self, job_id: str) -> Job:
+        if job_id not in self.jobs:
+            raise HTTPError(404, f"Onbekende job: {job_id}")
+        return self.jobs[job_id]
+
+    async def score(self, payload: dict) -> dict:
+        sermon = payload.get("sermon")
+        scripture_text = payload.get("scripture_text", "")
+        if not isinstance(sermon, str) or not sermon.strip():
+            raise HTTPError(422, "sermon is verplicht")
+        try:
+            score = await compute_full_score(sermon, scripture_text, self.reference_sermons)
+        except ScoringError as e:
+            raise HTTPError(500, f"Scoring mislukt: {e}")
+        return asdict(score)
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict, bytes]:
+    """Lees één HTTP/1.1-request. Returns: (methode, pad, headers, body)"""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("Lege request")
+    try:
+        method, target, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Ongeldige request-regel")
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise HTTPError(400, "Ongeldige Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Ongeldige Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "Request te groot")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+async def write_json(writer: asyncio.StreamWriter, status: int, data):
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+
+async def stream_events(writer: asyncio.StreamWriter, job: Job):
+    """
+    Stuur de events van een job als server-sent events: eerst de al
+    opgetreden events, daarna live tot een van de TERMINAL_EVENTS.
+    """
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream; charset=utf-8\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    # Geen await tussen het naspelen en het aanmelden: er kan geen event tussendoor glippen
+    queue: asyncio.Queue = asyncio.Queue()
+    backlog = list(job.events)
+    job.subscribers.append(queue)
+    try:
+        for event in backlog:
+            writer.write(format_event(event))
+        await writer.drain()
+        if backlog and backlog[-1]["event"] in TERMINAL_EVENTS:
+            return
+        while True:
+            event = await queue.get()
+            writer.write(format_event(event))
+            await writer.drain()
+            if event["event"] in TERMINAL_EVENTS:
+                break
+    finally:
+        job.subscribers.remove(queue)
+
+
+def format_event(event: dict) -> bytes:
+    data = json.dumps(event, ensure_ascii=False)
+    return f"event: {event['event']}\ndata: {data}\n\n".encode("utf-8")
+
+
+async def handle_request(service: GeneratorService, method: str, path: str, body: bytes, writer):
+    """Routeer een request naar het juiste endpoint."""
+    parts = [part for part in path.split("/") if part]
+
+    def payload() -> dict:
+        try:
+            data = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise HTTPError(400, "Body is geen geldige JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Body moet een JSON-object zijn")
+        return data
+
+    # Eerst het endpoint, dan de methode: een bekend pad met een andere methode geeft 405
+    if parts == ["jobs"]:
+        if method == "POST":
+            job = service.submit(payload())
+            return await write_json(writer, 202, job.summary())
+        if method == "GET":
+            return await write_json(writer, 200, [job.summary() for job in service.jobs.values()])
+    elif len(parts) == 2 and parts[0] == "jobs":
+        if method == "GET":
+            return await write_json(writer, 200, service.get_job(parts[1]).summary())
+    elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+        if method == "GET":
+            return await stream_events(writer, service.get_job(parts[1]))
+    elif parts == ["score"]:
+        if method == "POST":
+            return await write_json(writer, 200, await service.score(payload()))
+    elif parts == ["prompts", "stats"]:
+        if method == "GET":
+            return await write_json(writer, 200, get_prompt_stats())
+    else:
+        raise HTTPError(404, f"Onbekend endpoint: {path}")
+    raise HTTPError(405, f"{method} niet toegestaan op {path}")
+
+
+async def serve(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    service = GeneratorService()
+    service.start()
+
+    async def on_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, _, body = await read_request(reader)
+            await handle_request(service, method, path, body, writer)
+        except HTTPError as e:
+            await write_json(writer, e.status, {"error": str(e)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Fout bij request: {type(e).__name__}: {e}")
+            await write_json(writer, 500, {"error": "Interne fout"})
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(on_connection, host, port)
+    print(f"Preek-generator service op http://{host}:{port} "
+          f"({len(service.reference_sermons)} referentiepreken, {service.max_concurrent_jobs} jobs tegelijk)")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokale HTTP-service voor de preek-generator")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+"""
+Build-stap voor de preek-lezer in docs/ (GitHub Pages).
+Schrijft docs/manifest.json met per preek titel, schriftgedeelte, lengte, eerste
+regel en content-hash, zodat de lijst met één kleine request gevuld wordt; de
+preek zelf wordt pas bij het openen opgehaald. Daarnaast docs/search_index.json:
+een voorberekende inverted index (woord -> preken) die de pagina pas bij de eerste
+zoekopdracht laadt.
+
+Alleen preken waarvan de content-hash veranderd is worden opnieuw verwerkt
+(woordenlijsten per hash in cache/site_terms.json), en een uitvoerbestand wordt
+alleen herschreven als de inhoud verandert.
+
+Gebruik:
+    python site_build.py            # Na het toevoegen of wijzigen van een preek in docs/
+    python site_build.py --check    # Exit-code 1 als de manifest niet actueel is
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+from pathlib import Path
+
+from corpus import normalize_text
+
+BASE_DIR = Path(__file__).parent
+DOCS_DIR = BASE_DIR / "docs"
+MANIFEST_FILE = DOCS_DIR / "manifest.json"
+SEARCH_INDEX_FILE = DOCS_DIR / "search_index.json"
+TERMS_CACHE_FILE = BASE_DIR / "cache" / "site_terms.json"
+
+SITE_SOURCES = "*_nl.json"
+
+# Woorden korter dan dit komen niet in de zoekindex (lidwoorden, voorzetsels)
+MIN_TERM_LENGTH = 3
+FIRST_LINE_CHARS = 160
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def sermon_group(file_name: str) -> str:
+    """Indeling van de zijbalk: mogelijke (gegenereerde) of daadwerkelijke preken."""
+    return "mogelijk" if file_name.startswith("mogelijk_") else "daadwerkelijk"
+
+
+def first_line(text: str) -> str:
+    """Eerste niet-lege regel, ingekort op een woordgrens."""
+    line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+    if len(line) <= FIRST_LINE_CHARS:
+        return line
+    return line[:FIRST_LINE_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+def sermon_terms(text: str) -> list[str]:
+    """Unieke zoektermen van een preek (kleine letters, gesorteerd)."""
+    return sorted({word for word in WORD_PATTERN.findall(text.lower()) if len(word) >= MIN_TERM_LENGTH})
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    """Schrijf alleen bij gewijzigde inhoud (houdt mtime en git-status rustig)."""
+    if path.exists() and path.read_bytes() == data:
+        return False
+    tmp_file = path.with_suffix(".tmp")
+    tmp_file.write_bytes(data)
+    os.replace(tmp_file, path)
+    return True
+
+
+def compact_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_site(write: bool = True, verbose: bool = False) -> dict:
+    """
+    Bouw manifest en zoekindex.
+    Returns: {"processed": n, "reused": n, "changed": [bestanden]}; met write=False
+    wordt niets geschreven en geeft "changed" aan wat verouderd is.
+    """
+    old_entries = {}
+    if MANIFEST_FILE.exists():
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            old_entries = {entry["file"]: entry for entry in json.load(f)["sermons"]}
+    terms_cache = {}
+    if TERMS_CACHE_FILE.exists():
+        with open(TERMS_CACHE_FILE, "r", encoding="utf-8") as f:
+            terms_cache = json.load(f)
+
+    entries = []
+    doc_terms = []
+    processed = 0
+    for path in sorted(DOCS_DIR.glob(SITE_SOURCES)):
+        raw = path.read_bytes()
+        digest = content_hash(raw)
+        old = old_entries.get(path.name)
+        if old and old["hash"] == digest and digest in terms_cache:
+            entries.append(old)
+            doc_terms.append(terms_cache[digest])
+            continue
+
+        sermon = json.loads(raw)
+        text = normalize_text(sermon["tekst"])
+        entries.append({
+            "file": path.name,
+            "id": sermon.get("id", path.stem),
+            "title": sermon.get("schriftgedeelte", path.stem),
+            "group": sermon_group(path.name),
+            "chars": len(text),
+            "words": len(WORD_PATTERN.findall(text)),
+            "first_line": first_line(text),
+            "hash": digest,
+        })
+        terms_cache[digest] = sermon_terms(sermon.get("schriftgedeelte", "") + "\n" + text)
+        doc_terms.append(terms_cache[digest])
+        processed += 1
+
+    # Inverted index: term -> indices in manifest["sermons"]
+    postings: dict[str, list[int]] = {}
+    for index, terms in enumerate(doc_terms):
+        for term in terms:
+            postings.setdefault(term, []).append(index)
+    search_index = compact_json({"terms": dict(sorted(postings.items()))})
+
+    manifest = compact_json({
+        "version": content_hash("".join(entry["hash"] for entry in entries).encode("utf-8")),
+        # Versie in de URL: browsers halen de index opnieuw op zodra hij verandert
+        "search_index": f"{SEARCH_INDEX_FILE.name}?v={content_hash(search_index)}",
+        "sermons": entries,
+    })
+
+    changed = [
+        path.name for path, data in ((MANIFEST_FILE, manifest), (SEARCH_INDEX_FILE, search_index))
+        if not path.exists() or path.read_bytes() != data
+    ]
+    if write:
+        for path, data in ((MANIFEST_FILE, manifest), (SEARCH_INDEX_FILE, search_index)):
+            write_if_changed(path, data)
+        # Alleen hashes van bestaande preken bewaren
+        live = {entry["hash"] for entry in entries}
+        os.makedirs(TERMS_CACHE_FILE.parent, exist_ok=True)
+        write_if_changed(TERMS_CACHE_FILE, compact_json({h: t for h, t in terms_cache.items() if h in live}))
+
+    if verbose:
+        print(f"{len(entries)} preken: {processed} verwerkt, {len(entries) - processed} ongewijzigd")
+        print(f"  {MANIFEST_FILE.name}: {len(manifest):,} bytes; "
+              f"{SEARCH_INDEX_FILE.name}: {len(search_index):,} bytes, {len(postings):,} termen")
+        print(f"  {'Bijgewerkt' if write else 'Verouderd'}: {', '.join(changed) if changed else 'niets'}")
+    return {"processed": processed, "reused": len(entries) - processed, "changed": changed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bouw manifest en zoekindex voor docs/")
+    parser.add_argument("--check", action="store_true", help="Controleer alleen of de bestanden actueel zijn")
+    args = parser.parse_args()
+
+    result = build_site(write=not args.check, verbose=True)
+    if args.check and result["changed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 """
 Stilometrische analyse en scoring voor Jüngel-preken.
 """
+import glob
+import json
+import math
 import re
 import statistics
 from collections import Counter
+from pathlib import Path
 from typing import TypedDict
 
 from config import STYLOMETRIC_TARGETS, THEOLOGICAL_WORD_TARGETS
@@ -55,6 +59,147 @@ def analyze_sermon(text: str) -> tuple[StylometricMetrics, list[str]]:
     return metrics, words
 
 
+HEADER_PREFIX = "NBV21["
+WORD_PATTERN = re.compile(r'\b\w+\b')
+SENTENCE_END_PATTERN = re.compile(r'[.!?]')
+
+
+class IncrementalStylometrics:
+    """
+    Online variant van analyze_sermon voor tekst die in stukken binnenkomt
+    (bijv. een gestreamde generatie).
+    Elke afgeronde zin wordt één keer verwerkt: zinslengte via Welford
+    (lopend gemiddelde en variantie), woorden in een Counter. metrics()
+    geeft op elk moment hetzelfde resultaat als analyze_sermon op de tekst
+    tot nu toe; de nog niet afgeronde laatste zin telt daarbij mee.
+    """
+
+    def __init__(self):
+        self._head: str | None = ""  # Begin van de tekst zolang onduidelijk is of er een NBV21-header staat
+        self._started = False        # Voorloop-witruimte is overgeslagen
+        self._tail = ""              # Tekst sinds het laatste zinseinde-teken
+        self._char_count = 0
+        self._trailing_whitespace = 0
+        self._punctuation = Counter()
+
+        # Welford-toestand over de zinslengtes (in woorden)
+        self._sentence_count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+        self._words: list[str] = []
+        self._word_counts: Counter = Counter()
+
+    def feed(self, chunk: str) -> int:
+        """
+        Verwerk een nieuw stuk tekst.
+        Returns: het aantal zinnen dat hierdoor is afgerond.
+        """
+        if self._head is not None:
+            # Een header wordt alleen aan het begin verwijderd, tot en met de eerste ']'
+            self._head += chunk
+            if len(self._head) < len(HEADER_PREFIX) and HEADER_PREFIX.startswith(self._head):
+                return 0
+            if self._head.startswith(HEADER_PREFIX):
+                end = self._head.find("]")
+                if end < 0:
+                    return 0
+                chunk = self._head[end + 1:]
+            else:
+                chunk = self._head
+            self._head = None
+
+        if not self._started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return 0
+            self._started = True
+
+        self._char_count += len(chunk)
+        stripped = chunk.rstrip()
+        if stripped:
+            self._trailing_whitespace = len(chunk) - len(stripped)
+        else:
+            self._trailing_whitespace += len(chunk)
+        for mark in "?!,:":
+            self._punctuation[mark] += chunk.count(mark)
+
+        # Alles vóór het laatste zinseinde-teken is afgerond
+        segments = SENTENCE_END_PATTERN.split(self._tail + chunk)
+        self._tail = segments.pop()
+        completed = 0
+        for segment in segments:
+            words = WORD_PATTERN.findall(segment.lower())
+            self._words.extend(words)
+            self._word_counts.update(words)
+            segment = segment.strip()
+            if len(segment) > 5:
+                self._sentence_count, self._mean, self._m2 = _welford(
+                    self._sentence_count, self._mean, self._m2, len(segment.split())
+                )
+                completed += 1
+        return completed
+
+    @property
+    def words(self) -> list[str]:
+        """Alle woorden tot nu toe (kleine letters), als in analyze_sermon."""
+        if self._head is not None:
+            return analyze_sermon(self._head)[1]
+        return self._words + WORD_PATTERN.findall(self._tail.lower())
+
+    def metrics(self) -> StylometricMetrics:
+        """Stilometrische kenmerken van de tekst tot nu toe (O(1) buiten de lopende zin)."""
+        if self._head is not None:
+            return analyze_sermon(self._head)[0]
+
+        n, mean, m2 = self._sentence_count, self._mean, self._m2
+        tail = self._tail.strip()
+        if len(tail) > 5:
+            n, mean, m2 = _welford(n, mean, m2, len(tail.split()))
+
+        tail_words = WORD_PATTERN.findall(self._tail.lower())
+        word_count = len(self._words) + len(tail_words)
+        unique_words = len(self._word_counts) + len(
+            {w for w in tail_words if w not in self._word_counts}
+        )
+        question_count = self._punctuation["?"]
+
+        return {
+            'char_count': self._char_count - self._trailing_whitespace,
+            'word_count': word_count,
+            'sentence_count': n,
+            'avg_sentence_length': mean if n else 0,
+            'sentence_length_std': math.sqrt(m2 / (n - 1)) if n > 1 else 0,
+            'question_count': question_count,
+            'question_ratio': question_count / n if n else 0,
+            'exclamation_count': self._punctuation["!"],
+            'unique_words': unique_words,
+            'lexical_diversity': unique_words / word_count if word_count else 0,
+            'comma_per_sentence': self._punctuation[","] / n if n else 0,
+            'colon_count': self._punctuation[":"],
+        }
+
+    def theological_frequencies(self) -> dict[str, float]:
+        """Als compute_theological_word_frequencies, zonder de woordenlijst opnieuw te tellen."""
+        tail_counts = Counter(WORD_PATTERN.findall(self._tail.lower()))
+        total = len(self._words) + sum(tail_counts.values())
+        if total == 0:
+            return {w: 0.0 for w in THEOLOGICAL_WORD_TARGETS}
+        return {
+            word: ((self._word_counts[word] + tail_counts[word]) / total) * 1000
+            for word in THEOLOGICAL_WORD_TARGETS
+        }
+
+
+def _welford(n: int, mean: float, m2: float, value: float) -> tuple[int, float, float]:
+    """Eén Welford-stap: voeg `value` toe aan (aantal, gemiddelde, som kwadratische afwijkingen)."""
+    n += 1
+    delta = value - mean
+    mean += delta / n
+    m2 += delta * (value - mean)
+    return n, mean, m2
+
+
 def compute_theological_word_frequencies(words: list[str]) -> dict[str, float]:
     """Bereken frequenties van theologische kernwoorden per 1000 woorden."""
     word_freq = Counter(words)
@@ -199,3 +344,46 @@ def generate_stylometric_feedback(metrics: StylometricMetrics, words: list[str])
         return "Stilometrisch gezien ligt de preek dicht bij Jüngels stijl."
 
     return "\n".join(feedback_parts)
+
+
+def check_incremental_equivalence(texts: list[str], chunk_size: int = 37, every: int = 25) -> list[str]:
+    """
+    Vergelijk IncrementalStylometrics met analyze_sermon: na elke `every`
+    stukken van `chunk_size` tekens en aan het eind van elke tekst.
+    Returns: beschrijvingen van de gevonden afwijkingen (leeg = gelijk).
+    """
+    mismatches = []
+    for t, text in enumerate(texts):
+        analyzer = IncrementalStylometrics()
+        for k, start in enumerate(range(0, len(text), chunk_size)):
+            analyzer.feed(text[start:start + chunk_size])
+            is_last = start + chunk_size >= len(text)
+            if not is_last and k % every:
+                continue
+
+            expected, expected_words = analyze_sermon(text[:start + chunk_size])
+            actual = analyzer.metrics()
+            for name, value in expected.items():
+                if not math.isclose(value, actual[name], rel_tol=1e-9, abs_tol=1e-9):
+                    mismatches.append(f"tekst {t}, {start + chunk_size} tekens: {name} {actual[name]} != {value}")
+            if analyzer.words != expected_words:
+                mismatches.append(f"tekst {t}, {start + chunk_size} tekens: woordenlijst wijkt af")
+            if analyzer.theological_frequencies() != compute_theological_word_frequencies(expected_words):
+                mismatches.append(f"tekst {t}, {start + chunk_size} tekens: kernwoordfrequenties wijken af")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Controle van de online analyse tegen de batch-versie op het corpus in docs/
+    corpus = []
+    for file_path in sorted(glob.glob(str(Path(__file__).parent / "docs" / "*_nl.json"))):
+        with open(file_path, "r", encoding="utf-8") as f:
+            corpus.append(json.load(f)["tekst"])
+
+    problems = []
+    for chunk_size in (1, 7, 37, 500):
+        problems += check_incremental_equivalence(corpus, chunk_size=chunk_size, every=max(1, 2000 // chunk_size))
+    print(f"{len(corpus)} preken gecontroleerd: "
+          f"{'identiek aan analyze_sermon' if not problems else f'{len(problems)} afwijkingen'}")
+    for problem in problems[:20]:
+        print(f"  {problem}")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+"""
+Lokaal surrogaat-model voor de LLM-judge.
+Leert uit de historische iteratie-bestanden (preek + judge-scores) een
+lichtgewicht ridge-regressie per score-dimensie, zodat kandidaten lokaal
+voorgerangschikt kunnen worden voordat ze naar de betaalde judge gaan.
+
+Gebruik:
+    python surrogate.py train [--holdout 0.2]
+    python surrogate.py predict preek.txt
+"""
+import argparse
+import json
+import random
+import re
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from config import SURROGATE_RIDGE_ALPHA, THEOLOGICAL_WORD_TARGETS
+from stylometrics import analyze_sermon
+
+ITERATIONS_DIR = Path(__file__).parent / "output" / "iterations"
+MODELS_DIR = Path(__file__).parent / "models"
+SURROGATE_MODEL_FILE = MODELS_DIR / "surrogate.npz"
+
+# Score-dimensies die het surrogaat voorspelt (zoals in iter_NN_scores.json)
+SURROGATE_TARGETS = [
+    "overall_score",
+    "theological_score",
+    "metaphorical_score",
+    "transformation_score",
+    "rhetorical_score",
+    "coherence_score",
+    "language_score",
+    "flow_score",
+    "humor_score",
+    "sdt_score",
+]
+
+STYLOMETRIC_FEATURES = [
+    "char_count",
+    "word_count",
+    "sentence_count",
+    "avg_sentence_length",
+    "sentence_length_std",
+    "question_ratio",
+    "exclamation_count",
+    "lexical_diversity",
+    "comma_per_sentence",
+    "colon_count",
+]
+
+# Nederlandse functiewoorden: stijlsignaal dat los staat van het onderwerp
+FUNCTION_WORDS = [
+    "de", "het", "een", "en", "van", "in", "is", "dat", "op", "te",
+    "die", "niet", "met", "voor", "zijn", "er", "maar", "om", "aan", "ook",
+    "als", "dan", "of", "wat", "zo", "nog", "wel", "naar", "bij", "door",
+    "uit", "over", "tot", "want", "toch", "hij", "wij", "u", "ons", "zich",
+    "hem", "wie", "nu", "geen", "al", "ja", "zelfs", "immers",
+]
+
+CHAR_NGRAM_SIZE = 3
+CHAR_NGRAM_BUCKETS = 256
+
+# Scheidingslijn tussen de score-header en de preektekst in iter_NN_sermon.txt
+SERMON_HEADER_SEPARATOR = "=" * 60
+
+
+def extract_features(text: str) -> np.ndarray:
+    """
+    Zet een preek om in een goedkope feature-vector:
+    stilometrie, theologische kernwoorden, functiewoorden en gehashte karakter-n-grammen.
+    """
+    metrics, words = analyze_sermon(text)
+    total_words = max(1, len(words))
+
+    counts: dict[str, int] = {}
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+
+    stylometric = [float(metrics[name]) for name in STYLOMETRIC_FEATURES]
+    theological = [counts.get(w, 0) / total_words * 1000 for w in THEOLOGICAL_WORD_TARGETS]
+    function_words = [counts.get(w, 0) / total_words * 1000 for w in FUNCTION_WORDS]
+
+    # zlib.crc32 in plaats van hash(): stabiel tussen processen, dus opslagbaar
+    ngrams = np.zeros(CHAR_NGRAM_BUCKETS)
+    lowered = re.sub(r"\s+", " ", text.lower())
+    for i in range(len(lowered) - CHAR_NGRAM_SIZE + 1):
+        bucket = zlib.crc32(lowered[i:i + CHAR_NGRAM_SIZE].encode("utf-8")) % CHAR_NGRAM_BUCKETS
+        ngrams[bucket] += 1
+    ngrams /= max(1.0, ngrams.sum())
+
+    return np.concatenate([stylometric, theological, function_words, ngrams])
+
+
+def strip_sermon_header(content: str) -> str:
+    """Verwijder de score-header die save_iteration boven de preek schrijft."""
+    if SERMON_HEADER_SEPARATOR in content:
+        return content.split(SERMON_HEADER_SEPARATOR, 1)[1].strip()
+    return content
+
+
+def load_labeled_sermons(iterations_dir: Path = ITERATIONS_DIR) -> list[tuple[str, str, dict]]:
+    """
+    Verzamel (run_id, preektekst, scores) paren uit alle opgeslagen iteraties.
+    """
+    samples = []
+    for scores_file in sorted(iterations_dir.glob("*/iter_*_scores.json")):
+        sermon_file = scores_file.with_name(scores_file.name.replace("_scores.json", "_sermon.txt"))
+        if not sermon_file.exists():
+            continue
+        with open(scores_file, "r", encoding="utf-8") as f:
+            scores = json.load(f)
+        if scores.get("inherited"):
+            # Overgenomen score van een bijna-identieke kandidaat: geen eigen judge-oordeel
+            continue
+        if scores.get("received_fields") is not None:
+            # Afgebroken judge-call: alleen de SDT-score is echt beoordeeld
+            scores = {"sdt_score": scores["sdt_score"]}
+        with open(sermon_file, "r", encoding="utf-8") as f:
+            text = strip_sermon_header(f.read())
+        samples.append((scores_file.parent.name, text, scores))
+    return samples
+
+
+def fit_ridge(X: np.ndarray, y: np.ndarray, alpha: float) -> tuple[np.ndarray, float]:
+    """
+    Ridge-regressie in gesloten vorm op gestandaardiseerde features.
+    Returns: (gewichten, intercept)
+    """
+    y_mean = y.mean()
+    A = X.T @ X + alpha * np.eye(X.shape[1])
+    weights = np.linalg.solve(A, X.T @ (y - y_mean))
+    return weights, y_mean
+
+
+def pearson(a: np.ndarray, b: np.ndarray) -> float:
+    """Pearson-correlatie; NaN als een van beide constant is."""
+    if len(a) < 2 or a.std() == 0 or b.std() == 0:
+        return float("nan")
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+class SurrogateModel:
+    """Ridge-regressie per score-dimensie op extract_features()."""
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, weights: np.ndarray,
+                 intercepts: np.ndarray, targets: list[str]):
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights          # (n_features, n_targets)
+        self.intercepts = intercepts    # (n_targets,)
+        self.targets = targets
+
+    def predict_features(self, features: np.ndarray) -> np.ndarray:
+        """Voorspel alle dimensies voor een (n, n_features) feature-matrix."""
+        X = (np.atleast_2d(features) - self.mean) / self.scale
+        return X @ self.weights + self.intercepts
+
+    def predict(self, text: str) -> dict[str, float]:
+        """Voorspel de judge-scores voor een preek."""
+        prediction = self.predict_features(extract_features(text))[0]
+        return {target: float(value) for target, value in zip(self.targets, prediction)}
+
+    def save(self, path: Path = SURROGATE_MODEL_FILE):
+        """Sla het model op als .npz."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            mean=self.mean,
+            scale=self.scale,
+            weights=self.weights,
+            intercepts=self.intercepts,
+            targets=np.array(self.targets),
+        )
+
+    @classmethod
+    def load(cls, path: Path = SURROGATE_MODEL_FILE) -> "SurrogateModel":
+        """Laad een eerder getraind model."""
+        data = np.load(path)
+        return cls(
+            mean=data["mean"],
+            scale=data["scale"],
+            weights=data["weights"],
+            intercepts=data["intercepts"],
+            targets=[str(t) for t in data["targets"]],
+        )
+
+
+def train_surrogate(
+    samples: list[tuple[str, str, dict]],
+    holdout: float = 0.2,
+    alpha: float = SURROGATE_RIDGE_ALPHA,
+    seed: int = 0,
+) -> tuple[SurrogateModel, dict[str, float]]:
+    """
+    Train het surrogaat en rapporteer de held-out correlatie per dimensie.
+    De split gebeurt per run, zodat iteraties van dezelfde run niet in
+    zowel train- als testset belanden.
+    Het teruggegeven model is daarna op alle data getraind.
+    Returns: (model, {dimensie: pearson r op de held-out runs})
+    """
+    features = np.array([extract_features(text) for _, text, _ in samples])
+    labels = np.array([
+        [scores[t] if scores.get(t) is not None else np.nan for t in SURROGATE_TARGETS]
+        for _, _, scores in samples
+    ], dtype=float)
+
+    run_ids = sorted({run_id for run_id, _, _ in samples})
+    random.Random(seed).shuffle(run_ids)
+    test_runs = set(run_ids[:max(1, round(len(run_ids) * holdout))]) if len(run_ids) > 1 else set()
+    test_mask = np.array([run_id in test_runs for run_id, _, _ in samples])
+
+    correlations = {}
+    if test_mask.any():
+        train_model = _fit(features[~test_mask], labels[~test_mask], alpha)
+        predictions = train_model.predict_features(features[test_mask])
+        for j, target in enumerate(train_model.targets):
+            k = SURROGATE_TARGETS.index(target)
+            known = ~np.isnan(labels[test_mask][:, k])
+            correlations[target] = pearson(predictions[known, j], labels[test_mask][known, k])
+
+    return _fit(features, labels, alpha), correlations
+
+
+def _fit(features: np.ndarray, labels: np.ndarray, alpha: float) -> SurrogateModel:
+    """
+    Standaardiseer features en fit per dimensie een ridge-regressie.
+    Met één label voorspelt een dimensie dat label (geen gewichten); dimensies
+    zonder labels komen niet in het model.
+    """
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1.0
+    X = (features - mean) / scale
+
+    targets = [target for k, target in enumerate(SURROGATE_TARGETS) if (~np.isnan(labels[:, k])).any()]
+    weights = np.zeros((X.shape[1], len(targets)))
+    intercepts = np.zeros(len(targets))
+    for j, target in enumerate(targets):
+        k = SURROGATE_TARGETS.index(target)
+        known = ~np.isnan(labels[:, k])
+        if known.sum() < 2:
+            intercepts[j] = labels[known, k].mean()
+            continue
+        weights[:, j], intercepts[j] = fit_ridge(X[known], labels[known, k], alpha)
+
+    return SurrogateModel(mean, scale, weights, intercepts, targets)
+
+
+def load_surrogate(path: Path = SURROGATE_MODEL_FILE) -> Optional[SurrogateModel]:
+    """Laad het surrogaat indien er een getraind model is."""
+    if not path.exists():
+        return None
+    return SurrogateModel.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lokaal surrogaat-model voor de judge")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = subparsers.add_parser("train", help="Train op output/iterations")
+    train_parser.add_argument("--holdout", type=float, default=0.2, help="Fractie runs voor de testset")
+    train_parser.add_argument("--alpha", type=float, default=SURROGATE_RIDGE_ALPHA)
+
+    predict_parser = subparsers.add_parser("predict", help="Voorspel scores voor een preek")
+    predict_parser.add_argument("path", type=Path)
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        samples = load_labeled_sermons()
+        if len(samples) < 4:
+            print(f"Te weinig gelabelde preken ({len(samples)}) om te trainen.")
+            return
+        model, correlations = train_surrogate(samples, holdout=args.holdout, alpha=args.alpha)
+        model.save()
+        print(f"Getraind op {len(samples)} preken; opgeslagen in {SURROGATE_MODEL_FILE}")
+        print("\nHeld-out correlatie (pearson r):")
+        for target, r in correlations.items():
+            print(f"  {target:<22} {r:+.2f}")
+
+    elif args.command == "predict":
+        model = load_surrogate()
+        if model is None:
+            print("Geen getraind model. Draai eerst: python surrogate.py train")
+            return
+        with open(args.path, "r", encoding="utf-8") as f:
+            text = strip_sermon_header(f.read())
+        for target, value in model.predict(text).items():
+            print(f"{target:<22} {value:.2f}")
+
+
+if __name__ == "__main__":
+    main()